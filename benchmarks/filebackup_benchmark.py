@@ -0,0 +1,153 @@
+"""Wall-time, SFTP-round-trips and throughput of FileBackupUnit.run against a local stand-in server
+
+A synthetic tree with many small files, a few huge files and deep nesting is served by
+benchmarks.sftp_server with the given latency and bandwidth. Every scenario backs it up into an
+empty folder ("full") and once more into the same folder, where nothing has changed ("noop").
+
+Run from the repository root:
+	python -m benchmarks.filebackup_benchmark [--latency 20] [--bandwidth 10] [--scenario tarstream]
+"""
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Tuple
+import click
+from benchmarks.sftp_server import BenchmarkServer
+from modules.FileBackupUnit import FileBackupUnit
+
+
+SCENARIOS = {
+	"walk": ({"max_workers": 1}, {}),
+	"walk-parallel": ({"max_workers": 4}, {}),
+	"remote-scan": ({"max_workers": 4, "remote_scan": True}, {}),
+	"tarstream": ({}, {"transfer_mode": "tarstream"}),
+	"manifest": ({"max_workers": 4, "remote_scan": True, "manifest": True}, {}),
+	"dircache": ({"max_workers": 4, "manifest": True, "dircache": True}, {})
+}
+
+
+def synthetic_tree(root: Path, small_files: int, huge_files: int, huge_size: int, depth: int, fanout: int=4):
+	"""Spreads the small files (100B to 8KB) over a tree of the given depth, the huge files go to its root"""
+	rnd = random.Random(0)
+
+	folders = [root]
+	level = [root]
+	for _ in range(depth):
+		level = [parent / "d{}".format(i) for parent in level for i in range(fanout)][:max(fanout, small_files // 10)]
+		folders.extend(level)
+
+	for folder in folders:
+		folder.mkdir(parents=True, exist_ok=True)
+
+	for i in range(small_files):
+		with open(str(folders[i % len(folders)] / "file{}.cfg".format(i)), "wb") as f:
+			f.write(rnd.getrandbits(8 * 64).to_bytes(64, "little") * rnd.randint(2, 128))
+
+	for i in range(huge_files):
+		with open(str(root / "huge{}.bin".format(i)), "wb") as f:
+			for _ in range(huge_size // (1024 * 1024)):
+				f.write(os.urandom(1024 * 1024))
+
+
+def run_unit(port: int, tree: Path, target: Path, unit_options: Dict, entry_options: Dict) -> Tuple[float, int, int]:
+	"""
+	:return: Wall-time, transferred files and bytes
+	"""
+	options = {
+		"name": "benchmark",
+		"host": "127.0.0.1:{}".format(port),
+		"user": "benchmark",
+		"password": "benchmark",
+		"targetdir": str(target),
+		"copystats": True,
+		"processonly_types": "all"
+	}
+	options.update(unit_options)
+
+	entry = {"recurse": True, "overwrite_newer": True}
+	entry.update(entry_options)
+
+	config = {"options": options, "pathes": [{"name": "Tree", "type": "dir", "path": str(tree), "options": entry}]}
+
+	unit = FileBackupUnit(io.StringIO(json.dumps(config)), False, None, None, [])
+
+	start = perf_counter()
+	errcode = unit.run()
+	seconds = perf_counter() - start
+
+	if errcode is not None and errcode != 0:
+		raise click.ClickException("FileBackupUnit.run failed with errcode {}".format(errcode))
+
+	results = unit.get_results()
+	return seconds, sum(r.get_files() for r in results), sum(r.get_bytes() for r in results)
+
+
+def format_requests(requests: Dict[str, int]) -> str:
+	ordered = sorted(requests.items(), key=lambda item: -item[1])
+	return ", ".join("{} {}".format(name, count) for name, count in ordered)
+
+
+@click.command()
+@click.option("--latency", type=float, default=0, help="Round-trip time in milliseconds")
+@click.option("--bandwidth", type=float, default=0, help="MB/s in each direction, 0 is unlimited")
+@click.option("--small-files", type=int, default=2000, help="Number of small files")
+@click.option("--huge-files", type=int, default=2, help="Number of huge files")
+@click.option("--huge-size", type=int, default=32, help="Size of a huge file in MB")
+@click.option("--depth", type=int, default=6, help="Nesting depth of the folders")
+@click.option("--tree", type=click.Path(file_okay=False), default=None, help="Reuse or keep the synthetic tree here")
+@click.option(
+	"--scenario", "scenarios", type=click.Choice(list(SCENARIOS.keys())), multiple=True,
+	help="Scenarios to run, all by default"
+)
+def benchmark(latency, bandwidth, small_files, huge_files, huge_size, depth, tree, scenarios):
+	# The server-transports log the resets of closed client-connections
+	logging.getLogger("paramiko").addHandler(logging.NullHandler())
+
+	workdir = Path(tempfile.mkdtemp(prefix="backthefooup-benchmark-"))
+
+	try:
+		treedir = Path(tree) if tree is not None else workdir / "tree"
+		if not treedir.exists() or not any(treedir.iterdir()):
+			print("Generating {} small and {} huge files in {} levels".format(small_files, huge_files, depth))
+			synthetic_tree(treedir, small_files, huge_files, huge_size * 1024 * 1024, depth)
+
+		server = BenchmarkServer(latency / 1000, int(bandwidth * 1024 * 1024))
+		port = server.start()
+
+		print("Latency {:.0f}ms, bandwidth {}".format(
+			latency, "unlimited" if bandwidth <= 0 else "{:.1f}MB/s".format(bandwidth)
+		))
+		print("{:<16}{:<6}{:>9}{:>8}{:>10}{:>10}  by type".format("scenario", "run", "seconds", "files", "MB/s", "requests"))
+
+		for name in scenarios if len(scenarios) > 0 else SCENARIOS.keys():
+			unit_options, entry_options = SCENARIOS[name]
+			target = workdir / "target-{}".format(name)
+
+			for run in ("full", "noop"):
+				server.reset_requests()
+				seconds, files, transferred = run_unit(port, treedir, target, unit_options, entry_options)
+				requests = server.get_requests()
+
+				print("{:<16}{:<6}{:>9.2f}{:>8}{:>10.2f}{:>10}  {}".format(
+					name, run, seconds, files,
+					transferred / seconds / 1024 / 1024 if seconds > 0 else 0,
+					sum(requests.values()),
+					format_requests(requests)
+				))
+
+			shutil.rmtree(str(target))
+
+		server.stop()
+	finally:
+		# A tree passed with --tree lives outside of workdir and is kept
+		shutil.rmtree(str(workdir), ignore_errors=True)
+
+
+if __name__ == "__main__":
+	benchmark()
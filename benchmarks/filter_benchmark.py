@@ -0,0 +1,106 @@
+"""Per-file decision cost of the compiled EntryMatcher against the former per-pattern fnmatch-checks
+
+Run from the repository root:
+	python -m benchmarks.filter_benchmark [--paths 100000]
+"""
+from fnmatch import fnmatch
+from pathlib import Path
+from time import perf_counter
+import click
+from classes.EntryMatcher import EntryMatcher
+
+
+OPTIONS = {
+	"exclude_folders": ["golang", "xpad", "*.git", "/opt/retropie/supplementary/cache*", "tmp"],
+	"exclude_files": ["emulationstation/emulationstation", "es_log.txt", "/opt/retropie/supplementary/a/b.bin"],
+	"exclude_filter": "*.bak",
+	"include_filters": ["*.cfg", "*.srm", "*.txt", "*.bin", "*.xml", "*.state*"]
+}
+
+ROOT = "/opt/retropie/supplementary"
+
+
+def synthetic_paths(count: int):
+	"""Files in 3 levels below ROOT, each yielded with the root it would be processed with"""
+	extensions = ["cfg", "srm", "txt", "bin", "xml", "state1", "bak", "png"]
+	folders = ["emulationstation", "golang", "xpad", "cache1", "mupen64plus", "retroarch", "tmp", "splashscreen"]
+	for i in range(count):
+		a = folders[i % len(folders)]
+		b = folders[(i // 8) % len(folders)]
+		remote_root = "{}/{}".format(ROOT, a)
+		yield remote_root, "{}/{}/file{}.{}".format(remote_root, b, i, extensions[i % len(extensions)]), \
+			"{}/{}".format(remote_root, b)
+
+
+def legacy_check_folder(remote_root: Path, remote_path: Path, options):
+	for exfolder in options["exclude_folders"]:
+		if remote_root is not None and not Path(exfolder).is_absolute():
+			exfolder = remote_root.joinpath(exfolder)
+		if fnmatch(str(remote_path), str(exfolder)):
+			return "EXCLUDE_FOLDERS"
+	return None
+
+
+def legacy_check_file(remoteroot: Path, remotefile: Path, options):
+	if fnmatch(str(remotefile), options["exclude_filter"]):
+		return "EXCLUDE_FILTER"
+
+	do_transfer = "INCLUDE_FILTERS"
+	for include_filter in options["include_filters"]:
+		if fnmatch(str(remotefile), include_filter):
+			do_transfer = None
+			break
+	if do_transfer is not None:
+		return do_transfer
+
+	for exclude_file in options["exclude_files"]:
+		if str(remoteroot.joinpath(exclude_file)) == str(remotefile):
+			return "EXCLUDE_FILES"
+	return None
+
+
+def run_legacy(samples):
+	results = []
+	for remote_root, remotefile, folder in samples:
+		root = Path(remote_root)
+		decision = legacy_check_folder(root, Path(folder), OPTIONS)
+		if decision is None:
+			decision = legacy_check_file(root, Path(remotefile), OPTIONS)
+		results.append(decision)
+	return results
+
+
+def run_compiled(samples):
+	matcher = EntryMatcher(OPTIONS)
+	results = []
+	for remote_root, remotefile, folder in samples:
+		decision = matcher.check_folder(remote_root, folder)
+		if decision is None:
+			decision = matcher.check_file(remote_root, remotefile)
+		results.append(decision)
+	return results
+
+
+@click.command()
+@click.option("--paths", type=int, default=100000, help="Number of synthetic paths")
+def benchmark(paths):
+	samples = list(synthetic_paths(paths))
+
+	timings = {}
+	results = {}
+	for name, fn in (("fnmatch per pattern", run_legacy), ("compiled EntryMatcher", run_compiled)):
+		start = perf_counter()
+		results[name] = fn(samples)
+		timings[name] = perf_counter() - start
+
+	if results["fnmatch per pattern"] != results["compiled EntryMatcher"]:
+		raise click.ClickException("The compiled matcher decides differently than the fnmatch-checks")
+
+	excluded = sum(1 for r in results["compiled EntryMatcher"] if r is not None)
+	print("{} paths, {} excluded".format(paths, excluded))
+	for name, seconds in timings.items():
+		print("{:<24}{:>10.3f}s{:>10.2f}us/file".format(name, seconds, seconds / paths * 1000000))
+
+
+if __name__ == "__main__":
+	benchmark()
@@ -0,0 +1,106 @@
+"""Cold-start import-time of the CLI per backup-type, measured with python -X importtime
+
+Every scenario imports what its command needs in a fresh interpreter, repeat times, and the
+fastest run counts. A scenario fails if it takes longer than its budget or loads a module that
+it must not need, e.g. paramiko for --help or an image-backup.
+
+Run from the repository root:
+	python -m benchmarks.importtime_benchmark [--repeat 5] [--scale 1.5] [--top 8]
+"""
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Tuple
+import click
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# code, modules it must not load, budget of the imports in milliseconds
+SCENARIOS = {
+	"cli": ("import main", ["paramiko", "modules.FileBackupUnit", "modules.ImageBackupUnit"], 120),
+	"image": ("import main, modules.ImageBackupUnit", ["paramiko", "modules.FileBackupUnit"], 160),
+	"ssh": ("import main, modules.FileBackupUnit", [], 450)
+}
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int, int]]:
+	"""
+	:return: Self- and cumulative microseconds and nesting level of every imported module
+	"""
+	modules = {}
+	for line in stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		own, cumulative, name = line[len("import time:"):].split("|", 2)
+		level = (len(name) - len(name.lstrip())) // 2
+		modules[name.strip()] = (int(own), int(cumulative), level)
+	return modules
+
+
+def measure(code: str) -> Tuple[float, float, Dict[str, Tuple[int, int, int]]]:
+	"""
+	:return: Milliseconds of the imports, of the whole interpreter-run and the imported modules
+	"""
+	start = perf_counter()
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", code],
+		cwd=str(ROOT),
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.PIPE,
+		universal_newlines=True
+	)
+	wall = perf_counter() - start
+
+	if result.returncode != 0:
+		raise click.ClickException("'{}' failed:\n{}".format(
+			code, "\n".join(l for l in result.stderr.splitlines() if not l.startswith("import time:"))
+		))
+
+	modules = parse_importtime(result.stderr)
+	return sum(own for own, _, _ in modules.values()) / 1000, wall * 1000, modules
+
+
+@click.command()
+@click.option("--repeat", type=int, default=5, help="Runs per scenario, the fastest one counts")
+@click.option("--scale", type=float, default=1.0, help="Multiplies the budgets, for slower machines")
+@click.option("--top", type=int, default=8, help="Number of the most expensive top-level imports to list")
+@click.option(
+	"--scenario", "scenarios", type=click.Choice(list(SCENARIOS.keys())), multiple=True,
+	help="Scenarios to run, all by default"
+)
+def benchmark(repeat, scale, top, scenarios):
+	failures = []
+	""":type: List[str]"""
+
+	print("{:<10}{:>12}{:>12}{:>12}{:>10}".format("scenario", "imports ms", "process ms", "budget ms", "modules"))
+
+	for name in scenarios if len(scenarios) > 0 else SCENARIOS.keys():
+		code, forbidden, budget = SCENARIOS[name]
+		runs = [measure(code) for _ in range(repeat)]
+		imports, _, modules = min(runs, key=lambda run: run[0])
+		wall = min(run[1] for run in runs)
+		budget *= scale
+
+		print("{:<10}{:>12.1f}{:>12.1f}{:>12.0f}{:>10}".format(name, imports, wall, budget, len(modules)))
+
+		toplevel = sorted(
+			((module, cumulative) for module, (_, cumulative, level) in modules.items() if level == 0),
+			key=lambda item: -item[1]
+		)
+		for module, cumulative in toplevel[:top]:
+			print("{:<10}{:>12.1f}  {}".format("", cumulative / 1000, module))
+
+		if imports > budget:
+			failures.append("{} takes {:.1f}ms, its budget is {:.0f}ms".format(name, imports, budget))
+		for module in forbidden:
+			if module in modules:
+				failures.append("{} loads {}".format(name, module))
+
+	if len(failures) > 0:
+		raise click.ClickException("\n".join(failures))
+
+
+if __name__ == "__main__":
+	benchmark()
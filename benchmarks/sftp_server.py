@@ -0,0 +1,258 @@
+"""A local paramiko SFTP-server that stands in for the Pi in benchmarks
+
+Latency and bandwidth are injected on the socket, between the client and the server-transport:
+every chunk is delayed by half the round-trip time in each direction and paced to the bandwidth,
+so pipelined requests overlap like on a real link. The server serves the local filesystem, counts
+every SFTP-request by its type and runs exec-requests (find, tar, python3) with the local shell,
+so all transfer modes of FileBackupUnit can be measured.
+"""
+import os
+import socket
+import subprocess
+import threading
+from collections import Counter
+from queue import Queue
+from time import monotonic, sleep
+from typing import Dict
+import paramiko
+from paramiko.sftp import CMD_NAMES
+
+
+class _CountingSFTPServer(paramiko.SFTPServer):
+	"""Counts the requests of a channel in the Counter of its BenchmarkServer"""
+
+	def __init__(self, channel, name, server, *args, **kwargs):
+		super().__init__(channel, name, server, *args, **kwargs)
+		self._counter = server.benchmark.get_counter()
+		self._counter_lock = server.benchmark.get_counter_lock()
+
+	def _process(self, t, request_number, msg):
+		with self._counter_lock:
+			self._counter[CMD_NAMES.get(t, str(t))] += 1
+		super()._process(t, request_number, msg)
+
+
+class _Handle(paramiko.SFTPHandle):
+	def stat(self):
+		return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _LocalSFTP(paramiko.SFTPServerInterface):
+	"""Read-only view on the local filesystem"""
+
+	def list_folder(self, path):
+		try:
+			attributes = []
+			for name in os.listdir(path):
+				a = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+				a.filename = name
+				attributes.append(a)
+			return attributes
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+	def stat(self, path):
+		try:
+			return paramiko.SFTPAttributes.from_stat(os.stat(path))
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+	def lstat(self, path):
+		try:
+			return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+	def readlink(self, path):
+		try:
+			return os.readlink(path)
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+	def canonicalize(self, path):
+		return os.path.normpath(path if os.path.isabs(path) else os.path.join("/", path))
+
+	def open(self, path, flags, attr):
+		try:
+			f = open(path, "rb")
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+		handle = _Handle(flags)
+		handle.readfile = f
+		handle.filename = path
+		return handle
+
+
+class _Server(paramiko.ServerInterface):
+	def __init__(self, benchmark: "BenchmarkServer"):
+		self.benchmark = benchmark
+
+	def check_auth_password(self, username, password):
+		return paramiko.AUTH_SUCCESSFUL
+
+	def get_allowed_auths(self, username):
+		return "password"
+
+	def check_channel_request(self, kind, chanid):
+		return paramiko.OPEN_SUCCEEDED
+
+	def check_channel_exec_request(self, channel, command):
+		with self.benchmark.get_counter_lock():
+			self.benchmark.get_counter()["EXEC"] += 1
+		threading.Thread(target=self._exec, args=(channel, command.decode()), daemon=True).start()
+		return True
+
+	@staticmethod
+	def _exec(channel: paramiko.Channel, command: str):
+		process = subprocess.Popen(
+			command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+		)
+
+		def feed():
+			try:
+				for data in iter(lambda: channel.recv(32768), b""):
+					process.stdin.write(data)
+			except (OSError, EOFError):
+				pass
+			finally:
+				process.stdin.close()
+
+		def drain_stderr():
+			for data in iter(lambda: process.stderr.read(32768), b""):
+				channel.sendall_stderr(data)
+
+		threading.Thread(target=feed, daemon=True).start()
+		stderr = threading.Thread(target=drain_stderr, daemon=True)
+		stderr.start()
+
+		try:
+			for data in iter(lambda: process.stdout.read1(65536), b""):
+				channel.sendall(data)
+		except OSError:
+			process.kill()
+		stderr.join()
+		channel.send_exit_status(process.wait())
+		channel.close()
+
+
+class _DelayLine:
+	"""Forwards one direction of a connection, delayed by a fixed latency and paced to a bandwidth"""
+
+	def __init__(self, source: socket.socket, target: socket.socket, delay: float, bandwidth: int):
+		self._source = source
+		self._target = target
+		self._delay = delay
+		self._bandwidth = bandwidth
+		self._queue = Queue()
+
+	def start(self):
+		threading.Thread(target=self._read, daemon=True).start()
+		threading.Thread(target=self._write, daemon=True).start()
+
+	def _read(self):
+		try:
+			for data in iter(lambda: self._source.recv(65536), b""):
+				self._queue.put((monotonic() + self._delay, data))
+		except OSError:
+			pass
+		self._queue.put((monotonic() + self._delay, None))
+
+	def _write(self):
+		# Time at which the link is free again, data queues up behind it like in a router
+		free_at = 0.0
+		while True:
+			due, data = self._queue.get()
+			wait = due - monotonic()
+			if wait > 0:
+				sleep(wait)
+
+			if data is None:
+				try:
+					self._target.shutdown(socket.SHUT_WR)
+				except OSError:
+					pass
+				return
+
+			if self._bandwidth > 0:
+				free_at = max(free_at, monotonic()) + len(data) / self._bandwidth
+				wait = free_at - monotonic()
+				if wait > 0:
+					sleep(wait)
+
+			try:
+				self._target.sendall(data)
+			except OSError:
+				return
+
+
+class BenchmarkServer:
+	"""
+	:param latency: Round-trip time in seconds that is added to the connection
+	:param bandwidth: Bytes per second in each direction, 0 is unlimited
+	"""
+
+	def __init__(self, latency: float=0.0, bandwidth: int=0):
+		self._latency = latency
+		self._bandwidth = bandwidth
+		self._hostkey = paramiko.RSAKey.generate(2048)
+		self._counter = Counter()
+		self._counter_lock = threading.Lock()
+		self._socket = None
+		self._transports = []
+
+	def get_counter(self) -> Counter:
+		return self._counter
+
+	def get_counter_lock(self) -> threading.Lock:
+		return self._counter_lock
+
+	def get_requests(self) -> Dict[str, int]:
+		with self._counter_lock:
+			return dict(self._counter)
+
+	def reset_requests(self):
+		with self._counter_lock:
+			self._counter.clear()
+
+	def start(self) -> int:
+		"""
+		:return: The port the server listens on at 127.0.0.1
+		"""
+		self._socket = socket.socket()
+		self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._socket.bind(("127.0.0.1", 0))
+		self._socket.listen(50)
+		threading.Thread(target=self._accept, daemon=True).start()
+		return self._socket.getsockname()[1]
+
+	def stop(self):
+		if self._socket is not None:
+			self._socket.close()
+			self._socket = None
+		for transport in self._transports:
+			transport.close()
+		self._transports = []
+
+	def _link(self, client: socket.socket) -> socket.socket:
+		if self._latency <= 0 and self._bandwidth <= 0:
+			return client
+
+		server_side, link = socket.socketpair()
+		_DelayLine(client, link, self._latency / 2, self._bandwidth).start()
+		_DelayLine(link, client, self._latency / 2, self._bandwidth).start()
+		return server_side
+
+	def _accept(self):
+		while self._socket is not None:
+			try:
+				client, _ = self._socket.accept()
+			except OSError:
+				return
+			client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+			transport = paramiko.Transport(self._link(client))
+			transport.add_server_key(self._hostkey)
+			transport.set_subsystem_handler("sftp", _CountingSFTPServer, _LocalSFTP)
+			server = _Server(self)
+			transport.start_server(server=server)
+			self._transports.append(transport)
@@ -2,6 +2,7 @@ from enum import Enum
 from pathlib import Path
 from typing import Dict
 from fileutilslib.misclib.helpertools import is_empty_dict
+from classes.EntryMatcher import EntryMatcher
 
 
 class BackupEntryType(Enum):
@@ -26,6 +27,9 @@ class BackupEntry:
 	_entryname = None
 	""":type: str"""
 
+	_matcher = None
+	""":type: EntryMatcher"""
+
 	def __init__(self, entrytype: BackupEntryType, entryname: str, entryfilter: str, path: str, options: Dict):
 		self._entrytype = entrytype
 		self._entryfilter = entryfilter
@@ -48,6 +52,12 @@ class BackupEntry:
 	def get_name(self) -> str:
 		return self._entryname
 
+	def get_matcher(self) -> EntryMatcher:
+		return self._matcher
+
+	def set_matcher(self, matcher: EntryMatcher):
+		self._matcher = matcher
+
 	def should_skip(self) -> bool:
 		return (
 			not is_empty_dict(self._options) and
@@ -0,0 +1,331 @@
+import gzip
+import json
+import lzma
+import stat
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from hashlib import blake2b
+from os import cpu_count, replace, SEEK_CUR, SEEK_END
+from pathlib import Path
+from threading import get_ident, Lock
+from time import monotonic, perf_counter
+from typing import BinaryIO, Callable, Deque, Dict, Optional, Set, Tuple
+from classes.ImagePipeline import ImagePipeline
+from classes.Metrics import Metrics
+
+
+class ChunkStoreException(Exception):
+	pass
+
+
+class ChunkStore:
+	"""Content-addressed store of fixed-size device-chunks, each image-run is a manifest of chunk-hashes
+
+	A chunk is stored as chunks/<first 2 hex-digits>/<blake2b-hex> below the root, optionally compressed
+	with a format of ImagePipeline, so a run only writes the chunks that weren't stored by an earlier run.
+	Chunks of zeros aren't stored at all, the manifest holds null for them.
+	Hashing, compressing and writing run on a thread pool, blake2b, lzma and zlib release the GIL.
+
+	manifests/<name>-<timestamp>.json:
+		{"device", "created", "size", "chunk_size", "format", "chunks": [hex or null, ...]}
+
+	Attributes:
+		_new_chunks		Chunks written by the last backup
+		_known_chunks	Chunks of the last backup that were already stored
+		_zero_chunks	Chunks of the last backup that contained only zeros
+		_claimed		Hashes of the running backup, equal chunks are only stored by the first thread
+	"""
+
+	DECOMPRESS = {
+		"xz": lzma.decompress,
+		"gz": gzip.decompress,
+		"raw": lambda data: data
+	}
+
+	_root = None
+	""":type: Path"""
+
+	_chunk_size = 4 * 1024 * 1024
+	""":type: int"""
+
+	_format = "raw"
+	""":type: str"""
+
+	_level = None
+	""":type: int"""
+
+	_workers = 1
+	""":type: int"""
+
+	_zeros = None
+	""":type: bytes"""
+
+	_new_chunks = 0
+	""":type: int"""
+
+	_known_chunks = 0
+	""":type: int"""
+
+	_zero_chunks = 0
+	""":type: int"""
+
+	_bytes_written = 0
+	""":type: int"""
+
+	_seconds = 0.0
+	""":type: float"""
+
+	_metrics = None
+	""":type: Metrics"""
+
+	_claimed = None
+	""":type: Set[str]"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, root: str, chunk_size: int=None, fmt: str=None, level: int=None, workers: int=None):
+		self._root = Path(root)
+
+		if chunk_size is not None:
+			self._chunk_size = chunk_size
+
+		if fmt is not None:
+			if fmt not in self.DECOMPRESS:
+				raise ChunkStoreException("Chunks can't be compressed as '{}', use one of {}".format(
+					fmt, ", ".join(self.DECOMPRESS.keys())
+				))
+			self._format = fmt
+
+		self._level = level if level is not None else ImagePipeline.FORMATS[self._format][1]
+		self._workers = workers if workers is not None else (cpu_count() or 1)
+		self._zeros = bytes(self._chunk_size)
+		self._claimed = set()
+		self._lock = Lock()
+
+	def get_root(self) -> Path:
+		return self._root
+
+	def get_manifest_dir(self) -> Path:
+		return self._root / "manifests"
+
+	def get_new_chunks(self) -> int:
+		return self._new_chunks
+
+	def get_known_chunks(self) -> int:
+		return self._known_chunks
+
+	def get_zero_chunks(self) -> int:
+		return self._zero_chunks
+
+	def get_bytes_written(self) -> int:
+		return self._bytes_written
+
+	def get_workers(self) -> int:
+		return self._workers
+
+	def set_workers(self, workers: int):
+		self._workers = workers
+
+	def get_seconds(self) -> float:
+		return self._seconds
+
+	def set_metrics(self, metrics: Metrics):
+		"""Gets the time spent reading the source and the time per chunk for hashing and storing it"""
+		self._metrics = metrics
+
+	def get_chunk_path(self, digest: str, fmt: str) -> Path:
+		suffix = "" if fmt == "raw" else "." + fmt
+		return self._root / "chunks" / digest[:2] / (digest + suffix)
+
+	@staticmethod
+	def hash(data: bytes) -> str:
+		return blake2b(data, digest_size=32).hexdigest()
+
+	def _store(self, data: bytes) -> Tuple[Optional[str], int]:
+		"""
+		:return: The hash of the chunk or None for zeros, and the bytes that were written
+		"""
+		if data == self._zeros[:len(data)]:
+			return None, 0
+
+		start = perf_counter()
+		digest = self.hash(data)
+		if self._metrics is not None:
+			self._metrics.observe("chunk_hash_seconds", perf_counter() - start)
+		path = self.get_chunk_path(digest, self._format)
+
+		with self._lock:
+			if digest in self._claimed:
+				return digest, 0
+			self._claimed.add(digest)
+
+		if path.exists():
+			return digest, 0
+
+		path.parent.mkdir(parents=True, exist_ok=True)
+
+		# Another store on the same root may write the same chunk, each thread writes its own tmp-file
+		tmpfile = path.with_name("{}.{}.tmp".format(path.name, get_ident()))
+		start = perf_counter()
+		compressed = ImagePipeline.FORMATS[self._format][0](data, self._level)
+		with open(str(tmpfile), "wb") as f:
+			f.write(compressed)
+		replace(str(tmpfile), str(path))
+		if self._metrics is not None:
+			self._metrics.observe("chunk_store_seconds", perf_counter() - start)
+
+		return digest, len(compressed)
+
+	def backup(self, source: BinaryIO, name: str, device: str, total: int=None, progress: Callable=None) -> Path:
+		"""Stores the chunks of source that aren't stored yet and writes the manifest of this run
+
+		:param progress: Called with (bytes_read, total) after every chunk
+		:return: The path of the manifest
+		"""
+		start = monotonic()
+		self._new_chunks = 0
+		self._known_chunks = 0
+		self._zero_chunks = 0
+		self._bytes_written = 0
+		self._claimed = set()
+
+		chunks = []
+		size = 0
+
+		pending = deque()
+		""":type: Deque[Future]"""
+
+		def collect(future: Future):
+			digest, written = future.result()
+			if digest is None:
+				self._zero_chunks += 1
+			elif written > 0:
+				self._new_chunks += 1
+				self._bytes_written += written
+			else:
+				self._known_chunks += 1
+			chunks.append(digest)
+
+		with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="chunk") as executor:
+			try:
+				while True:
+					read_start = perf_counter()
+					data = ImagePipeline.read_chunk(source, self._chunk_size)
+					if self._metrics is not None:
+						self._metrics.inc("read_seconds_total", perf_counter() - read_start)
+					if len(data) == 0:
+						break
+
+					size += len(data)
+					pending.append(executor.submit(self._store, data))
+
+					while len(pending) >= self._workers * 2:
+						collect(pending.popleft())
+
+					if progress is not None:
+						progress(size, total)
+
+				while len(pending) > 0:
+					collect(pending.popleft())
+			finally:
+				for future in pending:
+					future.cancel()
+
+		self._claimed = set()
+		created = datetime.now()
+		stamp = "{}-{}".format(name, created.strftime("%Y%m%d-%H%M%S"))
+		manifest = self.get_manifest_dir() / (stamp + ".json")
+		manifest.parent.mkdir(parents=True, exist_ok=True)
+
+		count = 1
+		while manifest.exists():
+			manifest = self.get_manifest_dir() / "{}-{}.json".format(stamp, count)
+			count += 1
+
+		tmpfile = manifest.with_name(manifest.name + ".tmp")
+		with open(str(tmpfile), "w") as f:
+			json.dump({
+				"device": device,
+				"created": created.isoformat(),
+				"size": size,
+				"chunk_size": self._chunk_size,
+				"format": self._format,
+				"chunks": chunks
+			}, f)
+		replace(str(tmpfile), str(manifest))
+
+		self._seconds = monotonic() - start
+
+		if self._metrics is not None:
+			self._metrics.inc("read_bytes_total", size)
+			self._metrics.inc("written_bytes_total", self._bytes_written)
+			self._metrics.inc("chunks_total", self._new_chunks, state="new")
+			self._metrics.inc("chunks_total", self._known_chunks, state="known")
+			self._metrics.inc("chunks_total", self._zero_chunks, state="zero")
+
+		return manifest
+
+	@staticmethod
+	def load_manifest(manifestpath: str) -> Dict:
+		with open(manifestpath) as f:
+			manifest = json.load(f)
+
+		for key in ("size", "chunk_size", "format", "chunks"):
+			if key not in manifest:
+				raise ChunkStoreException("Manifest '{}' has no key '{}'".format(manifestpath, key))
+
+		return manifest
+
+	def restore(self, manifestpath: str, targetpath: str, progress: Callable=None):
+		"""Reassembles the image of a manifest into a file or onto a block-device
+
+		Zero-chunks are holes in a file, on a device they have to be written.
+
+		:param progress: Called with (bytes_written, total) after every chunk
+		:raises ChunkStoreException: If a chunk is missing or doesn't match its hash
+		"""
+		manifest = self.load_manifest(manifestpath)
+		size = manifest["size"]
+		chunk_size = manifest["chunk_size"]
+		fmt = manifest["format"]
+		decompress = self.DECOMPRESS[fmt]
+
+		target = Path(targetpath)
+		is_device = target.exists() and stat.S_ISBLK(target.stat().st_mode)
+
+		if is_device:
+			with open(targetpath, "rb") as f:
+				if f.seek(0, SEEK_END) < size:
+					raise ChunkStoreException("Device '{}' is smaller than the image".format(targetpath))
+
+		with open(targetpath, "r+b" if is_device else "wb") as out:
+			done = 0
+			for index, digest in enumerate(manifest["chunks"]):
+				length = min(chunk_size, size - index * chunk_size)
+
+				if digest is None:
+					if is_device:
+						out.write(bytes(length))
+					else:
+						out.seek(length, SEEK_CUR)
+				else:
+					path = self.get_chunk_path(digest, fmt)
+					if not path.exists():
+						raise ChunkStoreException("Chunk {} of '{}' is missing".format(digest, manifestpath))
+
+					with open(str(path), "rb") as f:
+						data = decompress(f.read())
+
+					if len(data) != length or self.hash(data) != digest:
+						raise ChunkStoreException("Chunk {} of '{}' is corrupt".format(digest, manifestpath))
+
+					out.write(data)
+
+				done += length
+				if progress is not None:
+					progress(done, size)
+
+			if not is_device:
+				out.truncate(size)
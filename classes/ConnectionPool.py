@@ -0,0 +1,109 @@
+from threading import Lock
+from typing import Callable, Dict, Tuple
+from classes.ReconnectingTransport import ReconnectingTransport
+from classes.SshConnection import SshConnection
+
+
+class ConnectionPool:
+	"""One ReconnectingTransport per host and credentials, shared by all units of a process
+
+	Units that back up the same host connect and authenticate once, their SFTP- and exec-channels
+	are multiplexed over the shared transport. A transport is connected by the unit that acquires
+	it first, with the lock of its slot held. Units that acquire it meanwhile wait for that lock, so
+	nobody gets a transport before its first connect is done, and a failed connect is tried again
+	by the next one. The transports stay open until the pool is closed.
+
+	Attributes:
+		_acquired	How many times a transport was handed out, more than the transports means they were shared
+		_slot_locks	Held while the transport of a key connects for the first time
+	"""
+
+	_connections = None
+	""":type: Dict[Tuple[str, str, str, str], ReconnectingTransport]"""
+
+	_slot_locks = None
+	""":type: Dict[Tuple[str, str, str, str], Lock]"""
+
+	_lock = None
+	""":type: Lock"""
+
+	_log = None
+	""":type: Callable"""
+
+	_keepalive = 30
+	""":type: int"""
+
+	_acquired = 0
+	""":type: int"""
+
+	def __init__(self, log: Callable=None, keepalive: int=30):
+		"""
+		:param log: Gets the lines of connects and reconnects, which may concern several units
+		"""
+		self._connections = {}
+		self._slot_locks = {}
+		self._lock = Lock()
+		self._log = log
+		self._keepalive = keepalive
+
+	def __len__(self):
+		return len(self._connections)
+
+	def get_acquired(self) -> int:
+		return self._acquired
+
+	def acquire(
+		self,
+		connection: SshConnection,
+		attempts: int=5,
+		backoff: float=1.0,
+		max_backoff: float=60.0
+	) -> ReconnectingTransport:
+		"""The transport to the host of connection, connected if it's new
+
+		The reconnect-settings of the unit that acquires a transport first apply to it.
+
+		:raises JobException: With errcode 5 if the authentication of a new transport fails
+		"""
+		key = connection.get_key()
+
+		with self._lock:
+			self._acquired += 1
+
+		while True:
+			with self._lock:
+				transport = self._connections.get(key)
+				if transport is None:
+					transport = ReconnectingTransport(
+						connection, attempts, backoff, max_backoff, self._log, None, self._keepalive
+					)
+					self._connections[key] = transport
+					self._slot_locks[key] = Lock()
+				slot_lock = self._slot_locks[key]
+
+			with slot_lock:
+				if transport.get_generation() > 0:
+					return transport
+
+				with self._lock:
+					dropped = self._connections.get(key) is not transport
+				# The connect of the unit before failed and dropped the slot, a new one is created
+				if dropped:
+					continue
+
+				try:
+					transport.connect()
+				except BaseException:
+					with self._lock:
+						self._connections.pop(key, None)
+						self._slot_locks.pop(key, None)
+					raise
+
+				return transport
+
+	def close(self):
+		with self._lock:
+			for transport in self._connections.values():
+				transport.close()
+			self._connections = {}
+			self._slot_locks = {}
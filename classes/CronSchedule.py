@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from typing import Set, Tuple
+
+
+class CronScheduleException(Exception):
+	pass
+
+
+class CronSchedule:
+	"""A schedule in the five fields of crontab: minute, hour, day of month, month and day of week
+
+	Fields are *, numbers, ranges (1-5) and lists of them (1,15,30), each optionally with a step
+	(*/15, 8-18/2). Day of week is 0 to 7, both 0 and 7 are sunday. Like cron, a day matches either
+	field if both day of month and day of week are restricted, a field starting with * like */2
+	counts as unrestricted. @hourly, @daily, @weekly and @monthly
+	are accepted as well.
+	"""
+
+	ALIASES = {
+		"@hourly": "0 * * * *",
+		"@daily": "0 0 * * *",
+		"@midnight": "0 0 * * *",
+		"@weekly": "0 0 * * 0",
+		"@monthly": "0 0 1 * *"
+	}
+
+	FIELDS = (
+		("minute", 0, 59),
+		("hour", 0, 23),
+		("day of month", 1, 31),
+		("month", 1, 12),
+		("day of week", 0, 7)
+	)
+
+	_expression = None
+	""":type: str"""
+
+	_minutes = None
+	""":type: Set[int]"""
+
+	_hours = None
+	""":type: Set[int]"""
+
+	_days = None
+	""":type: Set[int]"""
+
+	_months = None
+	""":type: Set[int]"""
+
+	_weekdays = None
+	""":type: Set[int]"""
+
+	_days_restricted = False
+	""":type: bool"""
+
+	_weekdays_restricted = False
+	""":type: bool"""
+
+	def __init__(self, expression: str):
+		self._expression = expression
+		fields = self.ALIASES.get(expression.strip(), expression).split()
+
+		if len(fields) != 5:
+			raise CronScheduleException("Schedule '{}' needs 5 fields".format(expression))
+
+		parsed = [self._parse_field(field, *spec) for field, spec in zip(fields, self.FIELDS)]
+		self._minutes, self._hours, self._days, self._months, self._weekdays = [values for values, _ in parsed]
+		self._days_restricted = parsed[2][1]
+		self._weekdays_restricted = parsed[4][1]
+
+		# Sunday is 0 and 7
+		if 7 in self._weekdays:
+			self._weekdays.add(0)
+
+	def __str__(self):
+		return self._expression
+
+	def _parse_field(self, field: str, name: str, lowest: int, highest: int) -> Tuple[Set[int], bool]:
+		"""
+		:return: The matching values and whether the field is restricted at all
+		"""
+		values = set()
+
+		for part in field.split(","):
+			step = 1
+			if "/" in part:
+				part, step = part.split("/", 1)
+				step = self._parse_number(step, name)
+				if step < 1:
+					raise CronScheduleException("Step of the {} in '{}' has to be at least 1".format(name, self._expression))
+
+			if part == "*":
+				start, end = lowest, highest
+			elif "-" in part:
+				start, end = (self._parse_number(n, name) for n in part.split("-", 1))
+			else:
+				start = end = self._parse_number(part, name)
+				if step > 1:
+					end = highest
+
+			if start < lowest or end > highest or start > end:
+				raise CronScheduleException("The {} '{}' in '{}' is out of {}-{}".format(
+					name, part, self._expression, lowest, highest
+				))
+
+			values.update(range(start, end + 1, step))
+
+		# Like in vixie-cron, */2 is no restriction that makes the days match either field
+		return values, not field.startswith("*")
+
+	def _parse_number(self, value: str, name: str) -> int:
+		try:
+			return int(value)
+		except ValueError:
+			raise CronScheduleException("The {} '{}' in '{}' is no number".format(name, value, self._expression))
+
+	def _matches_day(self, moment: datetime) -> bool:
+		day = moment.day in self._days
+		# isoweekday is 1 for monday to 7 for sunday
+		weekday = moment.isoweekday() % 7 in self._weekdays
+
+		if self._days_restricted and self._weekdays_restricted:
+			return day or weekday
+		return day and weekday
+
+	def next(self, after: datetime) -> datetime:
+		"""The first matching minute after the given moment"""
+		moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+		# A schedule like february 31st never matches
+		limit = moment + timedelta(days=366 * 5)
+
+		while moment < limit:
+			if moment.month not in self._months:
+				moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+			elif not self._matches_day(moment):
+				moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+			elif moment.hour not in self._hours:
+				moment = moment.replace(minute=0) + timedelta(hours=1)
+			elif moment.minute not in self._minutes:
+				moment += timedelta(minutes=1)
+			else:
+				return moment
+
+		raise CronScheduleException("Schedule '{}' never matches".format(self._expression))
@@ -0,0 +1,288 @@
+import json
+import signal
+from datetime import datetime
+from logging import Logger
+from os import replace
+from pathlib import Path
+from threading import Event
+from time import monotonic
+from traceback import format_exc
+from typing import Callable, Dict, List, Optional
+from classes.CronSchedule import CronSchedule
+
+
+class DaemonUnit:
+	"""A unit of the daemon, its schedule and the status of its last run
+
+	Attributes:
+		_mtime	Modification time of the configfile when it was loaded, a newer one reloads it
+		_error	Why the configfile couldn't be loaded, the unit doesn't run until it's fixed
+	"""
+
+	_configfile = None
+	""":type: Path"""
+
+	_unit = None
+	""":type: modules.Unit.Unit"""
+
+	_schedule = None
+	""":type: CronSchedule"""
+
+	_mtime = 0.0
+	""":type: float"""
+
+	_error = None
+	""":type: str"""
+
+	_next_run = None
+	""":type: datetime"""
+
+	_runs = 0
+	""":type: int"""
+
+	_failures = 0
+	""":type: int"""
+
+	_last_start = None
+	""":type: datetime"""
+
+	_last_seconds = None
+	""":type: float"""
+
+	_last_errcode = None
+	""":type: int"""
+
+	def __init__(self, configfile: Path):
+		self._configfile = configfile
+
+	def get_configfile(self) -> Path:
+		return self._configfile
+
+	def get_unit(self):
+		return self._unit
+
+	def get_next_run(self) -> Optional[datetime]:
+		return self._next_run
+
+	def is_changed(self) -> bool:
+		try:
+			return self._configfile.stat().st_mtime != self._mtime
+		except OSError:
+			return False
+
+	def load(self, create_unit: Callable, now: datetime):
+		"""Creates the unit from the configfile or reloads it, if it exists already
+
+		:raises Exception: If the config is invalid or has no schedule-option
+		"""
+		self._mtime = self._configfile.stat().st_mtime
+		self._next_run = None
+
+		try:
+			with open(str(self._configfile)) as f:
+				if self._unit is None:
+					self._unit = create_unit(f)
+				else:
+					# The connections may lead to a host that isn't configured anymore
+					self._unit.close()
+					self._unit.reload(f)
+
+			options = self._unit.get_options()
+			if "schedule" not in options:
+				raise Exception("json-config options['schedule'] is needed by the daemon")
+			self._schedule = CronSchedule(options["schedule"])
+		except Exception as e:
+			self._error = str(e)
+			raise
+
+		self._error = None
+		self._next_run = self._schedule.next(now)
+
+	def is_due(self, now: datetime) -> bool:
+		return self._error is None and self._next_run is not None and self._next_run <= now
+
+	def run(self, log: Logger):
+		"""Runs the unit and schedules its next run, counted from its end, so missed runs aren't repeated"""
+		self._last_start = datetime.now()
+		start = monotonic()
+
+		try:
+			errcode = self._unit.run()
+		except Exception:
+			log.error(format_exc())
+			errcode = 1
+		finally:
+			# The next line of the unit may come hours later
+			self._unit.flush_logs()
+
+		self._last_seconds = monotonic() - start
+		self._last_errcode = errcode if errcode is not None else 0
+		self._runs += 1
+		if self._last_errcode != 0:
+			self._failures += 1
+
+		self._next_run = self._schedule.next(datetime.now())
+
+	def get_status(self) -> Dict:
+		return {
+			"configfile": str(self._configfile),
+			"name": self._unit.get_name() if self._unit is not None else None,
+			"schedule": str(self._schedule) if self._schedule is not None else None,
+			"error": self._error,
+			"next_run": self._next_run.isoformat() if self._next_run is not None else None,
+			"runs": self._runs,
+			"failures": self._failures,
+			"last_start": self._last_start.isoformat() if self._last_start is not None else None,
+			"last_seconds": self._last_seconds,
+			"last_errcode": self._last_errcode,
+			"connected": self._unit.is_connected() if self._unit is not None else False
+		}
+
+
+class Daemon:
+	"""Runs units on the cron-schedules of their options['schedule'] until it's stopped
+
+	The units are created once and run again and again, so their configs aren't parsed and their
+	connections aren't authenticated again for every run: they stay open between the runs with
+	keepalives and are connected again if they dropped. A configfile that changed is reloaded
+	before the next check of the schedules. The units run one after another, a unit that becomes
+	due while another runs starts right after it.
+
+	SIGTERM and SIGINT stop the daemon after the current run, SIGHUP reloads all configfiles.
+
+	Attributes:
+		_create_unit	Called with an opened configfile, returns the unit
+		_statusfile		Gets the status of all units as json after every run and reload
+		_poll_interval	Seconds between the checks for changed configfiles
+	"""
+
+	_units = None
+	""":type: List[DaemonUnit]"""
+
+	_create_unit = None
+	""":type: Callable"""
+
+	_log = None
+	""":type: Logger"""
+
+	_statusfile = None
+	""":type: str"""
+
+	_poll_interval = 5.0
+	""":type: float"""
+
+	_stopped = None
+	""":type: Event"""
+
+	_started = None
+	""":type: datetime"""
+
+	_reload_requested = False
+	""":type: bool"""
+
+	def __init__(
+		self,
+		configfiles: List[str],
+		create_unit: Callable,
+		log: Logger,
+		statusfile: str=None,
+		poll_interval: float=5.0
+	):
+		if len(configfiles) == 0:
+			raise Exception("At least one configfile has to be passed")
+
+		self._units = [DaemonUnit(Path(configfile)) for configfile in configfiles]
+		self._create_unit = create_unit
+		self._log = log
+		self._statusfile = statusfile
+		self._poll_interval = poll_interval
+		self._stopped = Event()
+
+	def stop(self):
+		self._stopped.set()
+
+	def request_reload(self):
+		"""Reloads all configfiles before the schedules are checked next, changed or not"""
+		self._reload_requested = True
+
+	def reload_all(self):
+		for unit in self._units:
+			self._load(unit)
+		self._write_status()
+
+	def _load(self, unit: DaemonUnit):
+		try:
+			unit.load(self._create_unit, datetime.now())
+			self._log.info("Loaded '{}', next run at {}".format(unit.get_configfile(), unit.get_next_run()))
+		except Exception:
+			self._log.error("Could not load '{}', it doesn't run until it's fixed:\n{}".format(
+				unit.get_configfile(), format_exc()
+			))
+
+	def get_status(self) -> Dict:
+		return {
+			"started": self._started.isoformat() if self._started is not None else None,
+			"updated": datetime.now().isoformat(),
+			"units": [unit.get_status() for unit in self._units]
+		}
+
+	def _write_status(self):
+		if self._statusfile is None:
+			return
+		tmpfile = self._statusfile + ".tmp"
+		with open(tmpfile, "w") as f:
+			json.dump(self.get_status(), f, indent=1)
+		replace(tmpfile, self._statusfile)
+
+	def _install_signal_handlers(self):
+		signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+		signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+		if hasattr(signal, "SIGHUP"):
+			signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+
+	def run(self, install_signal_handlers: bool=True):
+		"""Blocks until stop() is called or a stop-signal arrives"""
+		self._started = datetime.now()
+
+		if install_signal_handlers:
+			self._install_signal_handlers()
+
+		self._log.info("Daemon started with {} units".format(len(self._units)))
+		self.reload_all()
+
+		try:
+			while not self._stopped.is_set():
+				reload_all = self._reload_requested
+				self._reload_requested = False
+				changed = False
+				for unit in self._units:
+					if reload_all or unit.is_changed():
+						self._log.info("Configfile '{}' changed, reloading it".format(unit.get_configfile()))
+						self._load(unit)
+						changed = True
+				if changed:
+					self._write_status()
+
+				for unit in self._units:
+					if self._stopped.is_set():
+						break
+					if unit.is_due(datetime.now()):
+						self._log.info("Running '{}'".format(unit.get_configfile()))
+						unit.run(self._log)
+						status = unit.get_status()
+						self._log.info("'{}' finished with exit {} in {:.1f}s, next run at {}".format(
+							unit.get_configfile(), status["last_errcode"], status["last_seconds"], unit.get_next_run()
+						))
+						self._write_status()
+
+				upcoming = [unit.get_next_run() for unit in self._units if unit.get_next_run() is not None]
+				wait = self._poll_interval
+				if len(upcoming) > 0:
+					wait = max(0.0, min(wait, (min(upcoming) - datetime.now()).total_seconds()))
+				self._stopped.wait(wait)
+		finally:
+			for unit in self._units:
+				if unit.get_unit() is not None:
+					unit.get_unit().close()
+			self._write_status()
+			self._log.info("Daemon stopped")
@@ -0,0 +1,269 @@
+import json
+from hashlib import md5
+from itertools import accumulate
+from os import replace
+from pathlib import Path
+from shlex import quote
+from typing import Iterator, List, Tuple
+import paramiko
+
+
+class DeltaSyncException(Exception):
+	"""Raised when the delta can't be computed remotely, the caller should download the whole file"""
+	pass
+
+
+# Executed with python3 on the remote host. Reads the block-signatures of the local copy as json
+# from stdin, rolls the weak checksum over the remote file and writes the instructions to rebuild
+# it as json to stdout: ["c", blockindex] copies a block of the local copy, ["d", offset, length]
+# has to be fetched from the remote file. The file is read in windows of W bytes, so the memory
+# stays at a few windows whatever the size of the file is. The rolling is a tight loop over one
+# window, still it's pure python and handles roughly 1MB per second of a file that changed entirely.
+_REMOTE_SCRIPT = """
+import hashlib, itertools, json, sys
+W = 1048576
+req = json.load(sys.stdin)
+bs = req["block_size"]
+sigs = {}
+for i, (weak, strong, length) in enumerate(req["blocks"]):
+    sigs.setdefault(weak, []).append((strong, length, i))
+f = open(req["path"], "rb")
+whole = hashlib.md5()
+buf = b""
+base = 0
+eof = False
+ops = []
+lit = None
+tail = None
+if len(req["blocks"]) > 0 and req["blocks"][-1][2] < bs:
+    tail = (req["blocks"][-1][1], req["blocks"][-1][2], len(req["blocks"]) - 1)
+def fill(end):
+    # Drops the window before p and reads until the window reaches end or the file ends
+    global buf, base, eof
+    if p - base >= W:
+        buf = buf[p - base:]
+        base = p
+    while not eof and base + len(buf) < end:
+        chunk = f.read(W)
+        if len(chunk) == 0:
+            eof = True
+        else:
+            whole.update(chunk)
+            buf += chunk
+    return base + len(buf)
+def flush(q):
+    # The pending literal starts at lit and ends before q
+    global lit
+    if lit is not None and q > lit:
+        ops.append(["d", lit, q - lit])
+    lit = None
+p = 0
+while True:
+    end = fill(p + bs)
+    n = min(bs, end - p)
+    if n <= 0:
+        break
+    if n < bs:
+        # The short last block of the local copy can only match at the end of the file
+        if lit is None:
+            lit = p
+        if tail is not None and tail[1] <= n and hashlib.md5(buf[end - tail[1] - base:end - base]).hexdigest() == tail[0]:
+            flush(end - tail[1])
+            ops.append(["c", tail[2]])
+        else:
+            flush(end)
+        break
+    o = p - base
+    win = buf[o:o + n]
+    a = sum(win) & 0xffff
+    b = sum(itertools.accumulate(win)) & 0xffff
+    last = len(buf) - n
+    hit = None
+    while True:
+        candidates = sigs.get(a | (b << 16))
+        if candidates is not None:
+            for strong, length, i in candidates:
+                if length == n and hashlib.md5(buf[o:o + n]).hexdigest() == strong:
+                    hit = i
+                    break
+            if hit is not None:
+                break
+        if o >= last:
+            break
+        x = buf[o]
+        a = (a - x + buf[o + n]) & 0xffff
+        b = (b - n * x + a) & 0xffff
+        o += 1
+    if hit is not None:
+        if lit is None:
+            lit = p
+        flush(base + o)
+        ops.append(["c", hit])
+        p = base + o + n
+    else:
+        # The window is used up, the rolling starts again after the next fill
+        if lit is None:
+            lit = p
+        p = base + o + 1
+flush(p)
+json.dump({"size": base + len(buf), "md5": whole.hexdigest(), "ops": ops}, sys.stdout)
+"""
+
+
+class DeltaSync:
+	"""rsync-style delta-transfer of a remote file against an older local copy
+
+	The block-signatures (weak rolling checksum, md5) of the local copy are sent to a small python-script
+	that is executed on the remote host. It finds those blocks at any offset of the remote file, so only
+	the differing ranges have to be read via sftp. The file is rebuilt next to the local copy, verified
+	against the md5 of the remote file and renamed over the local copy. The ranges are read in pieces of
+	CHUNK_SIZE with at most WINDOW bytes requested at once, so a file that changed entirely is never
+	held in memory.
+
+	Attributes:
+		_python 	Interpreter on the remote host
+	"""
+
+	CHUNK_SIZE = 1024 * 1024
+
+	WINDOW = 16 * 1024 * 1024
+
+	_transport = None
+	""":type: paramiko.Transport"""
+
+	_python = None
+	""":type: str"""
+
+	_block_size = None
+	""":type: int"""
+
+	def __init__(self, transport: paramiko.Transport, python: str="python3", block_size: int=None):
+		self._transport = transport
+		self._python = python
+		self._block_size = block_size
+
+	def set_transport(self, transport: paramiko.Transport):
+		self._transport = transport
+
+	def get_block_size(self, filesize: int) -> int:
+		"""The configured block size or like rsync the square root of the filesize, rounded to 1KB"""
+		if self._block_size is not None:
+			return self._block_size
+		return min(max(int(filesize ** 0.5) // 1024 * 1024, 4096), 1024 * 1024)
+
+	@staticmethod
+	def weak_checksum(block: bytes) -> int:
+		"""Same checksum the remote script starts its rolling with"""
+		return (sum(block) % 65536) | ((sum(accumulate(block)) % 65536) << 16)
+
+	@staticmethod
+	def signatures(localfile: Path, block_size: int) -> List[Tuple[int, str, int]]:
+		blocks = []
+		with open(str(localfile), "rb") as f:
+			for block in iter(lambda: f.read(block_size), b""):
+				blocks.append((DeltaSync.weak_checksum(block), md5(block).hexdigest(), len(block)))
+		return blocks
+
+	@staticmethod
+	def split_ranges(ranges: List[Tuple[int, int]], chunk_size: int) -> List[Tuple[int, int]]:
+		pieces = []
+		for offset, length in ranges:
+			for start in range(offset, offset + length, chunk_size):
+				pieces.append((start, min(chunk_size, offset + length - start)))
+		return pieces
+
+	def read_ranges(self, remote: paramiko.SFTPFile, ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+		"""Yields the data of the ranges in pieces, readv pipelines the read-requests of one window"""
+		window = []
+		size = 0
+
+		for piece in self.split_ranges(ranges, self.CHUNK_SIZE):
+			window.append(piece)
+			size += piece[1]
+			if size >= self.WINDOW:
+				yield from remote.readv(window)
+				window = []
+				size = 0
+
+		if len(window) > 0:
+			yield from remote.readv(window)
+
+	def compute_delta(self, remotefile: str, localfile: Path, block_size: int) -> dict:
+		request = json.dumps({
+			"path": remotefile,
+			"block_size": block_size,
+			"blocks": self.signatures(localfile, block_size)
+		}).encode("utf-8")
+
+		command = "{} -c {}".format(quote(self._python), quote(_REMOTE_SCRIPT))
+
+		try:
+			channel = self._transport.open_session()
+			channel.exec_command(command)
+		except paramiko.SSHException as e:
+			raise DeltaSyncException("Could not execute the delta-script: {}".format(e))
+
+		try:
+			channel.sendall(request)
+			channel.shutdown_write()
+
+			response = b""
+			for data in iter(lambda: channel.recv(65536), b""):
+				response += data
+
+			exitstatus = channel.recv_exit_status()
+		finally:
+			channel.close()
+
+		if exitstatus != 0:
+			raise DeltaSyncException("The delta-script failed with exit status {}".format(exitstatus))
+
+		return json.loads(response.decode("utf-8"))
+
+	def sync(self, sftp: paramiko.SFTPClient, remotefile: str, localfile: Path) -> int:
+		"""Rebuilds localfile from its old content and the differing ranges of remotefile
+
+		:return: The number of bytes that were read from the remote file
+		:raises DeltaSyncException: If the delta couldn't be computed or the result doesn't verify
+		"""
+		block_size = self.get_block_size(localfile.stat().st_size)
+		delta = self.compute_delta(remotefile, localfile, block_size)
+
+		ranges = [(op[1], op[2]) for op in delta["ops"] if op[0] == "d"]
+		fetched = sum(length for _, length in ranges)
+
+		tmpfile = localfile.with_name(localfile.name + ".delta")
+		checksum = md5()
+
+		try:
+			with sftp.open(remotefile, "rb") as remote, \
+					open(str(localfile), "rb") as basis, \
+					open(str(tmpfile), "wb") as target:
+				pieces = self.read_ranges(remote, ranges)
+
+				for op in delta["ops"]:
+					if op[0] == "c":
+						basis.seek(op[1] * block_size)
+						data = basis.read(block_size)
+						checksum.update(data)
+						target.write(data)
+						continue
+
+					remaining = op[2]
+					while remaining > 0:
+						data = next(pieces, b"")
+						if len(data) == 0:
+							raise DeltaSyncException("The remote file is shorter than its delta")
+						checksum.update(data)
+						target.write(data)
+						remaining -= len(data)
+
+			if checksum.hexdigest() != delta["md5"]:
+				raise DeltaSyncException("The rebuilt file doesn't match the remote file")
+
+			replace(str(tmpfile), str(localfile))
+		finally:
+			if tmpfile.exists():
+				tmpfile.unlink()
+
+		return fetched
@@ -0,0 +1,50 @@
+from os import SEEK_END
+from typing import Callable
+from classes.ImagePipeline import ImagePipeline
+
+
+class DeviceUsage:
+	"""Tells how many bytes a sparse image of a block-device needs
+
+	The sparse writer of ImagePipeline only skips blocks that are all zeros, a block the filesystem
+	reports as free may still hold old data and is written. So the bytes a sparse image needs are
+	counted by reading the device once and checking every block of the writer's block-size for
+	zeros. That's an upper bound as long as the device doesn't change until it's imaged.
+	"""
+
+	_devicepath = None
+	""":type: str"""
+
+	def __init__(self, devicepath: str):
+		self._devicepath = devicepath
+
+	def get_size(self) -> int:
+		with open(self._devicepath, "rb") as device:
+			return device.seek(0, SEEK_END)
+
+	def count_data_bytes(self, block_size: int, chunk_size: int=16 * 1024 * 1024, progress: Callable=None) -> int:
+		"""Reads the device and counts the bytes of the blocks that aren't all zeros
+
+		:param block_size: The granularity the image skips zeros in
+		:param progress: Called with the bytes read and the size of the device
+		"""
+		zeros = bytes(block_size)
+		data_bytes = 0
+		done = 0
+
+		with open(self._devicepath, "rb", buffering=0) as device:
+			total = device.seek(0, SEEK_END)
+			device.seek(0)
+
+			# Whole blocks per read, so the blocks line up with the ones of the image
+			chunk_size = max(block_size, chunk_size - chunk_size % block_size)
+			for data in iter(lambda: ImagePipeline.read_chunk(device, chunk_size), b""):
+				for offset in range(0, len(data), block_size):
+					block = data[offset:offset + block_size]
+					if block != zeros[:len(block)]:
+						data_bytes += len(block)
+				done += len(data)
+				if progress is not None:
+					progress(done, total)
+
+		return data_bytes
@@ -0,0 +1,174 @@
+import json
+import sqlite3
+from os import makedirs, replace
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, List, NamedTuple, Optional
+from zlib import crc32
+import paramiko
+
+
+DirectoryRecord = NamedTuple("DirectoryRecord", [("mtime", int), ("validated", float), ("listing", str)])
+
+
+class DirectoryCache:
+	"""The remote directory-listings of the last successful run, keyed by path and mtime of the directory
+
+	A directory that still has the mtime of its cached listing didn't get or lose an entry since,
+	so its listing can be taken from the cache instead of listing it again. Files that were
+	changed in place don't change the mtime of their directory though: their size and mtime are
+	only picked up when the listing is validated again, after max_age seconds, a day by default.
+	A shorter max_age picks up such changes sooner, None trusts a listing for as long as the mtime
+	of its directory doesn't change. The ages are spread over the second half of max_age by the
+	path, so not every directory expires in the same run.
+
+	Listings of directories that were changed in the last seconds aren't cached, a change within
+	the same second wouldn't change the mtime in whole seconds that sftp delivers.
+
+	Attributes:
+		_previous	Records of the last successful run, keyed by the remote path
+		_current	Records of the directories listed or taken from the cache in this run
+		_roots		Remote paths of the processed entries, records below them that weren't visited are dropped
+	"""
+
+	SETTLE_SECONDS = 2
+
+	MAX_AGE = 86400
+
+	_filepath = None
+	""":type: Path"""
+
+	_max_age = MAX_AGE
+	""":type: float"""
+
+	_previous = None
+	""":type: Dict[str, DirectoryRecord]"""
+
+	_current = None
+	""":type: Dict[str, DirectoryRecord]"""
+
+	_roots = None
+	""":type: List[str]"""
+
+	_hits = 0
+	""":type: int"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, filepath: Path, max_age: float=MAX_AGE):
+		"""
+		:param max_age: Seconds after which a listing is validated again, None for never
+		"""
+		self._filepath = filepath
+		self._max_age = max_age
+		self._previous = {}
+		self._current = {}
+		self._roots = []
+		self._hits = 0
+		self._lock = Lock()
+
+	def __len__(self):
+		return len(self._previous)
+
+	def get_filepath(self) -> Path:
+		return self._filepath
+
+	def get_hits(self) -> int:
+		return self._hits
+
+	def load(self):
+		self._previous = {}
+
+		if not self._filepath.exists():
+			return
+
+		with sqlite3.connect(str(self._filepath)) as con:
+			for path, mtime, validated, listing in con.execute(
+				"SELECT path, mtime, validated, listing FROM dirs"
+			):
+				self._previous[path] = DirectoryRecord(mtime, validated, listing)
+		con.close()
+
+	def add_root(self, remotepath: str):
+		with self._lock:
+			self._roots.append(remotepath.rstrip("/") + "/")
+
+	def _is_expired(self, path: str, record: DirectoryRecord) -> bool:
+		if self._max_age is None:
+			return False
+		spread = 0.5 + (crc32(path.encode("utf-8")) % 1000) / 2000
+		return time() - record.validated > self._max_age * spread
+
+	def get(self, remotepath: str, mtime: int) -> Optional[List[paramiko.SFTPAttributes]]:
+		"""The cached listing of a directory, None if it changed, expired or was never listed"""
+		record = self._previous.get(remotepath)
+		if record is None or record.mtime != mtime or self._is_expired(remotepath, record):
+			return None
+
+		with self._lock:
+			self._current[remotepath] = record
+			self._hits += 1
+
+		listing = []
+		for name, size, uid, gid, mode, atime, file_mtime in json.loads(record.listing):
+			attributes = paramiko.SFTPAttributes()
+			attributes.filename = name
+			attributes.st_size = size
+			attributes.st_uid = uid
+			attributes.st_gid = gid
+			attributes.st_mode = mode
+			attributes.st_atime = atime
+			attributes.st_mtime = file_mtime
+			listing.append(attributes)
+		return listing
+
+	def put(self, remotepath: str, mtime: int, listing: List[paramiko.SFTPAttributes]):
+		now = time()
+		if mtime is None or mtime >= now - self.SETTLE_SECONDS:
+			return
+
+		record = DirectoryRecord(mtime, now, json.dumps([
+			[a.filename, a.st_size, a.st_uid, a.st_gid, a.st_mode, a.st_atime, a.st_mtime] for a in listing
+		]))
+		with self._lock:
+			self._current[remotepath] = record
+
+	def _is_below_root(self, path: str) -> bool:
+		path = path.rstrip("/") + "/"
+		for root in self._roots:
+			if path.startswith(root):
+				return True
+		return False
+
+	def save(self):
+		"""Writes the records of this run to a temporary database and swaps it in"""
+		records = {}
+
+		for path, record in self._previous.items():
+			if not self._is_below_root(path):
+				records[path] = record
+		records.update(self._current)
+
+		if not self._filepath.parent.exists():
+			makedirs(str(self._filepath.parent))
+
+		tmppath = self._filepath.with_name(self._filepath.name + ".tmp")
+		if tmppath.exists():
+			tmppath.unlink()
+
+		con = sqlite3.connect(str(tmppath))
+		try:
+			with con:
+				con.execute(
+					"CREATE TABLE dirs (path TEXT PRIMARY KEY, mtime INTEGER, validated REAL, listing TEXT)"
+				)
+				con.executemany(
+					"INSERT INTO dirs (path, mtime, validated, listing) VALUES (?, ?, ?, ?)",
+					((path, r.mtime, r.validated, r.listing) for path, r in records.items())
+				)
+		finally:
+			con.close()
+
+		replace(str(tmppath), str(self._filepath))
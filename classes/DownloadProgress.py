@@ -0,0 +1,54 @@
+from time import monotonic
+from typing import Callable
+from fileutilslib.disklib.filetools import get_filesize_progress_divider
+
+
+class DownloadProgress:
+	"""Rate-limited progress-callback for a single download
+
+	The callback fires when at least a progress-divider of bytes was downloaded since the last call
+	and min_interval seconds have passed, and once when the file is complete, unless that took
+	less than min_interval, so small files don't produce any lines.
+	"""
+
+	_total = 0
+	""":type: int"""
+
+	_divider = 0
+	""":type: int"""
+
+	_min_interval = 0
+	""":type: float"""
+
+	_last_bytes = 0
+	""":type: int"""
+
+	_last_time = 0
+	""":type: float"""
+
+	_callback = None
+	""":type: Callable"""
+
+	def __init__(self, total: int, callback: Callable, min_interval: float=1.0):
+		"""
+		:param callback: Called with (current, total)
+		"""
+		self._total = total
+		self._divider = get_filesize_progress_divider(total)
+		self._min_interval = min_interval
+		self._last_bytes = 0
+		self._last_time = monotonic()
+		self._callback = callback
+
+	def update(self, current: int):
+		if current == self._total:
+			if self._last_bytes > 0 or monotonic() - self._last_time >= self._min_interval:
+				self._callback(current, self._total)
+			return
+
+		if current - self._last_bytes > self._divider:
+			now = monotonic()
+			if now - self._last_time >= self._min_interval:
+				self._last_bytes = current
+				self._last_time = now
+				self._callback(current, self._total)
@@ -0,0 +1,156 @@
+import re
+from fnmatch import translate
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Pattern
+from fileutilslib.misclib.helpertools import is_sequence_with_any_elements, string_is_empty
+from classes.JobException import JobException
+
+
+class EntryMatcher:
+	"""The include- and exclude-options of a BackupEntry, compiled once before the entry is processed
+
+	All shell-patterns of an option are translated into a single regex, exclude_files become sets
+	for exact lookups. Ignored options (--ignoreoptions) are left out at compile-time.
+
+	The semantics are those of the former per-file fnmatch-checks:
+	a relative exclude_folders-pattern is joined to the parent of the tested folder, so it matches
+	the folder-name and never the root of the entry. A relative exclude_files-path is joined to the
+	remote root the file was processed with.
+	"""
+
+	_folder_names = None
+	""":type: Pattern"""
+
+	_folder_paths = None
+	""":type: Pattern"""
+
+	_prune_names = None
+	""":type: List[str]"""
+
+	_prune_paths = None
+	""":type: List[str]"""
+
+	_group_excluded = False
+	""":type: bool"""
+
+	_exclude_filter = None
+	""":type: Pattern"""
+
+	_include_filters = None
+	""":type: Pattern"""
+
+	_exclude_files_relative = None
+	""":type: Set[str]"""
+
+	_exclude_files_absolute = None
+	""":type: Set[str]"""
+
+	def __init__(self, options: Dict, ignoreoptions: List[str]=None, group: str=None):
+		self._prune_names = []
+		self._prune_paths = []
+		self._exclude_files_relative = set()
+		self._exclude_files_absolute = set()
+
+		if not is_sequence_with_any_elements(options):
+			return
+
+		ignored = ignoreoptions if ignoreoptions is not None else []
+
+		if "exclude_folders" in options and "exclude_folders" not in ignored:
+			exfolders = options["exclude_folders"]
+
+			if not is_sequence_with_any_elements(exfolders):
+				raise JobException("options['exclude_folders'] has to contain a list of shell-file-patters", 10)
+
+			for exfolder in exfolders:
+				exfolder = str(PurePosixPath(exfolder))
+				if exfolder.startswith("/"):
+					self._prune_paths.append(exfolder)
+				elif "/" not in exfolder:
+					self._prune_names.append(exfolder)
+				# Joined to the parent of a folder, a pattern with a slash never matched anything
+
+			self._folder_names = self.compile(self._prune_names)
+			self._folder_paths = self.compile(self._prune_paths)
+
+		if "group" in options and not string_is_empty(group) and "group" not in ignored:
+			if not string_is_empty(options["group"]) and options["group"] != group:
+				self._group_excluded = True
+
+		if "exclude_filter" in options and "exclude_filter" not in ignored:
+			if not string_is_empty(options["exclude_filter"]):
+				self._exclude_filter = self.compile([options["exclude_filter"]])
+
+		if "include_filters" in options and "include_filters" not in ignored:
+			include_filters = options["include_filters"]
+			if isinstance(include_filters, str):
+				if not string_is_empty(include_filters):
+					self._include_filters = self.compile([include_filters])
+			elif is_sequence_with_any_elements(include_filters):
+				self._include_filters = self.compile(include_filters)
+
+		if "exclude_files" in options and "exclude_files" not in ignored:
+			exclude_files = options["exclude_files"]
+			if is_sequence_with_any_elements(exclude_files):
+				for exclude_file in exclude_files:
+					if not string_is_empty(exclude_file):
+						exclude_file = str(PurePosixPath(exclude_file))
+						if exclude_file.startswith("/"):
+							self._exclude_files_absolute.add(exclude_file)
+						else:
+							self._exclude_files_relative.add(exclude_file)
+
+	@staticmethod
+	def compile(patterns: List[str]) -> Optional[Pattern]:
+		"""Combines shell-patterns into one regex that matches like fnmatch does on posix"""
+		if len(patterns) == 0:
+			return None
+		return re.compile("|".join("(?:{})".format(translate(p)) for p in patterns))
+
+	def get_prune_names(self) -> List[str]:
+		"""exclude_folders-patterns that match against the folder-name"""
+		return self._prune_names
+
+	def get_prune_paths(self) -> List[str]:
+		"""exclude_folders-patterns that match against the absolute folder-path"""
+		return self._prune_paths
+
+	def check_folder(self, remote_root: str, remote_path: str) -> Optional[str]:
+		"""
+		:param remote_root: The root the folder is processed with, the entry-path for the entry itself
+		:return: The name of the option that excludes the folder or None
+		"""
+		if self._folder_paths is not None and self._folder_paths.match(remote_path):
+			return "EXCLUDE_FOLDERS"
+
+		if self._folder_names is not None and remote_root != remote_path:
+			if remote_root is None:
+				if self._folder_names.match(remote_path):
+					return "EXCLUDE_FOLDERS"
+			elif self._folder_names.match(remote_path.rsplit("/", 1)[-1]):
+				return "EXCLUDE_FOLDERS"
+
+		if self._group_excluded:
+			return "GROUP"
+
+		return None
+
+	def check_file(self, remote_root: str, remotefile: str) -> Optional[str]:
+		"""
+		:return: The name of the option that excludes the file or None
+		"""
+		if self._exclude_filter is not None and self._exclude_filter.match(remotefile):
+			return "EXCLUDE_FILTER"
+
+		if self._include_filters is not None and not self._include_filters.match(remotefile):
+			return "INCLUDE_FILTERS"
+
+		if remotefile in self._exclude_files_absolute:
+			return "EXCLUDE_FILES"
+
+		if len(self._exclude_files_relative) > 0:
+			prefix = remote_root if remote_root.endswith("/") else remote_root + "/"
+			if remotefile.startswith(prefix) and remotefile[len(prefix):] in self._exclude_files_relative:
+				return "EXCLUDE_FILES"
+
+		return None
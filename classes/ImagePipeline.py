@@ -0,0 +1,265 @@
+import lzma
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from os import cpu_count, SEEK_CUR
+from time import monotonic, perf_counter
+from typing import BinaryIO, Callable, Deque, Dict
+from classes.Metrics import Metrics
+
+
+def _compress_xz(data: bytes, level: int) -> bytes:
+	return lzma.compress(data, lzma.FORMAT_XZ, preset=level)
+
+
+def _compress_gz(data: bytes, level: int) -> bytes:
+	# wbits 31 writes a complete gzip-member
+	compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+	return compressor.compress(data) + compressor.flush()
+
+
+def _compress_raw(data: bytes, level: int) -> bytes:
+	return data
+
+
+class ImagePipeline:
+	"""Reads a device once in large chunks and writes it compressed, the chunks are compressed in parallel
+
+	Every chunk is compressed on its own into a complete xz-stream or gzip-member. Concatenated they
+	form a valid .xz or .gz file that xz, gzip and the python-modules decompress as a whole.
+	lzma and zlib release the GIL while compressing, so a thread per core keeps all cores busy.
+	The compressed chunks are written in their original order, at most max_pending chunks are
+	read ahead, which bounds the memory to about max_pending * chunk_size.
+
+	In sparse-mode chunks of zeros aren't compressed again, the compressed zero-chunk is reused.
+	The raw format writes an uncompressed image, sparse it seeks over every zero-block,
+	which leaves holes in the image on filesystems that support them.
+
+	Attributes:
+		_level		Compression-preset, 0-9 for xz and gz
+		_workers	Compressing threads, defaults to the number of cores
+		_zero_bytes	Bytes of zero-chunks or -blocks that were neither compressed nor written
+	"""
+
+	FORMATS = {
+		"xz": (_compress_xz, 1),
+		"gz": (_compress_gz, 6),
+		"raw": (_compress_raw, 0)
+	}
+
+	SPARSE_BLOCK_SIZE = 64 * 1024
+
+	_format = None
+	""":type: str"""
+
+	_level = None
+	""":type: int"""
+
+	_chunk_size = 16 * 1024 * 1024
+	""":type: int"""
+
+	_workers = 1
+	""":type: int"""
+
+	_max_pending = 2
+	""":type: int"""
+
+	_sparse = False
+	""":type: bool"""
+
+	_zeros = None
+	""":type: bytes"""
+
+	_compressed_zeros = None
+	""":type: Dict[int, bytes]"""
+
+	_zero_bytes = 0
+	""":type: int"""
+
+	_bytes_read = 0
+	""":type: int"""
+
+	_bytes_written = 0
+	""":type: int"""
+
+	_seconds = 0.0
+	""":type: float"""
+
+	_metrics = None
+	""":type: Metrics"""
+
+	def __init__(self, fmt: str, level: int=None, chunk_size: int=None, workers: int=None, sparse: bool=False):
+		if fmt not in self.FORMATS:
+			raise Exception("Compression-format '{}' can't be streamed, use one of {}".format(
+				fmt, ", ".join(self.FORMATS.keys())
+			))
+
+		self._format = fmt
+		self._level = level if level is not None else self.FORMATS[fmt][1]
+
+		if chunk_size is not None:
+			self._chunk_size = chunk_size
+
+		self._workers = workers if workers is not None else (cpu_count() or 1)
+		self._max_pending = self._workers * 2
+		self._sparse = sparse
+		self._zeros = bytes(max(self._chunk_size, self.SPARSE_BLOCK_SIZE))
+		self._compressed_zeros = {}
+
+	@staticmethod
+	def is_streamable(fmt: str) -> bool:
+		return fmt in ImagePipeline.FORMATS
+
+	def get_extension(self) -> str:
+		return "" if self._format == "raw" else "." + self._format
+
+	def get_zero_bytes(self) -> int:
+		return self._zero_bytes
+
+	def get_sparse_block_size(self) -> int:
+		"""The granularity zeros are skipped in: blocks for a raw image, whole chunks when compressing"""
+		return self.SPARSE_BLOCK_SIZE if self._format == "raw" else self._chunk_size
+
+	def is_zero(self, data: bytes) -> bool:
+		return data == self._zeros[:len(data)]
+
+	def get_bytes_read(self) -> int:
+		return self._bytes_read
+
+	def get_bytes_written(self) -> int:
+		return self._bytes_written
+
+	def get_workers(self) -> int:
+		return self._workers
+
+	def set_workers(self, workers: int):
+		self._workers = workers
+		self._max_pending = workers * 2
+
+	def get_seconds(self) -> float:
+		return self._seconds
+
+	def set_metrics(self, metrics: Metrics):
+		"""Gets the time spent reading, compressing and writing, and the compression-time per chunk"""
+		self._metrics = metrics
+
+	@staticmethod
+	def read_chunk(source: BinaryIO, chunk_size: int) -> bytes:
+		"""Reads a full chunk, devices and channels may return less per read"""
+		data = source.read(chunk_size)
+		if data is None or len(data) == 0:
+			return b""
+
+		parts = [data]
+		size = len(data)
+		while size < chunk_size:
+			data = source.read(chunk_size - size)
+			if data is None or len(data) == 0:
+				break
+			parts.append(data)
+			size += len(data)
+
+		return parts[0] if len(parts) == 1 else b"".join(parts)
+
+	def _compress(self, data: bytes) -> bytes:
+		if self._metrics is None:
+			return self.FORMATS[self._format][0](data, self._level)
+
+		start = perf_counter()
+		compressed = self.FORMATS[self._format][0](data, self._level)
+		seconds = perf_counter() - start
+		self._metrics.observe("chunk_compress_seconds", seconds)
+		self._metrics.inc("compress_seconds_total", seconds)
+		return compressed
+
+	def _write(self, future: Future, target: BinaryIO):
+		data = future.result()
+		start = perf_counter()
+		if self._format == "raw" and self._sparse:
+			self._write_sparse(data, target)
+		else:
+			target.write(data)
+			self._bytes_written += len(data)
+		if self._metrics is not None:
+			self._metrics.inc("write_seconds_total", perf_counter() - start)
+
+	def _write_sparse(self, data: bytes, target: BinaryIO):
+		"""Writes the non-zero runs of blocks and seeks over the others"""
+		block_size = self.SPARSE_BLOCK_SIZE
+		view = memoryview(data)
+		start = 0
+
+		for offset in range(0, len(data), block_size):
+			block = data[offset:offset + block_size]
+			if self.is_zero(block):
+				if start < offset:
+					target.write(view[start:offset])
+					self._bytes_written += offset - start
+				target.seek(len(block), SEEK_CUR)
+				self._zero_bytes += len(block)
+				start = offset + len(block)
+
+		if start < len(data):
+			target.write(view[start:])
+			self._bytes_written += len(data) - start
+
+	def _submit(self, executor: ThreadPoolExecutor, data: bytes) -> Future:
+		if self._format == "raw" or not (self._sparse and self.is_zero(data)):
+			return executor.submit(self._compress, data)
+
+		if len(data) not in self._compressed_zeros:
+			self._compressed_zeros[len(data)] = self._compress(data)
+
+		self._zero_bytes += len(data)
+
+		future = Future()
+		future.set_result(self._compressed_zeros[len(data)])
+		return future
+
+	def run(self, source: BinaryIO, target: BinaryIO, total: int=None, progress: Callable=None):
+		"""
+		:param total: The size of source, only passed on to progress
+		:param progress: Called with (bytes_read, total) after every chunk
+		"""
+		start = monotonic()
+		self._bytes_read = 0
+		self._bytes_written = 0
+		self._zero_bytes = 0
+
+		pending = deque()
+		""":type: Deque[Future]"""
+
+		with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="compress") as executor:
+			try:
+				while True:
+					read_start = perf_counter()
+					data = self.read_chunk(source, self._chunk_size)
+					if self._metrics is not None:
+						self._metrics.inc("read_seconds_total", perf_counter() - read_start)
+					if len(data) == 0:
+						break
+
+					self._bytes_read += len(data)
+					pending.append(self._submit(executor, data))
+
+					while len(pending) >= self._max_pending:
+						self._write(pending.popleft(), target)
+
+					if progress is not None:
+						progress(self._bytes_read, total)
+
+				while len(pending) > 0:
+					self._write(pending.popleft(), target)
+
+				# Trailing holes have to be allocated by the size of the file
+				target.truncate(target.tell())
+			finally:
+				for future in pending:
+					future.cancel()
+
+		self._seconds = monotonic() - start
+
+		if self._metrics is not None:
+			self._metrics.inc("read_bytes_total", self._bytes_read)
+			self._metrics.inc("written_bytes_total", self._bytes_written)
+			self._metrics.inc("zero_bytes_total", self._zero_bytes)
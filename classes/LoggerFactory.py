@@ -1,10 +1,22 @@
+import atexit
 from enum import Enum
-from logging import Formatter, Logger, getLogger, DEBUG, FileHandler, StreamHandler
+from itertools import count
+from logging import Filter, Formatter, Handler, Logger, LogRecord, addLevelName, getLogger, DEBUG, ERROR, \
+	FileHandler, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from queue import Queue
 from sys import stdout, stderr
-from typing import List
+from threading import Event, Thread
+from time import monotonic
+from typing import Dict, List
 from fileutilslib.misclib.helpertools import string_is_empty, is_sequence_with_any_elements
 
+FILES = 15
+"""Level of the lines that are logged per file, between DEBUG and INFO"""
+
+addLevelName(FILES, "FILES")
+
 
 class LoggerHandlerType(Enum):
 	Nope = 1
@@ -17,6 +29,125 @@ class LoggerStdStreamType(Enum):
 	StdErr = 2
 
 
+class LoggerFileLines(Enum):
+	"""What a handler does with the lines of the level FILES"""
+	All = 1
+	Sample = 2
+	Summary = 3
+
+
+class FileLinesFilter(Filter):
+	"""Lets every <sample>th line of the level FILES pass or none of them, other levels always pass"""
+
+	_filelines = None
+	""":type: LoggerFileLines"""
+
+	_sample = 1
+	""":type: int"""
+
+	_counter = None
+	""":type: count"""
+
+	def __init__(self, filelines: LoggerFileLines, sample: int=1):
+		super().__init__()
+		self._filelines = filelines
+		self._sample = max(1, sample)
+		self._counter = count()
+
+	def filter(self, record: LogRecord) -> bool:
+		if record.levelno != FILES or self._filelines == LoggerFileLines.All:
+			return True
+		if self._filelines == LoggerFileLines.Summary:
+			return False
+		return next(self._counter) % self._sample == 0
+
+
+class BatchedFileHandler(FileHandler):
+	"""A FileHandler that flushes every batch_size lines instead of after each one
+
+	Lines of the level ERROR and above are flushed at once, so they reach the file even if the
+	process dies right after. The file is written through a buffer of 1MB. A thread flushes the
+	pending lines every flush_interval seconds, so the last lines of a run don't wait for the next
+	line, which may come hours later in a daemon.
+	"""
+
+	_batch_size = 1
+	""":type: int"""
+
+	_flush_interval = 2.0
+	""":type: float"""
+
+	_pending = 0
+	""":type: int"""
+
+	_last_flush = 0.0
+	""":type: float"""
+
+	_closed = None
+	""":type: Event"""
+
+	_flusher = None
+	""":type: Thread"""
+
+	def __init__(self, filename: str, mode: str="w", batch_size: int=256, flush_interval: float=2.0):
+		self._batch_size = batch_size
+		self._flush_interval = flush_interval
+		self._pending = 0
+		self._last_flush = monotonic()
+		super().__init__(filename, mode=mode)
+
+		self._closed = Event()
+		self._flusher = Thread(target=self._flush_periodically, name="logflush", daemon=True)
+		self._flusher.start()
+
+	def _flush_periodically(self):
+		while not self._closed.wait(self._flush_interval):
+			self.acquire()
+			try:
+				if self._pending > 0:
+					self.flush()
+			finally:
+				self.release()
+
+	def _open(self):
+		return open(self.baseFilename, self.mode, 1024 * 1024, encoding=self.encoding, errors=self.errors)
+
+	def emit(self, record: LogRecord):
+		try:
+			self.stream.write(self.format(record) + self.terminator)
+			self._pending += 1
+			if (
+				self._pending >= self._batch_size or
+				record.levelno >= ERROR or
+				monotonic() - self._last_flush >= self._flush_interval
+			):
+				self.flush()
+		except RecursionError:
+			raise
+		except Exception:
+			self.handleError(record)
+
+	def flush(self):
+		super().flush()
+		self._pending = 0
+		self._last_flush = monotonic()
+
+	def close(self):
+		self._closed.set()
+		super().close()
+
+
+class DeferredQueueHandler(QueueHandler):
+	"""Queues the records as they are, QueueHandler would merge the message with its args beforehand
+
+	The %-formatting happens in the thread of the QueueListener then, so the args must not be
+	changed after they were logged.
+	"""
+
+	def prepare(self, record: LogRecord) -> LogRecord:
+		return record
+
+
 class LoggerFormatterType(Enum):
 	User = 1
 	FmtLong = 2
@@ -60,6 +191,18 @@ class LoggerHandlerConfig:
 	_filefolder = None
 	""":type: str"""
 
+	_asynchronous = False
+	""":type: bool"""
+
+	_batch_size = 1
+	""":type: int"""
+
+	_filelines = LoggerFileLines.All
+	""":type: LoggerFileLines"""
+
+	_file_sample = 1
+	""":type: int"""
+
 	def __init__(
 		self,
 		level: int,
@@ -88,10 +231,46 @@ class LoggerHandlerConfig:
 
 	def get_filefolder(self): return self._filefolder
 
-	def create_handler(self, handlername):
+	def is_asynchronous(self): return self._asynchronous
+
+	def get_batch_size(self): return self._batch_size
+
+	def get_filelines(self): return self._filelines
+
+	def get_file_sample(self): return self._file_sample
+
+	def set_pipeline(self, asynchronous: bool, batch_size: int=1):
+		"""
+		:param asynchronous: The handler is fed by a QueueListener-thread instead of the logging thread
+		:param batch_size: Lines a file-handler collects before it flushes them
+		"""
+		self._asynchronous = asynchronous
+		self._batch_size = batch_size
+
+	def set_filelines(self, filelines: LoggerFileLines, sample: int=1):
+		"""
+		:param sample: With LoggerFileLines.Sample every sample-th line of the level FILES is kept
+		"""
+		self._filelines = filelines
+		self._file_sample = sample
+
+	def get_effective_level(self) -> int:
+		"""The lowest level the handler logs"""
+		if self._filelines == LoggerFileLines.Summary and self._level <= FILES:
+			return FILES + 1
+		return self._level
+
+	def create_handler(self, handlername, append: bool=False):
+		"""
+		:param append: Continue the logfile instead of starting it anew, for a reloaded logger
+		"""
+		mode = "a" if append else "w"
 		if self._handlertype == LoggerHandlerType.FileHandler:
 			p = Path(self._filefolder, "{}.log".format(handlername))
-			handler = FileHandler(str(p), mode="w")
+			if self._batch_size > 1:
+				handler = BatchedFileHandler(str(p), mode, self._batch_size)
+			else:
+				handler = FileHandler(str(p), mode=mode)
 		else:
 			if self._stdstream == LoggerStdStreamType.StdOut:
 				handler = StreamHandler(stdout)
@@ -100,6 +279,8 @@ class LoggerHandlerConfig:
 			else:
 				raise Exception("Stdstream {} not supported".format(self._stdstream))
 		handler.setLevel(self._level)
+		if self._filelines != LoggerFileLines.All:
+			handler.addFilter(FileLinesFilter(self._filelines, self._file_sample))
 		self._formatter.set_format(self._formatter_user_fmt, handler)
 		return handler
 
@@ -149,12 +330,23 @@ class LoggerHandlerConfig:
 
 
 class LoggerFactory:
+	"""
+	Attributes:
+		_listeners	Threads that feed the asynchronous handlers, stopped when the interpreter exits
+		_logger_listeners	The listener of each logger with asynchronous handlers, by its name
+	"""
 
 	_nameprefix = None
 	""":type: str"""
 
 	_loggers = {}
 
+	_listeners = []
+	""":type: List[QueueListener]"""
+
+	_logger_listeners = {}
+	""":type: Dict[str, QueueListener]"""
+
 	def __init__(self, nameprefix: str):
 		# logging.basicConfig(filename='example.log', level=logging.DEBUG)
 		if string_is_empty(nameprefix):
@@ -164,8 +356,13 @@ class LoggerFactory:
 	def addlogger(
 		self,
 		name: str,
-		configs: List[LoggerHandlerConfig]
+		configs: List[LoggerHandlerConfig],
+		append: bool=False
 	) -> Logger:
+		"""Creates a logger with a handler per config, or returns the logger of that name created before
+
+		:param append: The file-handlers continue their logfiles, for a logger that replaces a removed one
+		"""
 
 		if not is_sequence_with_any_elements(configs):
 			raise Exception("configs needs to be passed")
@@ -179,11 +376,69 @@ class LoggerFactory:
 			return self._loggers[loggername]
 
 		logger = getLogger(loggername)
-		logger.setLevel(DEBUG)
+		# Lines below every handler's level aren't even formatted
+		logger.setLevel(min(config.get_effective_level() for config in configs))
+
+		queued = []
+		""":type: List[Handler]"""
+
+		for config in configs:  # type: LoggerHandlerConfig
+			handler = config.create_handler(loggername, append)
+			if config.is_asynchronous():
+				queued.append(handler)
+			else:
+				logger.addHandler(handler)
+
+		if len(queued) > 0:
+			# Unbounded, logging never blocks the thread that logs
+			queue = Queue()
+			listener = QueueListener(queue, *queued, respect_handler_level=True)
+			listener.start()
+			logger.addHandler(DeferredQueueHandler(queue))
 
-		for config in configs:  # type: LoggerConfig
-			logger.addHandler(config.create_handler(loggername))
+			if len(LoggerFactory._listeners) == 0:
+				atexit.register(LoggerFactory.shutdown)
+			LoggerFactory._listeners.append(listener)
+			LoggerFactory._logger_listeners[loggername] = listener
 
 		self._loggers[loggername] = logger
 
 		return self._loggers[loggername]
+
+	def removelogger(self, logger: Logger):
+		"""Writes the pending lines and closes the handlers of a logger, so addlogger creates it anew"""
+		if self._loggers.get(logger.name) is logger:
+			del self._loggers[logger.name]
+
+		listener = LoggerFactory._logger_listeners.pop(logger.name, None)
+		if listener is not None:
+			listener.stop()
+			LoggerFactory._listeners.remove(listener)
+			for handler in listener.handlers:
+				handler.close()
+
+		for handler in list(logger.handlers):
+			logger.removeHandler(handler)
+			handler.close()
+
+	@staticmethod
+	def flush(logger: Logger):
+		"""Writes the pending lines of a logger, after its asynchronous handlers took the queued ones"""
+		listener = LoggerFactory._logger_listeners.get(logger.name)
+		if listener is not None:
+			listener.queue.join()
+			for handler in listener.handlers:
+				handler.flush()
+		for handler in logger.handlers:
+			handler.flush()
+
+	@staticmethod
+	def shutdown():
+		"""Writes the queued lines of the asynchronous handlers and stops their threads"""
+		while len(LoggerFactory._listeners) > 0:
+			listener = LoggerFactory._listeners.pop()
+			listener.stop()
+			for handler in listener.handlers:
+				handler.flush()
+		# flush() must not wait for a stopped listener
+		LoggerFactory._logger_listeners.clear()
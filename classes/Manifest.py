@@ -0,0 +1,152 @@
+import sqlite3
+from os import makedirs, replace
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional
+
+
+ManifestRecord = NamedTuple("ManifestRecord", [("size", int), ("mtime", float), ("mode", int), ("hash", Optional[str])])
+
+
+class Manifest:
+	"""Index of the remote files a unit transferred or confirmed in its last successful run
+
+	The records are loaded once into memory, so deciding whether a remote file has to be
+	transferred needs no access to the local disk. The records of the current run are
+	collected in memory, too, and only written back by save(), which should be called
+	after a successful run only.
+
+	Attributes:
+		_previous	Records of the last successful run, keyed by the remote path
+		_current	Records of the files transferred or confirmed unchanged in this run
+		_roots		Remote paths of the processed entries, used to detect deleted files
+	"""
+
+	_filepath = None
+	""":type: Path"""
+
+	_previous = None
+	""":type: Dict[str, ManifestRecord]"""
+
+	_current = None
+	""":type: Dict[str, ManifestRecord]"""
+
+	_roots = None
+	""":type: List[str]"""
+
+	_new = 0
+	""":type: int"""
+
+	_changed = 0
+	""":type: int"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, filepath: Path):
+		self._filepath = filepath
+		self._previous = {}
+		self._current = {}
+		self._roots = []
+		self._new = 0
+		self._changed = 0
+		self._lock = Lock()
+
+	def get_filepath(self) -> Path:
+		return self._filepath
+
+	def __len__(self):
+		return len(self._previous)
+
+	def load(self):
+		self._previous = {}
+
+		if not self._filepath.exists():
+			return
+
+		with sqlite3.connect(str(self._filepath)) as con:
+			for path, size, mtime, mode, filehash in con.execute(
+				"SELECT path, size, mtime, mode, hash FROM files"
+			):
+				self._previous[path] = ManifestRecord(size, mtime, mode, filehash)
+		con.close()
+
+	def get(self, remotepath: str) -> Optional[ManifestRecord]:
+		return self._previous.get(remotepath)
+
+	def add_root(self, remotepath: str):
+		self._roots.append(remotepath.rstrip("/"))
+
+	def confirm(self, remotepath: str):
+		"""Marks a file that was skipped because it didn't change since the last run"""
+		with self._lock:
+			if remotepath in self._previous and remotepath not in self._current:
+				self._current[remotepath] = self._previous[remotepath]
+
+	def record(self, remotepath: str, size: int, mtime: float, mode: int, filehash: str=None):
+		"""Marks a file that was transferred in this run, may be called from worker-threads"""
+		with self._lock:
+			if remotepath not in self._current:
+				if remotepath in self._previous:
+					self._changed += 1
+				else:
+					self._new += 1
+			self._current[remotepath] = ManifestRecord(size, mtime, mode, filehash)
+
+	def get_new_count(self) -> int:
+		return self._new
+
+	def get_changed_count(self) -> int:
+		return self._changed
+
+	def get_unchanged_count(self) -> int:
+		return len(self._current) - self._new - self._changed
+
+	def get_deleted(self) -> List[str]:
+		"""Files of the last run below one of the processed roots that weren't seen in this run"""
+		deleted = []
+		for path in self._previous:
+			if path not in self._current and self._is_below_root(path):
+				deleted.append(path)
+		return deleted
+
+	def _is_below_root(self, path: str) -> bool:
+		for root in self._roots:
+			if path == root or path.startswith(root + "/"):
+				return True
+		return False
+
+	def save(self):
+		"""Writes the records of this run to a temporary database and swaps it in"""
+		records = {}
+
+		# Files of entries that weren't processed in this run (skipped, other group)
+		# keep their records
+		for path, record in self._previous.items():
+			if not self._is_below_root(path):
+				records[path] = record
+		records.update(self._current)
+
+		if not self._filepath.parent.exists():
+			makedirs(str(self._filepath.parent))
+
+		tmppath = self._filepath.with_name(self._filepath.name + ".tmp")
+		if tmppath.exists():
+			tmppath.unlink()
+
+		con = sqlite3.connect(str(tmppath))
+		try:
+			with con:
+				con.execute(
+					"CREATE TABLE files ("
+					"path TEXT PRIMARY KEY, size INTEGER, mtime REAL, mode INTEGER, hash TEXT"
+					")"
+				)
+				con.executemany(
+					"INSERT INTO files (path, size, mtime, mode, hash) VALUES (?, ?, ?, ?, ?)",
+					((path, r.size, r.mtime, r.mode, r.hash) for path, r in records.items())
+				)
+		finally:
+			con.close()
+
+		replace(str(tmppath), str(self._filepath))
@@ -0,0 +1,223 @@
+import json
+from contextlib import contextmanager
+from os import replace
+from random import Random
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+	"""Count, sum and a bounded reservoir of samples, for the percentiles of a run
+
+	Up to max_samples observations are kept as they are, afterwards each new one replaces a random
+	sample with decreasing probability, so the reservoir stays an even sample of the whole run.
+	"""
+
+	_count = 0
+	""":type: int"""
+
+	_sum = 0.0
+	""":type: float"""
+
+	_samples = None
+	""":type: List[float]"""
+
+	_max_samples = 0
+	""":type: int"""
+
+	_random = None
+	""":type: Random"""
+
+	def __init__(self, max_samples: int=10000):
+		self._samples = []
+		self._max_samples = max_samples
+		self._random = Random(0)
+
+	def observe(self, value: float):
+		self._count += 1
+		self._sum += value
+
+		if len(self._samples) < self._max_samples:
+			self._samples.append(value)
+		else:
+			index = self._random.randrange(self._count)
+			if index < self._max_samples:
+				self._samples[index] = value
+
+	def get_count(self) -> int:
+		return self._count
+
+	def get_sum(self) -> float:
+		return self._sum
+
+	def percentile(self, p: float) -> float:
+		"""
+		:param p: 0 to 100
+		"""
+		if len(self._samples) == 0:
+			return 0.0
+		ordered = sorted(self._samples)
+		return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Metrics:
+	"""Thread-safe counters and histograms of a unit-run, written as json or as a Prometheus-textfile
+
+	A metric is identified by its name and its labels, the labels passed to the constructor are
+	added to every metric when it's written. Names follow the Prometheus-conventions:
+	counters end with _total, durations are seconds.
+	"""
+
+	QUANTILES = (0.5, 0.95, 0.99)
+
+	_prefix = None
+	""":type: str"""
+
+	_labels = None
+	""":type: Dict[str, str]"""
+
+	_counters = None
+	""":type: Dict[_Key, float]"""
+
+	_histograms = None
+	""":type: Dict[_Key, Histogram]"""
+
+	_lock = None
+	""":type: Lock"""
+
+	_started = 0.0
+	""":type: float"""
+
+	def __init__(self, labels: Dict[str, str]=None, prefix: str="backthefooup"):
+		self._prefix = prefix
+		self._labels = dict(labels) if labels is not None else {}
+		self._counters = {}
+		self._histograms = {}
+		self._lock = Lock()
+		self._started = perf_counter()
+
+	@staticmethod
+	def _key(name: str, labels: Dict[str, str]) -> _Key:
+		return name, tuple(sorted(labels.items()))
+
+	def get_labels(self) -> Dict[str, str]:
+		return self._labels
+
+	def get_elapsed(self) -> float:
+		return perf_counter() - self._started
+
+	def inc(self, name: str, value: float=1, **labels):
+		key = self._key(name, labels)
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+
+	def observe(self, name: str, value: float, **labels):
+		key = self._key(name, labels)
+		with self._lock:
+			histogram = self._histograms.get(key)
+			if histogram is None:
+				histogram = self._histograms[key] = Histogram()
+			histogram.observe(value)
+
+	@contextmanager
+	def timer(self, name: str, **labels) -> Iterator[None]:
+		"""Adds the duration of the block to the counter <name>_seconds_total"""
+		start = perf_counter()
+		try:
+			yield
+		finally:
+			self.inc(name + "_seconds_total", perf_counter() - start, **labels)
+
+	def get_counter(self, name: str, **labels) -> float:
+		return self._counters.get(self._key(name, labels), 0)
+
+	def get_counters(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+		"""All label-combinations of a counter"""
+		return {key[1]: value for key, value in self._counters.items() if key[0] == name}
+
+	def get_histogram(self, name: str, **labels) -> Histogram:
+		histogram = self._histograms.get(self._key(name, labels))
+		return histogram if histogram is not None else Histogram(0)
+
+	def to_dict(self) -> Dict:
+		with self._lock:
+			return {
+				"labels": self._labels,
+				"elapsed_seconds": self.get_elapsed(),
+				"counters": [
+					{"name": name, "labels": dict(labels), "value": value}
+					for (name, labels), value in sorted(self._counters.items())
+				],
+				"histograms": [
+					{
+						"name": name,
+						"labels": dict(labels),
+						"count": histogram.get_count(),
+						"sum": histogram.get_sum(),
+						"quantiles": {str(q): histogram.percentile(q * 100) for q in self.QUANTILES}
+					}
+					for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+				]
+			}
+
+	@staticmethod
+	def _format_labels(labels: Dict[str, str]) -> str:
+		if len(labels) == 0:
+			return ""
+		return "{" + ",".join('{}="{}"'.format(
+			k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+		) for k, v in sorted(labels.items())) + "}"
+
+	def to_prometheus(self) -> List[Tuple[str, str, str]]:
+		"""The samples of all metrics in the Prometheus text-format
+
+		:return: Tuples of metric-family, its type and the line of the sample
+		"""
+		samples = []
+		with self._lock:
+			for (name, labels), value in sorted(self._counters.items()):
+				family = "{}_{}".format(self._prefix, name)
+				samples.append((family, "counter", "{}{} {}".format(
+					family, self._format_labels(dict(self._labels, **dict(labels))), value
+				)))
+
+			for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+				family = "{}_{}".format(self._prefix, name)
+				labels = dict(self._labels, **dict(labels))
+				for q in self.QUANTILES:
+					samples.append((family, "summary", "{}{} {}".format(
+						family, self._format_labels(dict(labels, quantile=str(q))), histogram.percentile(q * 100)
+					)))
+				samples.append((family, "summary", "{}_sum{} {}".format(family, self._format_labels(labels), histogram.get_sum())))
+				samples.append((family, "summary", "{}_count{} {}".format(family, self._format_labels(labels), histogram.get_count())))
+
+		family = "{}_run_seconds".format(self._prefix)
+		samples.append((family, "gauge", "{}{} {}".format(family, self._format_labels(self._labels), self.get_elapsed())))
+
+		return samples
+
+	@staticmethod
+	def write_json(path: str, metrics: List["Metrics"]):
+		tmpfile = path + ".tmp"
+		with open(tmpfile, "w") as f:
+			json.dump([m.to_dict() for m in metrics], f, indent=1)
+		replace(tmpfile, path)
+
+	@staticmethod
+	def write_prometheus(path: str, metrics: List["Metrics"]):
+		"""Writes a textfile for the textfile-collector of the node-exporter, atomically like it demands"""
+		families = {}
+		for m in metrics:
+			for family, metrictype, line in m.to_prometheus():
+				families.setdefault(family, (metrictype, []))[1].append(line)
+
+		tmpfile = path + ".tmp"
+		with open(tmpfile, "w") as f:
+			for family in sorted(families.keys()):
+				metrictype, lines = families[family]
+				f.write("# TYPE {} {}\n".format(family, metrictype))
+				f.write("\n".join(lines) + "\n")
+		replace(tmpfile, path)
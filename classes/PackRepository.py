@@ -0,0 +1,429 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+from classes.ChunkStore import ChunkStore
+from classes.ImagePipeline import ImagePipeline
+from classes.Manifest import ManifestRecord
+from classes.Metrics import Metrics
+
+
+class PackRepositoryException(Exception):
+	pass
+
+
+class PackRepository:
+	"""Content-addressed repository of file-contents, shared by all entries and hosts that point to it
+
+	Files are split into chunks of chunk_size bytes, each distinct chunk is stored once as a blob,
+	appended to a pack of up to pack_size bytes, so many small files don't become many small files
+	again. index.sqlite maps the blake2b-hash of a blob to its pack, offset and length, and is
+	looked up before a chunk is stored. A run is described by a tree that lists the chunk-hashes of
+	every file, any tree can be restored.
+
+	packs/<2 hex-digits>/<uuid>.pack
+	trees/<name>/<timestamp>.json:
+		{"name", "created", "files": [{"path", "remote", "size", "mtime", "mode", "chunks": [hex, ...]}, ...]}
+
+	Blobs are appended under a lock, hashing and compression happen in the calling threads. The
+	index-rows of a pack are kept in memory until the pack is synced and sealed, then they are
+	inserted and committed at once, so a committed blob is always complete. The index is only
+	locked for that short write, several units or processes can store into the same root.
+	"""
+
+	_root = None
+	""":type: Path"""
+
+	_chunk_size = 4 * 1024 * 1024
+	""":type: int"""
+
+	_pack_size = 64 * 1024 * 1024
+	""":type: int"""
+
+	_format = "raw"
+	""":type: str"""
+
+	_level = 0
+	""":type: int"""
+
+	_lock = None
+	""":type: Lock"""
+
+	_index = None
+	""":type: sqlite3.Connection"""
+
+	_pack = None
+	""":type: BinaryIO"""
+
+	_pack_name = None
+	""":type: str"""
+
+	_pending = None
+	""":type: Dict[str, Tuple[str, int, int, int, str]]"""
+
+	_new_blobs = 0
+	""":type: int"""
+
+	_known_blobs = 0
+	""":type: int"""
+
+	_bytes_written = 0
+	""":type: int"""
+
+	_metrics = None
+	""":type: Metrics"""
+
+	def __init__(self, root: str, chunk_size: int=None, pack_size: int=None, fmt: str=None, level: int=None):
+		self._root = Path(root)
+
+		if chunk_size is not None:
+			self._chunk_size = chunk_size
+		if pack_size is not None:
+			self._pack_size = pack_size
+
+		if fmt is not None:
+			if fmt not in ChunkStore.DECOMPRESS:
+				raise PackRepositoryException("Blobs can't be compressed as '{}', use one of {}".format(
+					fmt, ", ".join(ChunkStore.DECOMPRESS.keys())
+				))
+			self._format = fmt
+
+		self._level = level if level is not None else ImagePipeline.FORMATS[self._format][1]
+		self._lock = Lock()
+		self._pending = {}
+
+	def get_root(self) -> Path:
+		return self._root
+
+	def get_new_blobs(self) -> int:
+		return self._new_blobs
+
+	def get_known_blobs(self) -> int:
+		return self._known_blobs
+
+	def get_bytes_written(self) -> int:
+		return self._bytes_written
+
+	def set_metrics(self, metrics: Metrics):
+		"""Gets the time per chunk for hashing and storing it, and the new and known blobs"""
+		self._metrics = metrics
+
+	def get_pack_path(self, pack: str) -> Path:
+		return self._root / "packs" / pack[:2] / (pack + ".pack")
+
+	def get_tree_dir(self, name: str) -> Path:
+		return self._root / "trees" / name
+
+	@staticmethod
+	def hash(data: bytes) -> str:
+		return blake2b(data, digest_size=32).hexdigest()
+
+	def _open_index(self):
+		"""Called with the lock held"""
+		if self._index is None:
+			self._root.mkdir(parents=True, exist_ok=True)
+			self._index = sqlite3.connect(str(self._root / "index.sqlite"), timeout=60, check_same_thread=False)
+			self._index.execute(
+				"CREATE TABLE IF NOT EXISTS blobs "
+				"(hash TEXT PRIMARY KEY, pack TEXT, offset INTEGER, length INTEGER, size INTEGER, format TEXT)"
+			)
+			self._index.commit()
+
+	def _is_known(self, digest: str) -> bool:
+		"""Called with the lock held"""
+		if digest in self._pending:
+			return True
+		self._open_index()
+		return self._index.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None
+
+	def _append(self, data: bytes) -> Tuple[str, int]:
+		"""Appends data to the current pack, called with the lock held
+
+		:return: The pack and the offset of data
+		"""
+		if self._pack is not None and self._pack.tell() + len(data) > self._pack_size:
+			self._seal()
+
+		if self._pack is None:
+			self._pack_name = uuid4().hex
+			path = self.get_pack_path(self._pack_name)
+			path.parent.mkdir(parents=True, exist_ok=True)
+			self._pack = open(str(path), "wb")
+
+		offset = self._pack.tell()
+		self._pack.write(data)
+		return self._pack_name, offset
+
+	def _seal(self):
+		"""Syncs and closes the current pack and commits its blobs to the index, called with the lock held"""
+		if self._pack is not None:
+			self._pack.flush()
+			os.fsync(self._pack.fileno())
+			self._pack.close()
+			self._pack = None
+			self._pack_name = None
+
+		if len(self._pending) > 0:
+			self._open_index()
+			with self._index:
+				# Another repository on the same root may have stored the same chunk meanwhile
+				self._index.executemany(
+					"INSERT OR IGNORE INTO blobs (hash, pack, offset, length, size, format) VALUES (?, ?, ?, ?, ?, ?)",
+					[(digest,) + row for digest, row in self._pending.items()]
+				)
+			self._pending = {}
+
+	def store(self, data: bytes) -> str:
+		"""Stores a chunk unless a blob with its hash exists already
+
+		:return: The hash of the chunk
+		"""
+		start = perf_counter()
+		digest = self.hash(data)
+		if self._metrics is not None:
+			self._metrics.observe("chunk_hash_seconds", perf_counter() - start)
+
+		with self._lock:
+			known = self._is_known(digest)
+
+		if known:
+			with self._lock:
+				self._known_blobs += 1
+			if self._metrics is not None:
+				self._metrics.inc("blobs_total", state="known")
+			return digest
+
+		start = perf_counter()
+		compressed = ImagePipeline.FORMATS[self._format][0](data, self._level)
+
+		with self._lock:
+			# Another thread may have stored the same chunk in the meantime
+			if self._is_known(digest):
+				self._known_blobs += 1
+				state = "known"
+			else:
+				pack, offset = self._append(compressed)
+				self._pending[digest] = (pack, offset, len(compressed), len(data), self._format)
+				self._new_blobs += 1
+				self._bytes_written += len(compressed)
+				state = "new"
+
+		if self._metrics is not None:
+			self._metrics.observe("chunk_store_seconds", perf_counter() - start)
+			self._metrics.inc("blobs_total", state=state)
+			if state == "new":
+				self._metrics.inc("repository_written_bytes_total", len(compressed))
+
+		return digest
+
+	def has_blobs(self, digests: List[str]) -> bool:
+		"""Whether every one of the blobs is in the index"""
+		with self._lock:
+			return all(self._is_known(digest) for digest in digests)
+
+	def store_file(self, localfile: Path) -> List[str]:
+		"""
+		:return: The hashes of the chunks of localfile
+		"""
+		chunks = []
+		with open(str(localfile), "rb") as f:
+			for data in iter(lambda: ImagePipeline.read_chunk(f, self._chunk_size), b""):
+				chunks.append(self.store(data))
+		return chunks
+
+	def commit(self):
+		"""Makes the blobs stored so far durable, the current pack is sealed"""
+		with self._lock:
+			self._seal()
+			if self._index is not None:
+				self._index.commit()
+
+	def close(self):
+		self.commit()
+		with self._lock:
+			if self._index is not None:
+				self._index.close()
+				self._index = None
+
+	def write_tree(self, name: str, files: List[Dict]) -> Path:
+		"""Commits the blobs and writes the tree of a run
+
+		:param files: Dicts with path, remote, size, mtime, mode and chunks
+		:return: The path of the tree
+		"""
+		self.commit()
+
+		created = datetime.now()
+		treedir = self.get_tree_dir(name)
+		treedir.mkdir(parents=True, exist_ok=True)
+
+		stamp = created.strftime("%Y%m%d-%H%M%S")
+		tree = treedir / (stamp + ".json")
+		count = 1
+		while tree.exists():
+			tree = treedir / "{}-{}.json".format(stamp, count)
+			count += 1
+
+		tmpfile = tree.with_name(tree.name + ".tmp")
+		with open(str(tmpfile), "w") as f:
+			json.dump({
+				"name": name,
+				"created": created.isoformat(),
+				"files": sorted(files, key=lambda record: record["path"])
+			}, f)
+		os.replace(str(tmpfile), str(tree))
+
+		return tree
+
+	def get_latest_tree(self, name: str) -> Optional[Path]:
+		treedir = self.get_tree_dir(name)
+		if not treedir.is_dir():
+			return None
+		trees = sorted(treedir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+		return trees[-1] if len(trees) > 0 else None
+
+	@staticmethod
+	def load_tree(treepath: str) -> Dict:
+		with open(treepath) as f:
+			tree = json.load(f)
+
+		if "files" not in tree:
+			raise PackRepositoryException("Tree '{}' has no key 'files'".format(treepath))
+
+		return tree
+
+	def read_blob(self, digest: str) -> bytes:
+		"""
+		:raises PackRepositoryException: If the blob is unknown or doesn't match its hash
+		"""
+		with self._lock:
+			self._open_index()
+			row = self._index.execute(
+				"SELECT pack, offset, length, size, format FROM blobs WHERE hash = ?", (digest,)
+			).fetchone()
+
+		if row is None:
+			raise PackRepositoryException("Blob {} is not in the index".format(digest))
+
+		pack, offset, length, size, fmt = row
+		with open(str(self.get_pack_path(pack)), "rb") as f:
+			f.seek(offset)
+			data = ChunkStore.DECOMPRESS[fmt](f.read(length))
+
+		if len(data) != size or self.hash(data) != digest:
+			raise PackRepositoryException("Blob {} in pack {} is corrupt".format(digest, pack))
+
+		return data
+
+	def restore(self, treepath: str, targetdir: str, progress: Callable=None) -> Tuple[int, int]:
+		"""Recreates the files of a tree below targetdir, with their mtime and mode
+
+		:param progress: Called with (files_restored, total_files)
+		:return: The number of files and bytes that were restored
+		"""
+		tree = self.load_tree(treepath)
+		files = tree["files"]
+		restored_bytes = 0
+
+		for index, record in enumerate(files):
+			target = Path(targetdir, record["path"])
+			target.parent.mkdir(parents=True, exist_ok=True)
+
+			partfile = target.with_name(target.name + ".part")
+			try:
+				with open(str(partfile), "wb") as out:
+					for digest in record["chunks"]:
+						out.write(self.read_blob(digest))
+				if partfile.stat().st_size != record["size"]:
+					raise PackRepositoryException("'{}' of tree '{}' has the wrong size".format(record["path"], treepath))
+			except BaseException:
+				if partfile.exists():
+					partfile.unlink()
+				raise
+
+			os.replace(str(partfile), str(target))
+			os.chmod(str(target), record["mode"] & 0o7777)
+			os.utime(str(target), (record["mtime"], record["mtime"]))
+			restored_bytes += record["size"]
+
+			if progress is not None:
+				progress(index + 1, len(files))
+
+		return len(files), restored_bytes
+
+
+class RepositoryTree:
+	"""The files of a run, either stored anew or taken over unchanged from the tree of the former run
+
+	Attributes:
+		_previous	Records of the former tree, keyed by the remote path
+		_files		Records of this run, keyed by the remote path
+	"""
+
+	_previous = None
+	""":type: Dict[str, Dict]"""
+
+	_files = None
+	""":type: Dict[str, Dict]"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, previous: Dict=None):
+		"""
+		:param previous: The loaded former tree or None
+		"""
+		self._previous = {}
+		if previous is not None:
+			for record in previous["files"]:
+				self._previous[record["remote"]] = record
+		self._files = {}
+		self._lock = Lock()
+
+	def __len__(self):
+		return len(self._files)
+
+	def get(self, remotepath: str) -> Optional[ManifestRecord]:
+		"""The former record of a remote file, in the form of a Manifest, so it can stand in for the local file"""
+		record = self._previous.get(remotepath)
+		if record is None:
+			return None
+		return ManifestRecord(record["size"], record["mtime"], record["mode"], None)
+
+	def get_chunks(self, remotepath: str) -> List[str]:
+		"""The chunk-hashes of the former record of a remote file, an empty list without one"""
+		record = self._previous.get(remotepath)
+		return record["chunks"] if record is not None else []
+
+	def keep(self, remotepath: str) -> bool:
+		"""Takes over the former record of an unchanged file
+
+		:return: False if there is no former record
+		"""
+		record = self._previous.get(remotepath)
+		if record is None:
+			return False
+		with self._lock:
+			self._files[remotepath] = record
+		return True
+
+	def add(self, remotepath: str, path: str, size: int, mtime: int, mode: int, chunks: List[str]):
+		with self._lock:
+			self._files[remotepath] = {
+				"path": path,
+				"remote": remotepath,
+				"size": size,
+				"mtime": mtime,
+				"mode": mode,
+				"chunks": chunks
+			}
+
+	def get_files(self) -> List[Dict]:
+		with self._lock:
+			return list(self._files.values())
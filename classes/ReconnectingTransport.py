@@ -0,0 +1,214 @@
+from functools import partial
+from threading import Lock
+from time import sleep
+from typing import Callable, List
+import paramiko
+from classes.JobException import JobException
+from classes.SshConnection import SshConnection
+
+
+CONNECTION_ERRORS = (paramiko.SSHException, EOFError, OSError)
+
+
+class ReconnectingTransport:
+	"""Shares one transport between the threads of a unit and replaces it when the connection drops
+
+	Every connect increments the generation. A thread that saw an error on an inactive transport
+	calls reconnect with the generation it used, so when several threads notice the same drop only
+	the first one connects again and the others continue on its transport.
+
+	Attributes:
+		_backoff		Seconds before the first reconnect-attempt, doubled after every failed one
+		_on_reconnect	Called with the new transport after a successful reconnect, one per unit that shares it
+		_keepalive		Seconds between keepalive-packets, keeps an idle connection and its NAT-entries alive
+	"""
+
+	_connection = None
+	""":type: SshConnection"""
+
+	_transport = None
+	""":type: paramiko.Transport"""
+
+	_generation = 0
+	""":type: int"""
+
+	_lock = None
+	""":type: Lock"""
+
+	_attempts = 5
+	""":type: int"""
+
+	_backoff = 1.0
+	""":type: float"""
+
+	_max_backoff = 60.0
+	""":type: float"""
+
+	_log = None
+	""":type: Callable"""
+
+	_on_reconnect = None
+	""":type: List[Callable]"""
+
+	_keepalive = 0
+	""":type: int"""
+
+	def __init__(
+		self,
+		connection: SshConnection,
+		attempts: int=5,
+		backoff: float=1.0,
+		max_backoff: float=60.0,
+		log: Callable=None,
+		on_reconnect: Callable=None,
+		keepalive: int=0
+	):
+		self._connection = connection
+		self._attempts = attempts
+		self._backoff = backoff
+		self._max_backoff = max_backoff
+		self._log = log if log is not None else (lambda msg: None)
+		self._on_reconnect = [on_reconnect] if on_reconnect is not None else []
+		self._keepalive = keepalive
+		self._lock = Lock()
+
+	def connect(self) -> paramiko.Transport:
+		with self._lock:
+			self._transport = self._connection.connect(self._log)
+			self._transport.set_keepalive(self._keepalive)
+			self._generation += 1
+			return self._transport
+
+	def get_transport(self) -> paramiko.Transport:
+		return self._transport
+
+	def get_host(self) -> str:
+		return self._connection.get_host()
+
+	def set_log(self, log: Callable):
+		self._log = log
+
+	def set_on_reconnect(self, on_reconnect: Callable):
+		self._on_reconnect = [on_reconnect]
+
+	def add_on_reconnect(self, on_reconnect: Callable):
+		with self._lock:
+			self._on_reconnect.append(on_reconnect)
+
+	def remove_on_reconnect(self, on_reconnect: Callable):
+		with self._lock:
+			if on_reconnect in self._on_reconnect:
+				self._on_reconnect.remove(on_reconnect)
+
+	def get_generation(self) -> int:
+		return self._generation
+
+	def is_dropped(self) -> bool:
+		return self._transport is None or not self._transport.is_active()
+
+	def reconnect(self, generation: int) -> paramiko.Transport:
+		"""Connects again unless another thread already did since generation
+
+		:param generation: The generation of the transport that failed
+		:raises JobException: With errcode 113 if every attempt failed
+		"""
+		with self._lock:
+			if generation != self._generation and not self.is_dropped():
+				return self._transport
+
+			if self._transport is not None:
+				self._transport.close()
+
+			delay = self._backoff
+			error = None
+
+			for attempt in range(1, self._attempts + 1):
+				self._log("Connection to {} lost, reconnecting in {:.1f}s (attempt {} of {})".format(
+					self._connection.get_host(), delay, attempt, self._attempts
+				))
+				sleep(delay)
+				delay = min(delay * 2, self._max_backoff)
+
+				try:
+					self._transport = self._connection.connect(self._log)
+				except JobException:
+					raise
+				except CONNECTION_ERRORS as e:
+					error = e
+					continue
+
+				self._transport.set_keepalive(self._keepalive)
+				self._generation += 1
+				for on_reconnect in self._on_reconnect:
+					on_reconnect(self._transport)
+				return self._transport
+
+			raise JobException(Exception("Could not reconnect to {}: {}".format(self._connection.get_host(), error)), 113)
+
+	def open_sftp_client(self) -> "ReconnectingSftp":
+		"""Named like paramiko.Transport.open_sftp_client, so both can be passed to a SftpWorkerPool"""
+		return ReconnectingSftp(self)
+
+	def close(self):
+		with self._lock:
+			if self._transport is not None:
+				self._transport.close()
+
+
+class ReconnectingSftp:
+	"""Proxy of a paramiko.SFTPClient that survives reconnects of its ReconnectingTransport
+
+	A call that fails because the transport dropped is repeated once on a new channel of the
+	reconnected transport. Errors on a transport that is still active, like a missing file, are
+	raised as they are. Files that were opened before the drop can't be continued, the caller has
+	to open them again.
+	"""
+
+	_transport = None
+	""":type: ReconnectingTransport"""
+
+	_client = None
+	""":type: paramiko.SFTPClient"""
+
+	_generation = 0
+	""":type: int"""
+
+	def __init__(self, transport: ReconnectingTransport):
+		self._transport = transport
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def __getattr__(self, name: str):
+		if not callable(getattr(paramiko.SFTPClient, name, None)):
+			raise AttributeError(name)
+		return partial(self.call, name)
+
+	def _get_client(self) -> paramiko.SFTPClient:
+		generation = self._transport.get_generation()
+		if self._client is None or self._generation != generation:
+			self.close()
+			self._client = paramiko.SFTPClient.from_transport(self._transport.get_transport())
+			self._generation = generation
+		return self._client
+
+	def call(self, name: str, *args, **kwargs):
+		for attempt in range(2):
+			try:
+				client = self._get_client()
+				return getattr(client, name)(*args, **kwargs)
+			except CONNECTION_ERRORS:
+				if attempt > 0 or not self._transport.is_dropped():
+					raise
+				self._transport.reconnect(self._generation)
+
+	def close(self):
+		if self._client is not None:
+			try:
+				self._client.close()
+			except CONNECTION_ERRORS:
+				pass
+			self._client = None
@@ -0,0 +1,169 @@
+from shlex import quote
+from time import monotonic
+from typing import BinaryIO, Callable
+import paramiko
+
+
+class RemoteImageException(Exception):
+	pass
+
+
+class RemoteImageStream:
+	"""Reads a block-device of the remote host with dd through an exec-channel
+
+	The device can be compressed on the remote host before it's sent, which saves bandwidth when
+	the network is slower than the cores of the remote host. A device that is mounted while it's
+	read gives a crash-consistent image at best, like pulling the power would.
+
+	Attributes:
+		_sudo		Prefix dd with 'sudo -n', the user needs to be allowed to run it without password
+		_compress	Compression-command the output of dd is piped through remotely
+	"""
+
+	COMPRESS = {
+		"gz": "gzip -1 -c",
+		"xz": "xz -T0 -1 -c",
+		"zst": "zstd -T0 -c"
+	}
+
+	_transport = None
+	""":type: paramiko.Transport"""
+
+	_devicepath = None
+	""":type: str"""
+
+	_sudo = False
+	""":type: bool"""
+
+	_compress = None
+	""":type: str"""
+
+	_bufsize = 0
+	""":type: int"""
+
+	_channel = None
+	""":type: paramiko.Channel"""
+
+	_stream = None
+	""":type: BinaryIO"""
+
+	_bytes_received = 0
+	""":type: int"""
+
+	_started = 0.0
+	""":type: float"""
+
+	def __init__(
+		self,
+		transport: paramiko.Transport,
+		devicepath: str,
+		sudo: bool=False,
+		compress: str=None,
+		bufsize: int=4 * 1024 * 1024
+	):
+		if compress is not None and compress not in self.COMPRESS:
+			raise RemoteImageException("Remote compression '{}' is unknown, use one of {}".format(
+				compress, ", ".join(self.COMPRESS.keys())
+			))
+
+		self._transport = transport
+		self._devicepath = devicepath
+		self._sudo = sudo
+		self._compress = compress
+		self._bufsize = bufsize
+
+	def get_extension(self) -> str:
+		return "" if self._compress is None else "." + self._compress
+
+	def get_bytes_received(self) -> int:
+		return self._bytes_received
+
+	def get_seconds(self) -> float:
+		return monotonic() - self._started
+
+	def _exec(self, command: str) -> paramiko.Channel:
+		try:
+			channel = self._transport.open_session()
+			channel.exec_command(command)
+		except paramiko.SSHException as e:
+			raise RemoteImageException("Could not execute '{}': {}".format(command, e))
+		return channel
+
+	@staticmethod
+	def _finish(channel: paramiko.Channel, command: str):
+		exitstatus = channel.recv_exit_status()
+		stderr = b""
+		while channel.recv_stderr_ready():
+			stderr += channel.recv_stderr(65536)
+		channel.close()
+
+		if exitstatus != 0:
+			raise RemoteImageException("'{}' failed with exit status {}: {}".format(
+				command, exitstatus, stderr.decode("utf-8", "replace").strip()
+			))
+
+	def get_size(self) -> int:
+		"""The size of the device from sysfs, which doesn't need root like blockdev does"""
+		command = "cat /sys/class/block/$(basename $(readlink -f {}))/size".format(quote(self._devicepath))
+		channel = self._exec(command)
+		output = channel.makefile("rb").read()
+		self._finish(channel, command)
+
+		try:
+			return int(output.strip()) * 512
+		except ValueError:
+			raise RemoteImageException("'{}' is no block-device".format(self._devicepath))
+
+	def build_command(self) -> str:
+		command = "dd if={} bs=4M status=none".format(quote(self._devicepath))
+		if self._sudo:
+			command = "sudo -n " + command
+		if self._compress is not None:
+			command += " | " + self.COMPRESS[self._compress]
+		return command
+
+	def open(self) -> "RemoteImageStream":
+		"""Starts dd, the stream has to be read to its end before close()"""
+		self._bytes_received = 0
+		self._started = monotonic()
+		self._channel = self._exec(self.build_command())
+		self._stream = self._channel.makefile("rb", self._bufsize)
+		return self
+
+	def read(self, size: int=-1) -> bytes:
+		data = self._stream.read(size)
+		self._bytes_received += len(data)
+		return data
+
+	def close(self):
+		"""
+		:raises RemoteImageException: If dd or the compression failed
+		"""
+		if self._channel is not None:
+			channel = self._channel
+			self._channel = None
+			self._stream = None
+			self._finish(channel, self.build_command())
+
+	def abort(self):
+		"""Closes the channel of a stream that wasn't read to its end, waiting for dd would block"""
+		if self._channel is not None:
+			self._channel.close()
+			self._channel = None
+			self._stream = None
+
+	def copy(self, target: BinaryIO, progress: Callable=None):
+		"""Copies the whole stream to target
+
+		:param progress: Called with the bytes received so far
+		"""
+		self.open()
+		try:
+			for data in iter(lambda: self.read(self._bufsize), b""):
+				target.write(data)
+				if progress is not None:
+					progress(self._bytes_received)
+		except BaseException:
+			self.abort()
+			raise
+		self.close()
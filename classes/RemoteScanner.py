@@ -0,0 +1,147 @@
+import stat
+from shlex import quote
+from typing import Iterator, List, NamedTuple
+import paramiko
+
+
+class RemoteScanException(Exception):
+	"""Raised when the scan can't be executed on the remote host, the caller should fall back to sftp"""
+	pass
+
+
+class RemoteScanRecord(NamedTuple("RemoteScanRecord", [("path", str), ("attributes", paramiko.SFTPAttributes)])):
+	__slots__ = ()
+
+	def is_dir(self) -> bool:
+		return stat.S_ISDIR(self.attributes.st_mode)
+
+
+class RemoteScanner:
+	"""Lists a remote tree with a single `find -printf` on an exec-channel instead of one sftp-request per folder
+
+	The output of find is NUL-delimited and parsed incrementally while it is streamed,
+	so the first files can be processed before the scan has finished.
+	Folders matching the prune-patterns are still printed, but find doesn't descend into them.
+	"""
+
+	_printf_format = "%y %s %T@ %m %p\\0"
+	""":type: str"""
+
+	_filetypes = {
+		"f": stat.S_IFREG,
+		"d": stat.S_IFDIR,
+		"l": stat.S_IFLNK,
+		"b": stat.S_IFBLK,
+		"c": stat.S_IFCHR,
+		"p": stat.S_IFIFO,
+		"s": stat.S_IFSOCK
+	}
+	""":type: Dict[str, int]"""
+
+	_transport = None
+	""":type: paramiko.Transport"""
+
+	_bufsize = 0
+	""":type: int"""
+
+	_stderr = None
+	""":type: bytes"""
+
+	_exitstatus = None
+	""":type: int"""
+
+	def __init__(self, transport: paramiko.Transport, bufsize: int=65536):
+		self._transport = transport
+		self._bufsize = bufsize
+		self._stderr = b""
+
+	def get_stderr(self) -> str:
+		return self._stderr.decode("utf-8", "replace").strip()
+
+	def get_exitstatus(self) -> int:
+		return self._exitstatus
+
+	@staticmethod
+	def build_command(root: str, recurse: bool, prune_names: List[str], prune_paths: List[str]) -> str:
+		"""
+		:param prune_names: Shell-patterns matched against the name of a folder
+		:param prune_paths: Shell-patterns matched against the absolute path of a folder
+		"""
+		cmd = ["find", quote(root)]
+
+		if not recurse:
+			cmd += ["-maxdepth", "1"]
+
+		tests = ["-name " + quote(p) for p in prune_names] + ["-path " + quote(p) for p in prune_paths]
+
+		printf = "-printf " + quote(RemoteScanner._printf_format)
+
+		if len(tests) > 0:
+			cmd += [
+				"\\(", "-type", "d", "\\(", " -o ".join(tests), "\\)", "\\)",
+				"-prune", printf, "-o"
+			]
+
+		cmd.append(printf)
+		return " ".join(cmd)
+
+	@staticmethod
+	def parse_record(raw: bytes) -> RemoteScanRecord:
+		filetype, size, mtime, mode, path = raw.decode("utf-8", "surrogateescape").split(" ", 4)
+
+		attributes = paramiko.SFTPAttributes()
+		attributes.filename = path.rsplit("/", 1)[-1]
+		attributes.st_size = int(size)
+		# sftp only delivers whole seconds, keep it that way so both modes compare alike
+		attributes.st_mtime = int(float(mtime))
+		attributes.st_atime = attributes.st_mtime
+		attributes.st_mode = RemoteScanner._filetypes.get(filetype, 0) | int(mode, 8)
+
+		return RemoteScanRecord(path, attributes)
+
+	def scan(self, root: str, recurse: bool, prune_names: List[str], prune_paths: List[str]) -> Iterator[RemoteScanRecord]:
+		"""Yields the records in the pre-order of find, so a folder always comes before its contents
+
+		:raises RemoteScanException: If no exec-channel can be opened or find fails without any output
+		"""
+		command = self.build_command(root, recurse, prune_names, prune_paths)
+
+		try:
+			channel = self._transport.open_session()
+			channel.exec_command(command)
+		except paramiko.SSHException as e:
+			raise RemoteScanException("Could not execute '{}': {}".format(command, e))
+
+		self._stderr = b""
+		self._exitstatus = None
+		records = 0
+		rest = b""
+
+		try:
+			while True:
+				data = channel.recv(self._bufsize)
+
+				while channel.recv_stderr_ready():
+					self._stderr += channel.recv_stderr(self._bufsize)
+
+				if len(data) == 0:
+					break
+
+				parts = (rest + data).split(b"\0")
+				rest = parts.pop()
+
+				for raw in parts:
+					records += 1
+					yield self.parse_record(raw)
+
+			self._exitstatus = channel.recv_exit_status()
+
+			while channel.recv_stderr_ready():
+				self._stderr += channel.recv_stderr(self._bufsize)
+		finally:
+			channel.close()
+
+		if records == 0 and self._exitstatus != 0:
+			raise RemoteScanException("'{}' failed with exit status {}: {}".format(
+				command, self._exitstatus, self.get_stderr()
+			))
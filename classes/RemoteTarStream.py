@@ -0,0 +1,148 @@
+import stat
+import tarfile
+from posixpath import normpath, join
+from shlex import quote
+from shutil import copyfileobj
+from typing import BinaryIO, Iterator, List
+import paramiko
+from classes.RemoteScanner import RemoteScanRecord
+
+
+class RemoteTarStreamException(Exception):
+	"""Raised when the remote host can't deliver a tar-stream, the caller should fall back to sftp"""
+	pass
+
+
+class RemoteTarStream:
+	"""Reads a remote folder as a tar-archive that `tar -cf -` writes to an exec-channel
+
+	The archive is read with tarfile in stream-mode, so it's never stored. records() yields
+	one RemoteScanRecord per member, the data of the current member can be copied with
+	copy_current() before the iteration continues, otherwise it is read past.
+	"""
+
+	_transport = None
+	""":type: paramiko.Transport"""
+
+	_bufsize = 0
+	""":type: int"""
+
+	_tarfile = None
+	""":type: tarfile.TarFile"""
+
+	_member = None
+	""":type: tarfile.TarInfo"""
+
+	_stderr = None
+	""":type: bytes"""
+
+	_exitstatus = None
+	""":type: int"""
+
+	def __init__(self, transport: paramiko.Transport, bufsize: int=1024 * 1024):
+		self._transport = transport
+		self._bufsize = bufsize
+		self._stderr = b""
+
+	def get_stderr(self) -> str:
+		return self._stderr.decode("utf-8", "replace").strip()
+
+	def get_exitstatus(self) -> int:
+		return self._exitstatus
+
+	@staticmethod
+	def build_command(root: str, recurse: bool, prune_names: List[str], prune_paths: List[str]=None) -> str:
+		"""find lists the members in pre-order and tar archives exactly those, tar's --exclude would
+		drop files with a matching name as well
+
+		The members keep the absolute paths find prints, so the absolute prune-paths are matched
+		like in RemoteScanner, and a folder left out on the remote host is never streamed.
+
+		:param prune_names: Shell-patterns matched against the name of a folder, which is left out
+			with everything below it
+		:param prune_paths: Shell-patterns matched against the absolute path of a folder
+		"""
+		tests = ["-name " + quote(p) for p in prune_names] + ["-path " + quote(p) for p in prune_paths or []]
+
+		if recurse:
+			prune = "\\( -type d \\( {} \\) \\) -prune -o ".format(" -o ".join(tests)) if len(tests) > 0 else ""
+			find = "find -H {} -mindepth 1 {}-print0".format(quote(root), prune)
+		else:
+			find = "find -H {} -mindepth 1 -maxdepth 1 ! -type d -print0".format(quote(root))
+
+		# Hardlinks are dereferenced, so every member carries its own data
+		return "{} | tar --hard-dereference --absolute-names -cf - --null --no-recursion -T -".format(find)
+
+	@staticmethod
+	def get_attributes(member: tarfile.TarInfo) -> paramiko.SFTPAttributes:
+		if member.isdir():
+			filetype = stat.S_IFDIR
+		elif member.issym():
+			filetype = stat.S_IFLNK
+		elif member.isreg():
+			filetype = stat.S_IFREG
+		else:
+			filetype = 0
+
+		attributes = paramiko.SFTPAttributes()
+		attributes.filename = member.name.rsplit("/", 1)[-1]
+		attributes.st_size = member.size
+		attributes.st_mtime = int(member.mtime)
+		attributes.st_atime = attributes.st_mtime
+		attributes.st_mode = filetype | member.mode
+		return attributes
+
+	def copy_current(self, fileobj: BinaryIO):
+		"""Copies the data of the member that was yielded last, only regular files carry data"""
+		if self._member.isreg():
+			copyfileobj(self._tarfile.extractfile(self._member), fileobj, self._bufsize)
+
+	def records(
+		self,
+		root: str,
+		recurse: bool,
+		prune_names: List[str],
+		prune_paths: List[str]=None
+	) -> Iterator[RemoteScanRecord]:
+		"""
+		:raises RemoteTarStreamException: If no exec-channel can be opened or tar fails without any output
+		"""
+		command = self.build_command(root, recurse, prune_names, prune_paths)
+
+		try:
+			channel = self._transport.open_session()
+			channel.exec_command(command)
+		except paramiko.SSHException as e:
+			raise RemoteTarStreamException("Could not execute '{}': {}".format(command, e))
+
+		self._stderr = b""
+		self._exitstatus = None
+
+		try:
+			stream = channel.makefile("rb", self._bufsize)
+
+			try:
+				self._tarfile = tarfile.open(fileobj=stream, mode="r|", bufsize=self._bufsize)
+			except tarfile.ReadError:
+				self._exitstatus = channel.recv_exit_status()
+				self._read_stderr(channel)
+				raise RemoteTarStreamException("'{}' failed with exit status {}: {}".format(
+					command, self._exitstatus, self.get_stderr()
+				))
+
+			for member in self._tarfile:
+				self._member = member
+				yield RemoteScanRecord(normpath(join(root, member.name)), self.get_attributes(member))
+				self._read_stderr(channel)
+
+			self._tarfile.close()
+			self._exitstatus = channel.recv_exit_status()
+			self._read_stderr(channel)
+		finally:
+			self._member = None
+			self._tarfile = None
+			channel.close()
+
+	def _read_stderr(self, channel: paramiko.Channel):
+		while channel.recv_stderr_ready():
+			self._stderr += channel.recv_stderr(self._bufsize)
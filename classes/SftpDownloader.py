@@ -0,0 +1,260 @@
+import json
+import os
+from pathlib import Path
+from time import monotonic, perf_counter, time
+from typing import Callable, Iterable
+import paramiko
+from classes.DownloadProgress import DownloadProgress
+from classes.Metrics import Metrics
+
+
+class SftpFileChangedException(IOError):
+	"""The remote file changed while it was downloaded, it has to be downloaded again with its new attributes"""
+
+	_attributes = None
+	""":type: paramiko.SFTPAttributes"""
+
+	def __init__(self, remotefile: str, attributes: paramiko.SFTPAttributes):
+		super().__init__("'{}' changed while it was downloaded".format(remotefile))
+		self._attributes = attributes
+
+	def get_attributes(self) -> paramiko.SFTPAttributes:
+		return self._attributes
+
+
+class SftpDownloader:
+	"""Downloads files with many outstanding read-requests instead of paramiko's get-defaults
+
+	The whole file is prefetched in requests of block_size bytes, at most max_requests of
+	them in flight, while the received blocks are written to a preallocated local file.
+	Servers may cap the size of a single read (OpenSSH at 256KB), paramiko re-requests the rest.
+
+	The download goes to <localfile>.btfu-part, which replaces localfile when it's complete, so an
+	aborted run never leaves a truncated file behind. Every checkpoint_interval bytes the part is
+	synced and its offset is written to <localfile>.btfu-part.json with the remote size and mtime.
+	A later download of the same, unchanged remote file continues at that offset. The suffix is
+	unlikely to clash with the name of a backed up file, which would be taken for a part.
+
+	Once the listed size is read, the open remote file is stat'ed again. A file that grew, shrank
+	or got a new mtime since it was listed, like a log that is still written, isn't taken as
+	complete, the caller has to download it again.
+	"""
+
+	PART_SUFFIX = ".btfu-part"
+
+	CHECKPOINT_SUFFIX = PART_SUFFIX + ".json"
+
+	_block_size = 32768
+	""":type: int"""
+
+	_max_requests = None
+	""":type: int"""
+
+	_checkpoint_interval = 8 * 1024 * 1024
+	""":type: int"""
+
+	_part_max_age = 7 * 86400
+	""":type: float"""
+
+	def __init__(
+		self,
+		block_size: int=None,
+		max_requests: int=None,
+		checkpoint_interval: int=None,
+		part_max_age: float=None
+	):
+		"""
+		:param part_max_age: Seconds after which remove_stale_parts deletes an abandoned part
+		"""
+		if block_size is not None:
+			self._block_size = block_size
+		self._max_requests = max_requests
+		if checkpoint_interval is not None:
+			self._checkpoint_interval = checkpoint_interval
+		if part_max_age is not None:
+			self._part_max_age = part_max_age
+
+	def get_block_size(self) -> int:
+		return self._block_size
+
+	def get_max_requests(self) -> int:
+		return self._max_requests
+
+	def get_checkpoint_interval(self) -> int:
+		return self._checkpoint_interval
+
+	@staticmethod
+	def get_partfile(localfile: Path) -> Path:
+		return localfile.with_name(localfile.name + SftpDownloader.PART_SUFFIX)
+
+	@staticmethod
+	def get_checkpointfile(localfile: Path) -> Path:
+		return localfile.with_name(localfile.name + SftpDownloader.CHECKPOINT_SUFFIX)
+
+	@staticmethod
+	def _write_checkpoint(checkpointfile: Path, size: int, mtime: int, offset: int):
+		tmpfile = str(checkpointfile) + ".tmp"
+		with open(tmpfile, "w") as f:
+			json.dump({"size": size, "mtime": mtime, "offset": offset}, f)
+		os.replace(tmpfile, str(checkpointfile))
+
+	def get_resume_offset(self, localfile: Path, size: int, mtime: int) -> int:
+		"""The bytes of a former download that can be kept, 0 if the remote file changed since
+
+		Only the offset of the checkpoint is trusted, the part may contain unsynced data behind it.
+		"""
+		partfile = self.get_partfile(localfile)
+		checkpointfile = self.get_checkpointfile(localfile)
+
+		if not partfile.exists() or not checkpointfile.exists():
+			return 0
+
+		try:
+			with open(str(checkpointfile)) as f:
+				checkpoint = json.load(f)
+		except (OSError, ValueError):
+			return 0
+
+		if checkpoint.get("size") != size or checkpoint.get("mtime") != mtime:
+			return 0
+
+		return max(0, min(int(checkpoint.get("offset", 0)), partfile.stat().st_size, size))
+
+	def discard(self, localfile: Path):
+		"""Removes the part and the checkpoint of localfile"""
+		for path in (self.get_partfile(localfile), self.get_checkpointfile(localfile)):
+			if path.exists():
+				path.unlink()
+
+	def remove_stale_parts(self, folders: Iterable[Path]) -> int:
+		"""Removes the parts and checkpoints in folders that weren't written for part_max_age seconds
+
+		A part is left behind by a download that failed and wasn't repeated, e.g. because the
+		remote file was deleted or excluded since. The folders aren't descended into, the caller
+		passes the folders it processed.
+
+		:return: The number of removed files
+		"""
+		oldest = time() - self._part_max_age
+		suffixes = (self.PART_SUFFIX, self.CHECKPOINT_SUFFIX, self.CHECKPOINT_SUFFIX + ".tmp")
+		removed = 0
+
+		for folder in folders:
+			try:
+				entries = list(os.scandir(str(folder)))
+			except FileNotFoundError:
+				continue
+
+			for direntry in entries:
+				if not direntry.name.endswith(suffixes) or not direntry.is_file(follow_symlinks=False):
+					continue
+				try:
+					if direntry.stat(follow_symlinks=False).st_mtime < oldest:
+						os.unlink(direntry.path)
+						removed += 1
+				except FileNotFoundError:
+					pass
+
+		return removed
+
+	def download(
+		self,
+		sftp: paramiko.SFTPClient,
+		remotefile: str,
+		localfile: Path,
+		size: int,
+		progress: DownloadProgress=None,
+		metrics: Metrics=None,
+		mtime: int=None,
+		verify: Callable=None
+	) -> float:
+		"""
+		:param size: The remote size, known from the listing or stat
+		:param metrics: Gets the seconds spent waiting for the network and writing to the disk
+		:param mtime: The remote mtime, a former part is only continued if it's passed
+		:param verify: Called with the complete part before it replaces localfile, raises if it doesn't match
+		:return: The seconds the download took
+		:raises SftpFileChangedException: If the remote file changed since size and mtime were listed
+		"""
+		start = monotonic()
+		network = 0.0
+		disk = 0.0
+
+		partfile = self.get_partfile(localfile)
+		checkpointfile = self.get_checkpointfile(localfile)
+		offset = self.get_resume_offset(localfile, size, mtime) if mtime is not None else 0
+		done = offset
+
+		if offset > 0:
+			if metrics is not None:
+				metrics.inc("resumed_files_total")
+				metrics.inc("resumed_bytes_total", offset)
+		elif checkpointfile.exists():
+			checkpointfile.unlink()
+
+		try:
+			with sftp.open(remotefile, "rb") as remote:
+				remote.MAX_REQUEST_SIZE = self._block_size
+				# prefetch requests the file from the current position on
+				remote.seek(offset)
+				remote.prefetch(size, self._max_requests)
+
+				with open(str(partfile), "r+b" if offset > 0 else "wb") as local:
+					if size > 0 and hasattr(os, "posix_fallocate"):
+						try:
+							os.posix_fallocate(local.fileno(), 0, size)
+						except OSError:
+							pass
+					local.seek(offset)
+
+					checkpoint = offset + self._checkpoint_interval
+
+					while done < size:
+						t0 = perf_counter()
+						data = remote.read(self._block_size)
+						t1 = perf_counter()
+						if len(data) == 0:
+							break
+						local.write(data)
+						disk += perf_counter() - t1
+						network += t1 - t0
+						done += len(data)
+
+						if done >= checkpoint and mtime is not None and done < size:
+							local.flush()
+							os.fsync(local.fileno())
+							self._write_checkpoint(checkpointfile, size, mtime, done)
+							checkpoint = done + self._checkpoint_interval
+
+						if progress is not None:
+							progress.update(done)
+
+					local.truncate(done)
+
+				current = remote.stat()
+		except BaseException:
+			# Whatever arrived after the last checkpoint is dropped on resume
+			if mtime is None:
+				self.discard(localfile)
+			raise
+		finally:
+			if metrics is not None:
+				metrics.inc("network_seconds_total", network)
+				metrics.inc("disk_seconds_total", disk)
+
+		if done != size or current.st_size != size or (mtime is not None and current.st_mtime != mtime):
+			self.discard(localfile)
+			raise SftpFileChangedException(remotefile, current)
+
+		if verify is not None:
+			try:
+				verify(partfile)
+			except BaseException:
+				self.discard(localfile)
+				raise
+
+		os.replace(str(partfile), str(localfile))
+		if checkpointfile.exists():
+			checkpointfile.unlink()
+
+		return monotonic() - start
@@ -0,0 +1,128 @@
+from queue import Queue
+from threading import Thread, Lock
+from typing import Callable, List, Tuple, Union
+import paramiko
+from classes.ReconnectingTransport import ReconnectingTransport
+
+
+class SftpWorkerPool:
+	"""A bounded pool of worker-threads that execute sftp-tasks in parallel
+
+	Every worker opens its own SFTP-channel on the shared transport the first time it
+	receives a task, so the transfers don't serialize on a single channel.
+	A task is a callable that receives the worker's paramiko.SFTPClient as first argument.
+	With a ReconnectingTransport the workers get clients that survive a reconnect.
+
+	Attributes:
+		_queue 	Bounded, so the discovery of files blocks when the workers can't keep up
+		_errors	Tuples of (description, exception) of the tasks that failed since the last wait()
+	"""
+
+	_transport = None
+	""":type: Union[paramiko.Transport, ReconnectingTransport]"""
+
+	_max_workers = 0
+	""":type: int"""
+
+	_queue = None
+	""":type: Queue"""
+
+	_workers = None
+	""":type: List[Thread]"""
+
+	_errors = None
+	""":type: List[Tuple[str, Exception]]"""
+
+	_errors_lock = None
+	""":type: Lock"""
+
+	def __init__(self, transport: Union[paramiko.Transport, ReconnectingTransport], max_workers: int, queue_factor: int=4):
+		if transport is None:
+			raise Exception("transport has to be passed")
+		if max_workers < 1:
+			raise Exception("max_workers has to be at least 1")
+
+		self._transport = transport
+		self._max_workers = max_workers
+		self._queue = Queue(maxsize=max_workers * queue_factor)
+		self._workers = []
+		self._errors = []
+		self._errors_lock = Lock()
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def get_max_workers(self) -> int:
+		return self._max_workers
+
+	def start(self):
+		if len(self._workers) > 0:
+			return
+
+		for i in range(self._max_workers):
+			worker = Thread(target=self._work, name="sftp-worker-{}".format(i), daemon=True)
+			worker.start()
+			self._workers.append(worker)
+
+	def submit(self, description: str, task: Callable, *args):
+		"""Queues a task, blocks while the queue is full
+
+		:param description: Used to identify the task if it fails
+		:param task: Called with (sftp, *args) inside a worker
+		"""
+		if len(self._workers) == 0:
+			raise Exception("SftpWorkerPool has not been started")
+		self._queue.put((description, task, args))
+
+	def wait(self) -> List[Tuple[str, Exception]]:
+		"""Blocks until every submitted task is finished
+
+		:return: The failed tasks since the last call to wait
+		"""
+		self._queue.join()
+		with self._errors_lock:
+			errors = self._errors
+			self._errors = []
+		return errors
+
+	def close(self):
+		if len(self._workers) == 0:
+			return
+
+		for _ in self._workers:
+			self._queue.put(None)
+
+		for worker in self._workers:
+			worker.join()
+
+		self._workers = []
+
+	def _work(self):
+		sftp = None
+		""":type: paramiko.SFTPClient"""
+
+		try:
+			while True:
+				item = self._queue.get()
+				try:
+					if item is None:
+						break
+
+					description, task, args = item
+
+					try:
+						if sftp is None:
+							sftp = self._transport.open_sftp_client()
+						task(sftp, *args)
+					except Exception as e:
+						with self._errors_lock:
+							self._errors.append((description, e))
+				finally:
+					self._queue.task_done()
+		finally:
+			if sftp is not None:
+				sftp.close()
@@ -0,0 +1,158 @@
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+
+class SnapshotException(Exception):
+	pass
+
+
+class Snapshots:
+	"""Time-stamped snapshots of a target folder, unchanged files are hardlinks to the former snapshot
+
+	A run writes into targetdir/<stamp>.incomplete, which is renamed to targetdir/<stamp> once
+	the run succeeded, and targetdir/latest is pointed at it. Only finished snapshots are used as
+	the predecessor of the next one. Downloaded files always replace the local file instead of
+	writing into it, so a file that is linked from older snapshots is never changed.
+
+	A failed run leaves its incomplete snapshot behind, remove_incomplete() deletes those before the
+	next run. Its files are compared with the finished predecessor anyway, so there's nothing to resume.
+	"""
+
+	STAMP_FORMAT = "%Y-%m-%d_%H%M%S"
+
+	PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{6}(-\d+)?$")
+
+	INCOMPLETE = ".incomplete"
+
+	LATEST = "latest"
+
+	_root = None
+	""":type: Path"""
+
+	_previous = None
+	""":type: Path"""
+
+	_current = None
+	""":type: Path"""
+
+	_stamp = None
+	""":type: str"""
+
+	def __init__(self, root: Path):
+		self._root = root
+
+	def get_root(self) -> Path:
+		return self._root
+
+	def get_previous(self) -> Path:
+		"""The newest finished snapshot before the current one, None for the first"""
+		return self._previous
+
+	def get_current(self) -> Path:
+		return self._current
+
+	def list(self) -> List[Path]:
+		"""The finished snapshots, oldest first"""
+		if not self._root.is_dir():
+			return []
+		return sorted(
+			(p for p in self._root.iterdir() if p.is_dir() and not p.is_symlink() and self.PATTERN.match(p.name)),
+			key=lambda p: p.name
+		)
+
+	def list_incomplete(self) -> List[Path]:
+		"""The snapshots of runs that didn't finish, oldest first"""
+		if not self._root.is_dir():
+			return []
+		return sorted(
+			(
+				p for p in self._root.iterdir()
+				if p.name.endswith(self.INCOMPLETE) and p.is_dir() and not p.is_symlink()
+				and self.PATTERN.match(p.name[:-len(self.INCOMPLETE)])
+			),
+			key=lambda p: p.name
+		)
+
+	def remove_incomplete(self) -> List[Path]:
+		"""Deletes the snapshots of failed runs, the current one is kept
+
+		Only the hardlinks of the unchanged files are removed, their finished snapshots keep them.
+
+		:return: The removed folders
+		"""
+		removed = []
+		for incomplete in self.list_incomplete():
+			if incomplete != self._current:
+				shutil.rmtree(str(incomplete))
+				removed.append(incomplete)
+		return removed
+
+	def begin(self, now: datetime=None, create: bool=True) -> Path:
+		"""Creates the folder of a new snapshot
+
+		:param create: False to only name the folder, for a run that doesn't write
+		:return: The folder the run writes into
+		"""
+		snapshots = self.list()
+		self._previous = snapshots[-1] if len(snapshots) > 0 else None
+
+		stamp = (now if now is not None else datetime.now()).strftime(self.STAMP_FORMAT)
+		candidate = stamp
+		count = 1
+		while (self._root / candidate).exists() or (self._root / (candidate + self.INCOMPLETE)).exists():
+			candidate = "{}-{}".format(stamp, count)
+			count += 1
+
+		self._stamp = candidate
+		self._current = self._root / (candidate + self.INCOMPLETE)
+		if create:
+			self._current.mkdir(parents=True)
+		return self._current
+
+	def get_previous_file(self, localfile: Path) -> Path:
+		"""The counterpart of a file of the current snapshot in the previous one, None for the first"""
+		if self._previous is None:
+			return None
+		return self._previous / localfile.relative_to(self._current)
+
+	def link(self, localfile: Path) -> bool:
+		"""Hardlinks the counterpart of localfile in the previous snapshot to localfile
+
+		:return: False if there is no counterpart or it can't be linked, e.g. across filesystems
+		"""
+		previousfile = self.get_previous_file(localfile)
+		if previousfile is None:
+			return False
+
+		try:
+			if localfile.exists():
+				localfile.unlink()
+			os.link(str(previousfile), str(localfile))
+		except OSError:
+			return False
+		return True
+
+	def finish(self) -> Path:
+		"""Renames the current snapshot to its stamp and points latest at it
+
+		:return: The folder of the finished snapshot
+		"""
+		if self._current is None:
+			raise SnapshotException("No snapshot was begun")
+
+		finished = self._root / self._stamp
+		os.rename(str(self._current), str(finished))
+		self._current = finished
+
+		latest = self._root / self.LATEST
+		tmplink = self._root / (self.LATEST + ".tmp")
+		if tmplink.is_symlink():
+			tmplink.unlink()
+		os.symlink(self._stamp, str(tmplink))
+		os.replace(str(tmplink), str(latest))
+
+		return finished
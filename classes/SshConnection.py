@@ -0,0 +1,61 @@
+from typing import Callable, Tuple
+import paramiko
+from fileutilslib.misclib.helpertools import string_is_empty
+from classes.JobException import JobException
+
+
+class SshConnection:
+	"""Connects and authenticates a paramiko-transport with a keyfile or a password"""
+
+	_host = None
+	""":type: str"""
+
+	_user = None
+	""":type: str"""
+
+	_password = None
+	""":type: str"""
+
+	_keyfile = None
+	""":type: str"""
+
+	def __init__(self, host: str, user: str, password: str=None, keyfile: str=None):
+		self._host = host
+		self._user = user
+		self._password = password
+		self._keyfile = keyfile
+
+	def get_host(self) -> str:
+		return self._host
+
+	def get_key(self) -> Tuple[str, str, str, str]:
+		"""Equal for connections to the same host with the same credentials, which can share a transport"""
+		return self._host, self._user, self._password, self._keyfile
+
+	def connect(self, log: Callable=None, transport: paramiko.Transport=None) -> paramiko.Transport:
+		"""
+		:param log: Called with the log-lines, like Unit.info
+		:param transport: A transport to connect instead of a new one to host
+		:raises JobException: With errcode 5 if the authentication fails
+		"""
+		log = log if log is not None else (lambda msg: None)
+
+		log("Trying to connect to SSH-Host {}".format(self._host))
+
+		if transport is None:
+			transport = paramiko.Transport(self._host)
+
+		if not string_is_empty(self._keyfile):
+			key = paramiko.RSAKey.from_private_key_file(self._keyfile)
+			log("With Key:".format(key.get_name()))
+			transport.connect(username=self._user, pkey=key)
+		else:
+			log("With Username/Password")
+			transport.connect(username=self._user, password=self._password)
+
+		if not transport.is_authenticated():
+			raise JobException(Exception("could not authenticate"), 5)
+
+		log("Successfully connected!")
+
+		return transport
@@ -0,0 +1,105 @@
+import json
+from os import makedirs, replace
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+
+class TransferHistory:
+	"""Files, bytes and seconds of the last executed plans of every job, to estimate the next ones
+
+	The duration of a job is modelled as seconds = files * per_file + bytes * per_byte, fitted by
+	least squares over its last MAX_RUNS executions: per_file covers the round-trips and
+	the local work per file, per_byte the bandwidth. A job without a history is estimated from
+	the executions of all jobs of the unit.
+
+	{"jobs": {"<job-name>": [[files, bytes, seconds], ...]}}
+	"""
+
+	MAX_RUNS = 20
+
+	_filepath = None
+	""":type: Path"""
+
+	_jobs = None
+	""":type: Dict[str, List[List[float]]]"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, filepath: Path):
+		self._filepath = filepath
+		self._jobs = {}
+		self._lock = Lock()
+
+	def get_filepath(self) -> Path:
+		return self._filepath
+
+	def __len__(self):
+		return sum(len(runs) for runs in self._jobs.values())
+
+	def load(self):
+		self._jobs = {}
+		if self._filepath.exists():
+			with open(str(self._filepath)) as f:
+				self._jobs = json.load(f).get("jobs", {})
+
+	def save(self):
+		if not self._filepath.parent.exists():
+			makedirs(str(self._filepath.parent))
+
+		tmpfile = self._filepath.with_name(self._filepath.name + ".tmp")
+		with self._lock:
+			with open(str(tmpfile), "w") as f:
+				json.dump({"jobs": self._jobs}, f)
+		replace(str(tmpfile), str(self._filepath))
+
+	def add(self, job: str, files: int, transferred_bytes: int, seconds: float):
+		if files == 0:
+			return
+		with self._lock:
+			runs = self._jobs.setdefault(job, [])
+			runs.append([files, transferred_bytes, seconds])
+			del runs[:-self.MAX_RUNS]
+
+	@staticmethod
+	def fit(runs: List[List[float]]) -> Optional[Tuple[float, float]]:
+		"""
+		:return: Seconds per file and per byte, None without runs
+		"""
+		ff = sum(f * f for f, b, s in runs)
+		fb = sum(f * b for f, b, s in runs)
+		bb = sum(b * b for f, b, s in runs)
+		fs = sum(f * s for f, b, s in runs)
+		bs = sum(b * s for f, b, s in runs)
+
+		# Runs with the same bytes per file can't tell the two rates apart
+		det = ff * bb - fb * fb
+		if det > 1e-9 * ff * bb:
+			per_file = (fs * bb - bs * fb) / det
+			per_byte = (ff * bs - fb * fs) / det
+			if per_file >= 0 and per_byte >= 0:
+				return per_file, per_byte
+			# The bytes don't explain the seconds, the files do
+			if per_byte < 0:
+				return fs / ff, 0.0
+
+		if bb > 0:
+			return 0.0, bs / bb
+		if ff > 0:
+			return fs / ff, 0.0
+		return None
+
+	def estimate(self, job: str, files: int, transferred_bytes: int) -> Optional[float]:
+		"""
+		:return: The estimated seconds, None if no plan was executed yet
+		"""
+		with self._lock:
+			runs = self._jobs.get(job)
+			if runs is None or len(runs) == 0:
+				runs = [run for runs in self._jobs.values() for run in runs]
+
+		rates = self.fit(runs)
+		if rates is None:
+			return None
+		return files * rates[0] + transferred_bytes * rates[1]
@@ -0,0 +1,93 @@
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set
+import paramiko
+
+
+# link: Unchanged, linked from the former snapshot, transferred if that fails
+PlannedTransfer = NamedTuple("PlannedTransfer", [
+	("remote", Path), ("localfile", Path), ("attributes", paramiko.SFTPAttributes), ("link", bool)
+])
+
+
+class TransferPlan:
+	"""What a job does to the local side, decided before anything is transferred
+
+	The scan of a job fills the plan with the folders to create and the files to transfer or
+	link, after the same filters and overwrite-checks as a direct run. Executing the plan creates
+	the folders and hands the transfers to the downloads, so scanning and transferring are
+	separate stages that can be timed and estimated on their own. A plan that isn't executable
+	only describes the run, for a dry-run or an entry with options['simulate'].
+	"""
+
+	_name = None
+	""":type: str"""
+
+	_executable = True
+	""":type: bool"""
+
+	_directories = None
+	""":type: List[Path]"""
+
+	_known_directories = None
+	""":type: Set[str]"""
+
+	_transfers = None
+	""":type: List[PlannedTransfer]"""
+
+	_excluded = None
+	""":type: Dict[str, int]"""
+
+	_estimate = None
+	""":type: float"""
+
+	def __init__(self, name: str, executable: bool=True):
+		self._name = name
+		self._executable = executable
+		self._directories = []
+		self._known_directories = set()
+		self._transfers = []
+		self._excluded = {}
+
+	def get_name(self) -> str:
+		return self._name
+
+	def is_executable(self) -> bool:
+		return self._executable
+
+	def get_estimate(self) -> Optional[float]:
+		"""
+		:return: The estimated seconds of the execution, None without a history
+		"""
+		return self._estimate
+
+	def set_estimate(self, seconds: Optional[float]):
+		self._estimate = seconds
+
+	def add_directory(self, localdir: Path):
+		if str(localdir) not in self._known_directories:
+			self._known_directories.add(str(localdir))
+			self._directories.append(localdir)
+
+	def add_transfer(self, remote: Path, localfile: Path, attributes: paramiko.SFTPAttributes, link: bool=False):
+		self._transfers.append(PlannedTransfer(remote, localfile, attributes, link))
+
+	def add_excluded(self, reason: str):
+		self._excluded[reason] = self._excluded.get(reason, 0) + 1
+
+	def get_directories(self) -> List[Path]:
+		return self._directories
+
+	def get_transfers(self) -> List[PlannedTransfer]:
+		return self._transfers
+
+	def get_excluded(self) -> Dict[str, int]:
+		return self._excluded
+
+	def get_files(self) -> int:
+		return len([t for t in self._transfers if not t.link])
+
+	def get_bytes(self) -> int:
+		return sum(t.attributes.st_size for t in self._transfers if not t.link)
+
+	def get_links(self) -> int:
+		return len([t for t in self._transfers if t.link])
@@ -0,0 +1,110 @@
+from threading import Lock
+from time import monotonic
+
+
+class TransferStats:
+	"""Thread-safe counters of the transfers of a job, and its result once it's finished
+
+	Attributes:
+		_seconds	Sum of the durations of the single transfers, they overlap when downloading in parallel
+		_started	Start of the job, used for the wall-clock throughput
+		_finished	End of the job, set by finish()
+		_errcode	0 or the errcode of the JobException the job failed with
+	"""
+
+	_name = None
+	""":type: str"""
+
+	_files = 0
+	""":type: int"""
+
+	_bytes = 0
+	""":type: int"""
+
+	_seconds = 0.0
+	""":type: float"""
+
+	_delta_files = 0
+	""":type: int"""
+
+	_delta_remote_bytes = 0
+	""":type: int"""
+
+	_delta_fetched_bytes = 0
+	""":type: int"""
+
+	_delta_fallbacks = 0
+	""":type: int"""
+
+	_started = 0.0
+	""":type: float"""
+
+	_finished = None
+	""":type: float"""
+
+	_errcode = 0
+	""":type: int"""
+
+	_lock = None
+	""":type: Lock"""
+
+	def __init__(self, name: str=None):
+		self._name = name
+		self._lock = Lock()
+		self._started = monotonic()
+
+	def get_name(self) -> str:
+		return self._name
+
+	def finish(self, errcode: int=0):
+		self._finished = monotonic()
+		self._errcode = errcode
+
+	def get_errcode(self) -> int:
+		return self._errcode
+
+	def add_transfer(self, transferred_bytes: int, seconds: float):
+		with self._lock:
+			self._files += 1
+			self._bytes += transferred_bytes
+			self._seconds += seconds
+
+	def add_delta_sync(self, remote_bytes: int, fetched_bytes: int):
+		with self._lock:
+			self._delta_files += 1
+			self._delta_remote_bytes += remote_bytes
+			self._delta_fetched_bytes += fetched_bytes
+
+	def add_delta_fallback(self):
+		with self._lock:
+			self._delta_fallbacks += 1
+
+	def get_files(self) -> int:
+		return self._files
+
+	def get_bytes(self) -> int:
+		return self._bytes
+
+	def get_seconds(self) -> float:
+		return self._seconds
+
+	def get_elapsed(self) -> float:
+		end = self._finished if self._finished is not None else monotonic()
+		return end - self._started
+
+	def get_delta_files(self) -> int:
+		return self._delta_files
+
+	def get_delta_remote_bytes(self) -> int:
+		return self._delta_remote_bytes
+
+	def get_delta_fetched_bytes(self) -> int:
+		return self._delta_fetched_bytes
+
+	def get_delta_fallbacks(self) -> int:
+		return self._delta_fallbacks
+
+	def get_throughput(self) -> float:
+		"""Bytes per second over the wall-clock time of the job"""
+		elapsed = self.get_elapsed()
+		return self._bytes / elapsed if elapsed > 0 else 0.0
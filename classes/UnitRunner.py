@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from time import monotonic
+from traceback import format_exc
+from typing import List, NamedTuple, Optional, Tuple
+from fileutilslib.disklib.filetools import bytes_to_unit
+from classes.ConnectionPool import ConnectionPool
+from classes.WorkerBudget import WorkerBudget
+
+
+UnitResult = NamedTuple("UnitResult", [
+	("name", str), ("kind", str), ("waited", float), ("seconds", float), ("transferred", int), ("errcode", int)
+])
+
+
+class UnitRunner:
+	"""Runs the units of several configs in one process, in parallel as far as a WorkerBudget allows
+
+	Every unit reserves the cpu- and network-slots of its get_worker_demand() for its whole run and
+	gets the granted slots with set_worker_grant(), a unit whose demand was cut runs fewer workers.
+	The tickets of the WorkerBudget are taken before the threads start, so the reservations are
+	granted in the order of the configs. The units take their ssh-connections from a shared ConnectionPool, so
+	units that back up the same host with the same credentials connect and authenticate once.
+	A failing unit doesn't stop the others, the summary lists all of them.
+	"""
+
+	_units = None
+	""":type: List[modules.Unit.Unit]"""
+
+	_budget = None
+	""":type: WorkerBudget"""
+
+	_pool = None
+	""":type: ConnectionPool"""
+
+	_log = None
+	""":type: Logger"""
+
+	_results = None
+	""":type: List[UnitResult]"""
+
+	def __init__(self, units: List, budget: WorkerBudget, pool: ConnectionPool, log: Logger):
+		if len(units) == 0:
+			raise Exception("At least one unit has to be passed")
+
+		self._units = units
+		self._budget = budget
+		self._pool = pool
+		self._log = log
+
+		for unit in units:
+			unit.set_connection_pool(pool)
+
+	def get_results(self) -> List[UnitResult]:
+		return self._results
+
+	def _run_unit(self, unit, demand: Tuple[int, int], ticket: object) -> UnitResult:
+		requested = monotonic()
+		cpu, network = demand
+
+		with self._budget.reserve(cpu, network, ticket) as (cpu, network):
+			started = monotonic()
+			self._log.info("Starting '{}' with {} cpu- and {} network-slots".format(unit.get_name(), cpu, network))
+			try:
+				unit.set_worker_grant(cpu, network)
+				errcode = unit.run()
+			except Exception:
+				self._log.error("'{}' failed:\n{}".format(unit.get_name(), format_exc()))
+				errcode = 1
+			finally:
+				unit.flush_logs()
+
+		return UnitResult(
+			unit.get_name(),
+			type(unit).__name__,
+			started - requested,
+			monotonic() - started,
+			unit.get_transferred_bytes(),
+			errcode if errcode is not None else 0
+		)
+
+	def run(self) -> Optional[int]:
+		"""
+		:return: The errcode of the first failed unit or None
+		"""
+		self._log.info("Running {} units with a budget of {} cpu- and {} network-slots".format(
+			len(self._units), self._budget.get_cpu(), self._budget.get_network()
+		))
+
+		start = monotonic()
+		try:
+			demands = [unit.get_worker_demand() for unit in self._units]
+			tickets = [self._budget.enqueue() for _ in self._units]
+			with ThreadPoolExecutor(max_workers=len(self._units), thread_name_prefix="unit") as executor:
+				self._results = list(executor.map(self._run_unit, self._units, demands, tickets))
+			connections, acquired = len(self._pool), self._pool.get_acquired()
+		finally:
+			self._pool.close()
+
+		self._report(monotonic() - start, connections, acquired)
+
+		for result in self._results:
+			if result.errcode != 0:
+				return result.errcode
+		return None
+
+	def _report(self, elapsed: float, connections: int, acquired: int):
+		div = "==============="
+		self._log.info("{}\nUnit summary\n{}".format(div, div))
+		for result in self._results:
+			self._log.info("{:<30} {:<16} waited {:>7.1f}s ran {:>8.1f}s {:>12}  exit {}".format(
+				result.name,
+				result.kind,
+				result.waited,
+				result.seconds,
+				bytes_to_unit(result.transferred, 1, True, False),
+				result.errcode
+			))
+		self._log.info("{} units in {:.1f}s, {} failed, {} in total".format(
+			len(self._results),
+			elapsed,
+			len([result for result in self._results if result.errcode != 0]),
+			bytes_to_unit(sum(result.transferred for result in self._results), 1, True, False)
+		))
+		if acquired > 0:
+			self._log.info("{} ssh-connections served {} connects of the units and hosts".format(connections, acquired))
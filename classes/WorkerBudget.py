@@ -0,0 +1,95 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import Deque, Iterator, Tuple
+
+
+class WorkerBudget:
+	"""Slots of cpu and network that the units of a process reserve for the duration of their run
+
+	A unit reserves the slots its workers need: cpu-slots for compressing and hashing threads,
+	network-slots for SFTP-channels and remote streams. Reservations are granted in the order of
+	their tickets, a unit waits until every unit before it started and its slots are free, so a
+	large unit isn't starved by small ones. enqueue() takes the tickets up front in a given order,
+	otherwise the threads take them in the order they reach acquire(). A demand beyond the budget
+	is cut to the whole budget, such a unit runs alone.
+	"""
+
+	_cpu = 1
+	""":type: int"""
+
+	_network = 1
+	""":type: int"""
+
+	_free_cpu = 1
+	""":type: int"""
+
+	_free_network = 1
+	""":type: int"""
+
+	_waiting = None
+	""":type: Deque[object]"""
+
+	_condition = None
+	""":type: Condition"""
+
+	def __init__(self, cpu: int, network: int):
+		if cpu < 1 or network < 1:
+			raise Exception("A worker-budget needs at least one cpu- and one network-slot")
+
+		self._cpu = self._free_cpu = cpu
+		self._network = self._free_network = network
+		self._waiting = deque()
+		self._condition = Condition()
+
+	def get_cpu(self) -> int:
+		return self._cpu
+
+	def get_network(self) -> int:
+		return self._network
+
+	def clamp(self, cpu: int, network: int) -> Tuple[int, int]:
+		return min(max(cpu, 0), self._cpu), min(max(network, 0), self._network)
+
+	def enqueue(self) -> object:
+		"""Takes the next place in the order of the reservations, to be passed to acquire()"""
+		ticket = object()
+		with self._condition:
+			self._waiting.append(ticket)
+		return ticket
+
+	def acquire(self, cpu: int, network: int, ticket: object=None) -> Tuple[int, int]:
+		"""Blocks until the slots are free and every earlier reservation was granted
+
+		:param ticket: The place taken with enqueue(), a new one at the end of the queue by default
+		:return: The reserved slots, to be released again
+		"""
+		cpu, network = self.clamp(cpu, network)
+		if ticket is None:
+			ticket = self.enqueue()
+
+		with self._condition:
+			self._condition.wait_for(
+				lambda: self._waiting[0] is ticket and cpu <= self._free_cpu and network <= self._free_network
+			)
+			self._waiting.popleft()
+			self._free_cpu -= cpu
+			self._free_network -= network
+			# The next one may fit as well
+			self._condition.notify_all()
+
+		return cpu, network
+
+	def release(self, cpu: int, network: int):
+		with self._condition:
+			self._free_cpu += cpu
+			self._free_network += network
+			self._condition.notify_all()
+
+	@contextmanager
+	def reserve(self, cpu: int, network: int, ticket: object=None) -> Iterator[Tuple[int, int]]:
+		reserved = self.acquire(cpu, network, ticket)
+		try:
+			yield reserved
+		finally:
+			self.release(*reserved)
@@ -1,16 +1,55 @@
+import json
 import click
+from io import StringIO
+from logging import INFO
+from os import cpu_count
+from pathlib import Path
 from fileutilslib.classes.ConsoleColors import ConsoleColors, ConsoleColor
 from fileutilslib.misclib.helpertools import list_to_str, get_reformatted_exception
-from classes.LoggerFactory import LoggerFactory
-from modules.FileBackupUnit import FileBackupUnit
-from modules.ImageBackupUnit import ImageBackupUnit
+from classes.LoggerFactory import LoggerFactory, LoggerHandlerConfig
 from classes.PythonLiteralOption import PythonLiteralOption
+# The units and everything that needs paramiko are imported by the commands that use them,
+# so --help and image-backups don't pay for the ssh- and crypto-stack
 
 backuptypes_str = list_to_str(["ssh", "image"], ", ", True, " or ", "'", "'")
 
 
-@click.command()
-@click.option("--configfile", type=click.File(mode='r'), help="Path to the configfile used for image- or filebackup")
+def load_unit(configfile, backuptype: str, factory: LoggerFactory, group: str, ignoreoptions, dry_run: bool=False):
+	"""Creates the unit of a configfile, an image-backup if backuptype says so or the config has options['local']"""
+	text = configfile.read()
+	if backuptype is None:
+		backuptype = "image" if "local" in json.loads(text).get("options", {}) else "ssh"
+
+	if backuptype == "image":
+		if dry_run:
+			raise Exception("'{}' is an image-backup, only ssh-backups can be planned in a dry-run".format(configfile.name))
+		from modules.ImageBackupUnit import ImageBackupUnit
+		unit = ImageBackupUnit(StringIO(text), factory)
+		if unit.is_interactive():
+			raise Exception("'{}' is interactive, only non-interactive image-backups can run together".format(
+				configfile.name
+			))
+		return unit
+
+	from modules.FileBackupUnit import FileBackupUnit
+	unit = FileBackupUnit(StringIO(text), True, factory, group, ignoreoptions)
+	unit.set_dry_run(dry_run)
+	return unit
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+@click.option(
+	"--configfile",
+	type=click.File(mode='r'),
+	multiple=True,
+	help="Path to the configfile used for image- or filebackup, several are run in one process"
+)
+@click.option(
+	"--configdir",
+	type=click.Path(exists=True, file_okay=False),
+	help="Folder whose *.json-configfiles are run in one process, like several --configfile"
+)
 @click.option("--backuptype", type=click.Choice(['ssh', 'image']), help="Either {}".format(backuptypes_str))
 @click.option(
 	"--group",
@@ -28,16 +67,47 @@ backuptypes_str = list_to_str(["ssh", "image"], ", ", True, " or ", "'", "'")
 	help=
 	"A list of backup-unit-options that should be ignored. Format: '[\"skip\", \"overwrite_newer\"]'"
 )
-def backup(configfile, backuptype, group, ignoreoptions):
+@click.option("--cpu-slots", type=int, default=cpu_count() or 1, help="Compressing threads of all units that run at once")
+@click.option("--network-slots", type=int, default=10, help="Parallel downloads and streams of all units that run at once")
+@click.option(
+	"--dry-run",
+	is_flag=True,
+	help="Plan the ssh-backups and print the files, bytes and estimated duration, without transferring anything"
+)
+def backup(ctx, configfile, configdir, backuptype, group, ignoreoptions, cpu_slots, network_slots, dry_run):
+	if ctx.invoked_subcommand is not None:
+		return
+
 	try:
 		factory = LoggerFactory("backup")
+		configpaths = sorted(Path(configdir).glob("*.json")) if configdir is not None else []
+
+		if len(configfile) + len(configpaths) > 1 or configdir is not None:
+			from classes.ConnectionPool import ConnectionPool
+			from classes.UnitRunner import UnitRunner
+			from classes.WorkerBudget import WorkerBudget
+
+			log = factory.addlogger("units", [LoggerHandlerConfig.create_console_err_config(INFO)])
+			units = [load_unit(f, backuptype, factory, group, ignoreoptions, dry_run) for f in configfile]
+			for path in configpaths:
+				with open(str(path)) as f:
+					units.append(load_unit(f, backuptype, factory, group, ignoreoptions, dry_run))
+			errcode = UnitRunner(units, WorkerBudget(cpu_slots, network_slots), ConnectionPool(log.info), log).run()
+			return errcode if errcode is not None else 1
+
+		configfile = configfile[0] if len(configfile) > 0 else None
 		if backuptype == "image":
+			if dry_run:
+				raise Exception("Only ssh-backups can be planned in a dry-run")
+			from modules.ImageBackupUnit import ImageBackupUnit
 			b = ImageBackupUnit(configfile, factory)
 		elif backuptype == "ssh":
+			from modules.FileBackupUnit import FileBackupUnit
 			b = FileBackupUnit(configfile, True, factory, group, ignoreoptions)
+			b.set_dry_run(dry_run)
 		else:
 			raise Exception("Backup-Unit-Type invalid")
-		b.run()
+		errcode = b.run()
 	except Exception as e:
 		print(ConsoleColor.colorline(get_reformatted_exception("Error in backup-function", e), ConsoleColors.FAIL))
 		print(ConsoleColor.colorline(str(e), ConsoleColors.FAIL))
@@ -45,6 +115,85 @@ def backup(configfile, backuptype, group, ignoreoptions):
 	except (KeyboardInterrupt, SystemExit):
 		print(ConsoleColor.colorline("Application killed via CTRL+C", ConsoleColors.FAIL))
 		return 3
+	else:
+		return errcode if errcode is not None else 1
+
+
+@backup.command("restore-image")
+@click.option("--configfile", type=click.File(mode='r'), required=True, help="Path to the configfile of the image-backup")
+@click.option("--manifest", type=click.Path(exists=True, dir_okay=False), required=True, help="Manifest of the chunkstore to restore")
+@click.option("--target", type=click.Path(), required=True, help="Image-file or device the image is written to")
+def restore_image(configfile, manifest, target):
+	"""Reassembles an image from a manifest of the chunkstore of an image-backup"""
+	from modules.ImageBackupUnit import ImageBackupUnit
+
+	try:
+		factory = LoggerFactory("restore")
+		ImageBackupUnit(configfile, factory).restore(manifest, target)
+	except Exception as e:
+		print(ConsoleColor.colorline(get_reformatted_exception("Error in restore-function", e), ConsoleColors.FAIL))
+		print(ConsoleColor.colorline(str(e), ConsoleColors.FAIL))
+		return 2
+	except (KeyboardInterrupt, SystemExit):
+		print(ConsoleColor.colorline("Application killed via CTRL+C", ConsoleColors.FAIL))
+		return 3
+	else:
+		return 1
+
+
+@backup.command("restore-files")
+@click.option("--configfile", type=click.File(mode='r'), required=True, help="Path to the configfile of the ssh-backup")
+@click.option("--tree", type=click.Path(exists=True, dir_okay=False), required=True, help="Tree of the repository to restore")
+@click.option("--target", type=click.Path(file_okay=False), required=True, help="Folder the files are restored to")
+def restore_files(configfile, tree, target):
+	"""Recreates the files of a tree from the repository of an ssh-backup"""
+	from modules.FileBackupUnit import FileBackupUnit
+
+	try:
+		factory = LoggerFactory("restore")
+		FileBackupUnit(configfile, True, factory).restore(tree, target)
+	except Exception as e:
+		print(ConsoleColor.colorline(get_reformatted_exception("Error in restore-function", e), ConsoleColors.FAIL))
+		print(ConsoleColor.colorline(str(e), ConsoleColors.FAIL))
+		return 2
+	except (KeyboardInterrupt, SystemExit):
+		print(ConsoleColor.colorline("Application killed via CTRL+C", ConsoleColors.FAIL))
+		return 3
+	else:
+		return 1
+
+
+@backup.command("daemon")
+@click.option(
+	"--configfile",
+	type=click.Path(exists=True, dir_okay=False),
+	required=True,
+	multiple=True,
+	help="Path to the configfile of an ssh-backup with options['schedule'], can be passed multiple times"
+)
+@click.option("--statusfile", type=click.Path(dir_okay=False), help="File the status of the last runs is written to as json")
+def daemon(configfile, statusfile):
+	"""Runs ssh-backups on their schedules and keeps their connections open between the runs"""
+	from classes.Daemon import Daemon
+	from modules.FileBackupUnit import FileBackupUnit
+
+	try:
+		factory = LoggerFactory("daemon")
+
+		def create_unit(f):
+			unit = FileBackupUnit(f, True, factory)
+			unit.set_keep_connection(True)
+			return unit
+
+		log = factory.addlogger("daemon", [LoggerHandlerConfig.create_console_err_config(INFO)])
+		Daemon(list(configfile), create_unit, log, statusfile).run()
+	except Exception as e:
+		print(ConsoleColor.colorline(get_reformatted_exception("Error in daemon-function", e), ConsoleColors.FAIL))
+		print(ConsoleColor.colorline(str(e), ConsoleColors.FAIL))
+		return 2
+	except (KeyboardInterrupt, SystemExit):
+		print(ConsoleColor.colorline("Application killed via CTRL+C", ConsoleColors.FAIL))
+		return 3
 	else:
 		return 1
 
@@ -1,17 +1,41 @@
+import shutil
 import stat
 from datetime import datetime
-from fnmatch import fnmatch
+from hashlib import sha256
 from os import lstat
-from os import makedirs, utime
+from os import makedirs, replace, utime
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 from pathlib import Path
-from typing import Dict, List
+from shlex import quote
+from threading import local
+from time import monotonic
+from traceback import format_exc
+from typing import Callable, Dict, Iterable, List, Set, Tuple
 import paramiko
-from fileutilslib.disklib.filetools import get_filesize_progress_divider, bytes_to_unit, path_from_partindex
+from fileutilslib.disklib.filetools import bytes_to_unit, path_from_partindex
 from fileutilslib.misclib.helpertools import assert_obj_has_keys, is_sequence_with_any_elements, repeat, \
-	string_is_empty, is_empty_dict, is_integer
+	is_empty_dict, is_integer
 from classes.BackupEntry import BackupEntryType, BackupEntry
+from classes.DeltaSync import DeltaSync, DeltaSyncException
+from classes.DownloadProgress import DownloadProgress
+from classes.DirectoryCache import DirectoryCache
+from classes.EntryMatcher import EntryMatcher
 from classes.JobException import JobException
 from classes.LoggerFactory import LoggerFactory
+from classes.Manifest import Manifest
+from classes.Metrics import Metrics
+from classes.PackRepository import PackRepository, RepositoryTree
+from classes.ReconnectingTransport import ReconnectingTransport, CONNECTION_ERRORS
+from classes.RemoteScanner import RemoteScanner, RemoteScanException, RemoteScanRecord
+from classes.RemoteTarStream import RemoteTarStream, RemoteTarStreamException
+from classes.SftpDownloader import SftpDownloader, SftpFileChangedException
+from classes.SftpWorkerPool import SftpWorkerPool
+from classes.Snapshots import Snapshots
+from classes.SshConnection import SshConnection
+from classes.TransferHistory import TransferHistory
+from classes.TransferPlan import TransferPlan
+from classes.TransferStats import TransferStats
 from modules.Unit import Unit
 
 
@@ -19,7 +43,32 @@ class FileBackupUnit(Unit):
 	"""Used for downloading dirs and single files from a remote ssh host and syncing them to local dirs
 
 	Attributes:
-		_transport 	Used for the current ssh session
+		_connection	The ssh session of the current run, connects again when the transport drops
+		_hosts		The hosts of options['hosts'], each is backed up by a copy of this unit
+		_results	The stats of the jobs of the last run
+		_job		Thread-local state of the job that is executed by the calling thread:
+					pool	Executes the downloads in parallel when options['max_workers'] is greater than 1
+					stats	Counters of the transfers of the job
+		_manifest	Index of the last successful run, stands in for the local mtimes when options['manifest']
+					is set, a single lstat checks that the local copy still has the recorded size
+		_reconnect	Attempts, first backoff and maximal backoff in seconds of options['reconnect']
+		_verify_checksum	Compare the sha256 of every download with a sha256sum of the remote file
+		_snapshots	Each run writes into targetdir/<timestamp>/ and hardlinks the unchanged files from
+					the former snapshot when options['snapshots'] is set
+		_repository	Stores the downloaded files deduplicated when options['repository'] is set, shared
+					by the copies of all hosts
+		_repository_tree	The files of the current run, the former tree replaces the local files
+		_keep_connection	The connections stay open between runs, for the daemon
+		_connections	The kept connections of the hosts of options['hosts'], by their name
+		_dircache	Listings of the remote directories of the last successful run, reused for the
+					directories whose mtime didn't change when options['dircache'] is set, listed
+					again after options['dircache']['revalidate_days'], 1 by default
+		_plan_transfers	Every job scans its entry into a TransferPlan first and executes it afterwards,
+					when options['plan'] is set
+		_dry_run	The jobs only plan and report what they would transfer
+		_history	Durations of the executed plans, estimate the duration of new ones
+		_plans		The plans of the jobs of the current run
+		_localdirs	The local folders of the current run, swept for abandoned parts after it succeeded
 	"""
 	_entries = None
 
@@ -38,14 +87,8 @@ class FileBackupUnit(Unit):
 	_targetdir = None
 	""":type: str"""
 
-	_last_dl_bytes = 0
-	""":type: long"""
-
-	_current_progress_divider = 0
-	""":type: int"""
-
-	_transport = None
-	""":type: paramiko.Transport"""
+	_connection = None
+	""":type: ReconnectingTransport"""
 
 	_copystats = False
 	""":type: bool"""
@@ -56,6 +99,110 @@ class FileBackupUnit(Unit):
 	_processonly_types = None
 	""":type: str[]"""
 
+	_max_workers = 1
+	""":type: int"""
+
+	_max_parallel_jobs = 1
+	""":type: int"""
+
+	_hosts = None
+	""":type: List[Dict]"""
+
+	_max_parallel_hosts = 1
+	""":type: int"""
+
+	_results = None
+	""":type: List[TransferStats]"""
+
+	_job = None
+	""":type: threading.local"""
+
+	_use_manifest = False
+	""":type: bool"""
+
+	_manifest_hash = False
+	""":type: bool"""
+
+	_manifest = None
+	""":type: Manifest"""
+
+	_remote_scan = False
+	""":type: bool"""
+
+	_delta_sync = None
+	""":type: DeltaSync"""
+
+	_delta_min_size = 1024 * 1024
+	""":type: int"""
+
+	_delta_max_size = 64 * 1024 * 1024
+	""":type: int"""
+
+	_downloader = None
+	""":type: SftpDownloader"""
+
+	_reconnect = (5, 1.0, 60.0)
+	""":type: Tuple[int, float, float]"""
+
+	_verify_checksum = False
+	""":type: bool"""
+
+	_use_snapshots = False
+	""":type: bool"""
+
+	_snapshots = None
+	""":type: Snapshots"""
+
+	_repository = None
+	""":type: PackRepository"""
+
+	_repository_tree = None
+	""":type: RepositoryTree"""
+
+	_use_dircache = False
+	""":type: bool"""
+
+	_dircache_max_age = DirectoryCache.MAX_AGE
+	""":type: float"""
+
+	_dircache = None
+	""":type: DirectoryCache"""
+
+	_keep_connection = False
+	""":type: bool"""
+
+	_keepalive = None
+	""":type: int"""
+
+	_connections = None
+	""":type: Dict[str, ReconnectingTransport]"""
+
+	_plan_transfers = False
+	""":type: bool"""
+
+	_dry_run = False
+	""":type: bool"""
+
+	_history = None
+	""":type: TransferHistory"""
+
+	_plans = None
+	""":type: List[TransferPlan]"""
+
+	_localdirs = None
+	""":type: Set[Path]"""
+
+	MAX_CHANGED_RETRIES = 3
+	"""Downloads of a file that keeps changing while it is read, before it fails"""
+
+	_OPTION_ATTRIBUTES = (
+		"_keyfile", "_keepalive", "_max_parallel_hosts", "_copystats", "_processonly_types", "_max_workers",
+		"_max_parallel_jobs", "_use_manifest", "_manifest_hash", "_remote_scan", "_plan_transfers", "_reconnect",
+		"_verify_checksum", "_use_snapshots", "_use_dircache", "_dircache_max_age", "_repository", "_delta_sync",
+		"_delta_min_size", "_delta_max_size"
+	)
+	"""The attributes set from the options, a reload resets them to the defaults of the class first"""
+
 	def __init__(
 		self,
 		configfile,
@@ -67,7 +214,7 @@ class FileBackupUnit(Unit):
 		super().__init__(
 			"FileBackup",
 			configfile,
-			["name", "host", "user", "password", "targetdir"],
+			["name", "targetdir"],
 			self.on_config_loaded,
 			logfactory,
 			group,
@@ -76,10 +223,11 @@ class FileBackupUnit(Unit):
 
 		self._entries = []
 		self._show_copystats = show_copystats
+		self._job = local()
+		self._connections = {}
 
 	def __del__(self):
-		if self._transport is not None:
-			self._transport.close()
+		self.close()
 
 	def __str__(self):
 		dbg = super().__str__()
@@ -101,135 +249,403 @@ class FileBackupUnit(Unit):
 		self._host = None
 		self._user = None
 		self._password = None
+		self._hosts = None
+
+		# An option removed from the config of a reloaded unit must not stay active
+		if self._repository is not None:
+			self._repository.close()
+		for attribute in FileBackupUnit._OPTION_ATTRIBUTES:
+			setattr(self, attribute, getattr(FileBackupUnit, attribute))
 
 		options = self._jsondata["options"]
 
-		self._host = options["host"]
-		self._user = options["user"]
-		self._password = options["password"]
+		if "hosts" in options:
+			self._hosts = self._parse_hosts(options)
+		else:
+			assert_obj_has_keys(options, "options", ["host", "user", "password"])
+			self._host = options["host"]
+
+		self._user = options["user"] if "user" in options else None
+		self._password = options["password"] if "password" in options else None
 		self._targetdir = options["targetdir"]
 
 		if "keyfile" in options:
 			self._keyfile = options["keyfile"]
 
+		if "keepalive" in options:
+			keepalive = options["keepalive"]
+			if not is_integer(keepalive) or keepalive < 0:
+				raise Exception("json-config options['keepalive'] has to be an integer of at least 0")
+			self._keepalive = keepalive
+
+		if "max_parallel_hosts" in options:
+			max_parallel_hosts = options["max_parallel_hosts"]
+			if not is_integer(max_parallel_hosts) or max_parallel_hosts < 1:
+				raise Exception("json-config options['max_parallel_hosts'] has to be an integer greater than 0")
+			self._max_parallel_hosts = max_parallel_hosts
+
 		if "copystats" in options:
 			self._copystats = options["copystats"]
 
 		if "processonly_types" in options:
 			self._processonly_types = options["processonly_types"].split(",")
 
+		if "max_workers" in options:
+			max_workers = options["max_workers"]
+			if not is_integer(max_workers) or max_workers < 1:
+				raise Exception("json-config options['max_workers'] has to be an integer greater than 0")
+			self._max_workers = max_workers
+
+		if "max_parallel_jobs" in options:
+			max_parallel_jobs = options["max_parallel_jobs"]
+			if not is_integer(max_parallel_jobs) or max_parallel_jobs < 1:
+				raise Exception("json-config options['max_parallel_jobs'] has to be an integer greater than 0")
+			self._max_parallel_jobs = max_parallel_jobs
+
+		if "manifest" in options:
+			self._use_manifest = options["manifest"] is True
+
+		if "manifest_hash" in options:
+			self._manifest_hash = options["manifest_hash"] is True
+
+		if "remote_scan" in options:
+			self._remote_scan = options["remote_scan"] is True
+
+		if "plan" in options:
+			self._plan_transfers = options["plan"] is True
+
+		self._downloader = SftpDownloader(
+			options["sftp_block_size"] if "sftp_block_size" in options else None,
+			options["sftp_max_requests"] if "sftp_max_requests" in options else None,
+			options["checkpoint_interval"] if "checkpoint_interval" in options else None,
+			options["part_max_age_days"] * 86400 if "part_max_age_days" in options else None
+		)
+
+		if "reconnect" in options:
+			reconnect = options["reconnect"]
+			if reconnect is False:
+				self._reconnect = (0, 0.0, 0.0)
+			elif isinstance(reconnect, dict):
+				attempts, backoff, max_backoff = FileBackupUnit._reconnect
+				self._reconnect = (
+					reconnect["attempts"] if "attempts" in reconnect else attempts,
+					reconnect["backoff"] if "backoff" in reconnect else backoff,
+					reconnect["max_backoff"] if "max_backoff" in reconnect else max_backoff
+				)
+				if not is_integer(self._reconnect[0]) or self._reconnect[0] < 0:
+					raise Exception("json-config options['reconnect']['attempts'] has to be an integer of at least 0")
+			elif reconnect is not True:
+				raise Exception("json-config options['reconnect'] has to be a boolean or a dict")
+
+		if "verify_checksum" in options:
+			self._verify_checksum = options["verify_checksum"] is True
+
+		if "snapshots" in options:
+			self._use_snapshots = options["snapshots"] is True
+
+		if "dircache" in options:
+			dircache = options["dircache"]
+			if dircache is True:
+				dircache = {}
+			if isinstance(dircache, dict):
+				self._use_dircache = True
+				if "revalidate_days" in dircache:
+					revalidate_days = dircache["revalidate_days"]
+					if not isinstance(revalidate_days, (int, float)) or isinstance(revalidate_days, bool) or revalidate_days <= 0:
+						raise Exception("json-config options['dircache']['revalidate_days'] has to be a positive number")
+					self._dircache_max_age = revalidate_days * 86400
+			elif dircache is not False:
+				raise Exception("json-config options['dircache'] has to be a boolean or a dict")
+
+		if "repository" in options:
+			repository = options["repository"]
+			if repository is True:
+				repository = {}
+			if isinstance(repository, dict):
+				if self._use_snapshots:
+					raise Exception("json-config options['repository'] and options['snapshots'] exclude each other")
+				self._repository = PackRepository(
+					repository["folder"] if "folder" in repository else self._targetdir,
+					repository["chunk_size"] if "chunk_size" in repository else None,
+					repository["pack_size"] if "pack_size" in repository else None,
+					repository["format"] if "format" in repository else None,
+					repository["level"] if "level" in repository else None
+				)
+			elif repository is not False:
+				raise Exception("json-config options['repository'] has to be a boolean or a dict")
+
+		if "delta_sync" in options:
+			delta_sync = options["delta_sync"]
+			if delta_sync is True:
+				delta_sync = {}
+			if isinstance(delta_sync, dict):
+				if "min_size" in delta_sync:
+					self._delta_min_size = delta_sync["min_size"]
+				if "max_size" in delta_sync:
+					self._delta_max_size = delta_sync["max_size"]
+				self._delta_sync = DeltaSync(
+					None,
+					delta_sync["python"] if "python" in delta_sync else "python3",
+					delta_sync["block_size"] if "block_size" in delta_sync else None
+				)
+			elif delta_sync is not False:
+				raise Exception("json-config options['delta_sync'] has to be a boolean or a dict")
+
 		assert_obj_has_keys(self._jsondata, "json", ["pathes"])
 
-	def _check_option_ignored(self, optionname: str):
-		if is_sequence_with_any_elements(self._ignoreoptions):
-			if optionname in self._ignoreoptions:
-				return True
-		return False
+	@staticmethod
+	def _parse_hosts(options: Dict) -> List[Dict]:
+		"""options['hosts'] contains hostnames or dicts with a host-key that may override name, user,
+		password and keyfile of the options. name is the folder below targetdir, it defaults to host.
+		"""
+		hosts = options["hosts"]
+
+		if not is_sequence_with_any_elements(hosts) or isinstance(hosts, str):
+			raise Exception("json-config options['hosts'] has to be a list of hostnames or host-dicts")
+
+		parsed = []
+		names = set()
+
+		for host in hosts:
+			if isinstance(host, str):
+				host = {"host": host}
+			assert_obj_has_keys(host, "options['hosts']", ["host"])
+
+			h = {"host": host["host"], "name": host["host"].replace(":", "_")}
+			for key in ("name", "user", "password", "keyfile"):
+				if key in host:
+					h[key] = host[key]
+				elif key in options:
+					h[key] = options[key]
 
-	def _check_folder_with_options(self, remote_root, remote_path, options):
-		accept = None
+			if "user" not in h or ("password" not in h and "keyfile" not in h):
+				raise Exception("json-config host {} needs a user and a password or keyfile".format(h["host"]))
 
-		if is_sequence_with_any_elements(options):
-			if "exclude_folders" in options and not self._check_option_ignored("exclude_folders"):
-				exfolders = options["exclude_folders"]
+			if h["name"] in names:
+				raise Exception("json-config options['hosts'] contains the name {} twice".format(h["name"]))
+			names.add(h["name"])
 
-				if not is_sequence_with_any_elements(exfolders):
-					raise JobException("options['exclude_folders'] has to contain a list of shell-file-patters", 10)
+			parsed.append(h)
+
+		return parsed
+
+	def get_results(self) -> List[TransferStats]:
+		return self._results
+
+	def get_worker_demand(self) -> Tuple[int, int]:
+		"""A network-slot per parallel download of every job and host that runs at once"""
+		jobs = max(min(self._max_parallel_jobs, len(self._jsondata["pathes"])), 1)
+		hosts = min(self._max_parallel_hosts, len(self._hosts)) if self._hosts is not None else 1
+		return 1, jobs * self._max_workers * hosts
+
+	def set_worker_grant(self, cpu: int, network: int):
+		"""Fits the parallel hosts, the parallel jobs and the workers of a job into the network-slots, in that precedence"""
+		if network >= self.get_worker_demand()[1]:
+			return
 
-				for exfolder in exfolders:
-					if remote_root is not None and not Path(exfolder).is_absolute():
-						exfolder = remote_root.joinpath(exfolder)
+		network = max(network, 1)
+		jobs = max(min(self._max_parallel_jobs, len(self._jsondata["pathes"])), 1)
+		hosts = min(self._max_parallel_hosts, len(self._hosts)) if self._hosts is not None else 1
+
+		hosts = min(hosts, network)
+		jobs = max(min(jobs, network // hosts), 1)
+		workers = max(min(self._max_workers, network // (hosts * jobs)), 1)
+
+		self.info("Running {} hosts with {} jobs of {} workers each for the {} granted network-slots".format(
+			hosts, jobs, workers, network
+		))
+		if self._hosts is not None:
+			self._max_parallel_hosts = hosts
+		self._max_parallel_jobs = jobs
+		self._max_workers = workers
+
+	def get_transferred_bytes(self) -> int:
+		return sum(stats.get_bytes() for stats in self._results) if self._results is not None else 0
+
+	def set_dry_run(self, dry_run: bool):
+		"""Plans every job and reports its transfers and estimated duration, without transferring or saving anything"""
+		self._dry_run = dry_run
+
+	def get_plans(self) -> List[TransferPlan]:
+		"""The plans of the jobs of the last run"""
+		return self._plans
+
+	def set_keep_connection(self, keep: bool):
+		"""Keeps the connections open between runs, with keepalives every options['keepalive'] (30) seconds"""
+		self._keep_connection = keep
+
+	def is_connected(self) -> bool:
+		connections = list(self._connections.values()) + ([self._connection] if self._connection is not None else [])
+		return len(connections) > 0 and all(not connection.is_dropped() for connection in connections)
+
+	def close(self):
+		"""Closes the kept connections"""
+		if self._connection is not None:
+			self._connection.close()
+			self._connection = None
+		if self._connections is not None:
+			for connection in self._connections.values():
+				connection.close()
+			self._connections = {}
+
+	def _for_host(self, host: Dict) -> "FileBackupUnit":
+		"""A copy of this unit that backs up the same pathes from host into targetdir/<name>"""
+		unit = copy(self)
+		unit._hosts = None
+		unit._host = host["host"]
+		unit._user = host["user"]
+		unit._password = host["password"] if "password" in host else None
+		unit._keyfile = host["keyfile"] if "keyfile" in host else None
+		unit._targetdir = str(Path(self._targetdir, host["name"]))
+		unit._connection = self._connections.get(host["name"]) if self._keep_connection else None
+		unit._connections = {}
+		unit._entries = []
+		unit._manifest = None
+		unit._snapshots = None
+		unit._repository_tree = None
+		unit._dircache = None
+		unit._history = None
+		unit._plans = None
+		unit._localdirs = None
+		unit._results = None
+		unit._job = local()
+		unit._logtag = local()
+		unit._delta_sync = copy(self._delta_sync)
+		unit._metrics = None
+		# The metrics of all hosts are written together by _run_hosts
+		unit._metrics_json = None
+		unit._metrics_prometheus = None
+		unit.set_logprefix(host["name"])
+		return unit
+
+	def _run_hosts(self):
+		"""Runs a copy of this unit per host, options['max_parallel_hosts'] at once
+
+		:return: The errcode of the first failed host or None
+		"""
+		self.info("Backing up {} hosts, up to {} in parallel".format(len(self._hosts), self._max_parallel_hosts))
+
+		def run_host(host: Dict):
+			unit = self._for_host(host)
+			start = monotonic()
+			try:
+				errcode = unit.run()
+			except Exception as e:
+				unit.error(format_exc())
+				errcode = 1
+			if self._keep_connection and unit._connection is not None:
+				self._connections[host["name"]] = unit._connection
+				# The copy mustn't close it when it's collected
+				unit._connection = None
+			return host, errcode, monotonic() - start, unit.get_results(), unit.get_metrics()
+
+		with ThreadPoolExecutor(max_workers=self._max_parallel_hosts, thread_name_prefix="host") as executor:
+			results = list(executor.map(run_host, self._hosts))
+
+		self.write_metrics([metrics for _, _, _, _, metrics in results if metrics is not None])
+		self._results = [stats for _, _, _, jobs, _ in results if jobs is not None for stats in jobs]
+
+		self.info("{}\nHost summary\n{}".format(self._div, self._div))
+		for host, errcode, seconds, jobs, _ in results:
+			jobs = jobs if jobs is not None else []
+			self.info("{:<30} {:>8.1f}s {:>8} files {:>12}  exit {}".format(
+				host["name"],
+				seconds,
+				sum(stats.get_files() for stats in jobs),
+				bytes_to_unit(sum(stats.get_bytes() for stats in jobs), 1, True, False),
+				errcode if errcode is not None else 0
+			))
 
-					if fnmatch(str(remote_path), str(exfolder)):
-						accept = "EXCLUDE_FOLDERS"
-						break
+		for _, errcode, _, _, _ in results:
+			if errcode is not None and errcode != 0:
+				return errcode
+		return None
 
-			if (
-				accept is None and
-				"group" in options and
-				not string_is_empty(self._group) and
-				not self._check_option_ignored("group")
-			):
-				group = options["group"]
-				if not string_is_empty(group):
-					if group != self._group:
-						accept = "GROUP"
+	def _check_option_ignored(self, optionname: str):
+		if is_sequence_with_any_elements(self._ignoreoptions):
+			if optionname in self._ignoreoptions:
+				return True
+		return False
 
-		return accept
+	@staticmethod
+	def _check_folder_with_options(remote_root: Path, remote_path: Path, entry: BackupEntry):
+		return entry.get_matcher().check_folder(
+			str(remote_root) if remote_root is not None else None,
+			str(remote_path)
+		)
 
 	def _check_file_with_options(
 		self,
-		options: dict,
+		entry: BackupEntry,
 		remoteroot: Path,
 		localfile: Path,
 		remotefile: Path,
 		remote_stat,
 		prepend_output_tabs="\t"
 	):
+		options = entry.get_options()
 		do_transfer = None
 
 		if stat.S_ISLNK(remote_stat.st_mode):
 			do_transfer = "IS_LINK"
 
-		if "overwrite_existing" in options and not self._check_option_ignored("overwrite_existing"):
-			if localfile.exists() and options["overwrite_existing"] is False:
-				do_transfer = "OVERWRITE_EXISTING"
+		if do_transfer is None:
+			# The compiled patterns are cheaper than looking at the local file, so they come first
+			do_transfer = entry.get_matcher().check_file(str(remoteroot), str(remotefile))
+
+		# A record of the last run stands in for the mtime of the local file, a single lstat
+		# still makes sure the local copy wasn't deleted or truncated since
+		manifest_record = None
+		damaged = False
+		if do_transfer is None and self._manifest is not None:
+			manifest_record = self._manifest.get(str(remotefile))
+			if manifest_record is not None:
+				try:
+					damaged = lstat(str(localfile)).st_size != manifest_record.size
+				except FileNotFoundError:
+					manifest_record = None
+				if damaged:
+					manifest_record = None
+		elif do_transfer is None and self._repository_tree is not None:
+			manifest_record = self._repository_tree.get(str(remotefile))
+			# The blobs may have been removed from the repository since
+			if manifest_record is not None and not self._repository.has_blobs(self._repository_tree.get_chunks(str(remotefile))):
+				manifest_record = None
 
 		if (
 			do_transfer is None and
-			"overwrite_newer" in options and
-			options["overwrite_newer"] is True and
-			not self._check_option_ignored("overwrite_newer")
-		):
-			if localfile.exists():
-				local_stat = lstat(str(localfile))
-				if local_stat.st_mtime >= remote_stat.st_mtime:
-					self.info("{}Remote file modification date '{}' is not newer than local modification date '{}'".format(
-						prepend_output_tabs,
-						datetime.fromtimestamp(remote_stat.st_mtime),
-						datetime.fromtimestamp(local_stat.st_mtime),
-					))
-					do_transfer = "OVERWRITE_NEWER"
-
-		if (
-			do_transfer is None and
-			"exclude_filter" in options and
-			not self._check_option_ignored("exclude_filter")
+			"overwrite_existing" in options and
+			not self._check_option_ignored("overwrite_existing")
 		):
-			exclude_filter = options["exclude_filter"]
-			if not string_is_empty(exclude_filter):
-				if fnmatch(str(remotefile), exclude_filter):
-					do_transfer = "EXCLUDE_FILTER"
+			local_exists = manifest_record is not None or localfile.exists()
+			if local_exists and options["overwrite_existing"] is False:
+				do_transfer = "OVERWRITE_EXISTING"
 
 		if (
 			do_transfer is None and
-			"include_filters" in options and
-			not self._check_option_ignored("include_filters")
+			not damaged and
+			"overwrite_newer" in options and
+			options["overwrite_newer"] is True and
+			not self._check_option_ignored("overwrite_newer")
 		):
-			include_filters = options["include_filters"]
-			if is_sequence_with_any_elements(include_filters):
-				do_transfer = "INCLUDE_FILTERS"
-				for include_filter in include_filters:
-					if fnmatch(str(remotefile), include_filter):
-						do_transfer = None
-						break
-			elif not string_is_empty(include_filters):
-				if not fnmatch(str(remotefile), include_filters):
-					do_transfer = "INCLUDE_FILTERS"
+			local_mtime = None
+			if manifest_record is not None:
+				if manifest_record.size == remote_stat.st_size:
+					local_mtime = manifest_record.mtime
+			elif localfile.exists():
+				local_mtime = lstat(str(localfile)).st_mtime
+
+			if local_mtime is not None and local_mtime >= remote_stat.st_mtime:
+				self.fileinfo(
+					"%sRemote file modification date '%s' is not newer than local modification date '%s'",
+					prepend_output_tabs,
+					datetime.fromtimestamp(remote_stat.st_mtime),
+					datetime.fromtimestamp(local_mtime)
+				)
+				do_transfer = "OVERWRITE_NEWER"
 
-		if (
-			do_transfer is None and
-			"exclude_files" in options and
-			not self._check_option_ignored("exclude_files")
-		):
-			exclude_files = options["exclude_files"]
-			if is_sequence_with_any_elements(exclude_files):
-				for exclude_file in exclude_files:
-					if not string_is_empty(exclude_file):
-						testfile = remoteroot.joinpath(exclude_file)
-						if str(testfile) == str(remotefile):
-							do_transfer = "EXCLUDE_FILES"
-							break
+		if do_transfer is None and damaged:
+			self.fileinfo("%sLocal copy differs from the manifest, transferring it again", prepend_output_tabs)
 
 		return do_transfer
 
@@ -240,127 +656,737 @@ class FileBackupUnit(Unit):
 			remote_root: Path,
 			localfile: Path,
 			remote_filenode: Path,
-			entry: BackupEntry
+			entry: BackupEntry,
+			stat_remote: paramiko.SFTPAttributes=None
+	):
+		"""
+		:param stat_remote: The attributes of remote_filenode if they are already known from a
+			directory listing, otherwise they are fetched with an additional lstat
+		"""
+		if stat_remote is None:
+			with self._metrics.timer("stat"):
+				stat_remote = sftp.lstat(str(remote_filenode))
+
+		if self._accept_file(indentationlevel, remote_root, localfile, remote_filenode, entry, stat_remote):
+			plan = self._get_plan()
+			if plan is not None:
+				plan.add_transfer(remote_filenode, localfile, stat_remote)
+			else:
+				self._submit_transfer(sftp, remote_filenode, localfile, stat_remote, entry)
+
+	def _submit_transfer(
+		self,
+		sftp: paramiko.SFTPClient,
+		remote_filenode: Path,
+		localfile: Path,
+		stat_remote: paramiko.SFTPAttributes,
+		entry: BackupEntry
 	):
+		"""Transfers an accepted file in the pool of the job or directly"""
+		if self._snapshots is not None and self._delta_sync is not None:
+			# The former version is the basis of a delta-sync, which replaces the link
+			self._snapshots.link(localfile)
+
+		pool = self._job.pool
+		if pool is not None:
+			pool.submit(
+				str(remote_filenode),
+				self._transfer_file,
+				remote_filenode, localfile, stat_remote, entry, self._job.stats, False
+			)
+		else:
+			self._transfer_file(
+				sftp, remote_filenode, localfile, stat_remote, entry, self._job.stats, self._show_copystats
+			)
+
+	def _get_plan(self) -> TransferPlan:
+		"""The plan of the job of the calling thread, None if the job transfers while it scans"""
+		return getattr(self._job, "plan", None)
+
+	def _create_localdir(self, localdir: Path, tabs: str=""):
+		"""Creates a local folder, or adds it to the plan of the job"""
+		self._localdirs.add(localdir)
+		if localdir.exists():
+			return
+
+		plan = self._get_plan()
+		if plan is not None:
+			plan.add_directory(localdir)
+		else:
+			self.info("%sCreating parent folders '%s'", tabs, localdir)
+			makedirs(str(localdir), exist_ok=True)
+
+	@staticmethod
+	def _is_simulation(entry: BackupEntry) -> bool:
 		options = entry.get_options()
-		has_options = is_sequence_with_any_elements(options)
-		is_simulation = False
+		return is_sequence_with_any_elements(options) and "simulate" in options and options["simulate"] is True
 
-		if has_options is True:
-			is_simulation = options["simulate"] if "simulate" in options and options["simulate"] is True else False
+	def _accept_file(
+		self,
+		indentationlevel: int,
+		remote_root: Path,
+		localfile: Path,
+		remote_filenode: Path,
+		entry: BackupEntry,
+		stat_remote: paramiko.SFTPAttributes
+	) -> bool:
+		"""Checks a remote file against the options of its entry and logs the decision
+
+		:return: True if the file has to be transferred
+		"""
+		options = entry.get_options()
+		has_options = is_sequence_with_any_elements(options)
+		plan = self._get_plan()
 
 		indentation = repeat("\t", indentationlevel+1)
 
-		if not is_simulation:
-			stat_remote = sftp.lstat(str(remote_filenode))
-
 		do_transfer = True
 
-		self.info("{}Processing file: '{}'".format(indentation, remote_filenode))
+		self.fileinfo("%sProcessing file: '%s'", indentation, remote_filenode)
 
-		if has_options and not is_simulation:
-			do_transfer = self._check_file_with_options(
-				options,
-				remote_root,
-				localfile,
-				remote_filenode,
-				stat_remote,
-				indentation
-			)
+		# A snapshot is compared with its predecessor, its own folder is still empty
+		comparefile = localfile
+		if self._snapshots is not None and self._snapshots.get_previous() is not None:
+			comparefile = self._snapshots.get_previous_file(localfile)
 
-		if do_transfer is not None:
-			self.info("{}Excluding '{}' due to json-file-option {}".format(
-				indentation, remote_filenode, do_transfer
-			))
-		else:
-			if is_simulation:
-				self.info("{}Simulating download of file '{}'".format(indentation, remote_filenode))
-			else:
-				self.info("{}Downloading file (Total: {})".format(
-					indentation, bytes_to_unit(stat_remote.st_size, 1, True, False))
+		if has_options:
+			with self._metrics.timer("filter"):
+				do_transfer = self._check_file_with_options(
+					entry,
+					remote_root,
+					comparefile,
+					remote_filenode,
+					stat_remote,
+					indentation
 				)
 
-				self._current_progress_divider = get_filesize_progress_divider(stat_remote.st_size)
+		if self._snapshots is not None and do_transfer in ("OVERWRITE_NEWER", "OVERWRITE_EXISTING") and plan is not None:
+			# Linked when the plan is executed, or transferred if that fails
+			plan.add_transfer(remote_filenode, localfile, stat_remote, True)
+			if self._manifest is not None:
+				self._manifest.confirm(str(remote_filenode))
+			return False
+		elif self._snapshots is not None and do_transfer in ("OVERWRITE_NEWER", "OVERWRITE_EXISTING"):
+			if self._snapshots.link(localfile):
+				self._metrics.inc("files_linked_total")
+				self.fileinfo("%sLinked unchanged file from the former snapshot", indentation)
+				if self._manifest is not None:
+					self._manifest.confirm(str(remote_filenode))
+				return False
+			# Unchanged according to the manifest, but missing in the former snapshot
+			do_transfer = None
+		elif self._repository_tree is not None and do_transfer in ("OVERWRITE_NEWER", "OVERWRITE_EXISTING"):
+			if self._repository_tree.keep(str(remote_filenode)):
+				self._metrics.inc("files_unchanged_total")
+				if self._manifest is not None:
+					self._manifest.confirm(str(remote_filenode))
+				return False
+			# Unchanged according to the manifest, but not in the former tree
+			do_transfer = None
 
-				sftp.get(str(remote_filenode), str(localfile))
+		if do_transfer is not None:
+			self._metrics.inc("files_excluded_total", option=str(do_transfer))
+			if plan is not None:
+				plan.add_excluded(str(do_transfer))
+			self.fileinfo("%sExcluding '%s' due to json-file-option %s", indentation, remote_filenode, do_transfer)
+			if self._manifest is not None and do_transfer in ("OVERWRITE_NEWER", "OVERWRITE_EXISTING"):
+				self._manifest.confirm(str(remote_filenode))
+			return False
 
-				if self._copystats:
-					self.info("{}Copying file modification dates".format(indentation))
-					utime(str(localfile), (stat_remote.st_atime, stat_remote.st_mtime))
+		if plan is not None:
+			self.fileinfo("%sPlanning download (Total: %s)", indentation, bytes_to_unit(stat_remote.st_size, 1, True, False))
+			return True
 
-	def _process_directory(
+		self.fileinfo("%sDownloading file (Total: %s)", indentation, bytes_to_unit(stat_remote.st_size, 1, True, False))
+
+		if self._copystats:
+			self.fileinfo("%sCopying file modification dates", indentation)
+
+		return True
+
+	def _transfer_file(
 		self,
-		level: int,
 		sftp: paramiko.SFTPClient,
-		remote_root: Path,
-		remote_path: Path,
-		local_targetdir: Path,
-		entry: BackupEntry
+		remote_filenode: Path,
+		localfile: Path,
+		stat_remote: paramiko.SFTPAttributes,
+		entry: BackupEntry,
+		stats: TransferStats,
+		show_progress: bool
+	):
+		"""Downloads a single file, may be called from a SftpWorkerPool-thread so it must not log
+
+		When the connection drops, the transfer is repeated after a reconnect and the download
+		continues at the last checkpoint of its part-file. A file that changed while it was
+		downloaded is downloaded again with its new attributes, up to MAX_CHANGED_RETRIES times.
+
+		:param show_progress: Progress-lines are logged, so only for downloads in the job's thread
+		"""
+		attempt = 0
+		changed = 0
+		while True:
+			generation = self._connection.get_generation()
+			try:
+				return self._transfer_file_once(
+					sftp, remote_filenode, localfile, stat_remote, entry, stats, show_progress
+				)
+			except SftpFileChangedException as e:
+				self._metrics.inc("files_changed_total")
+				changed += 1
+				if changed > self.MAX_CHANGED_RETRIES:
+					raise
+				stat_remote = e.get_attributes()
+			except CONNECTION_ERRORS:
+				attempt += 1
+				if attempt > self._reconnect[0] or not self._connection.is_dropped():
+					raise
+				self._connection.reconnect(generation)
+
+	def _transfer_file_once(
+		self,
+		sftp: paramiko.SFTPClient,
+		remote_filenode: Path,
+		localfile: Path,
+		stat_remote: paramiko.SFTPAttributes,
+		entry: BackupEntry,
+		stats: TransferStats,
+		show_progress: bool
 	):
-		isroot = False
+		if self._use_delta_sync(entry, localfile, stat_remote):
+			try:
+				start = monotonic()
+				fetched = self._delta_sync.sync(sftp, str(remote_filenode), localfile)
+				seconds = monotonic() - start
+				stats.add_delta_sync(stat_remote.st_size, fetched)
+				stats.add_transfer(fetched, seconds)
+				self._finish_transfer(remote_filenode, localfile, stat_remote)
+				self._count_transfer(fetched, seconds, "delta")
+				return
+			except DeltaSyncException:
+				stats.add_delta_fallback()
+				self._metrics.inc("delta_fallbacks_total")
+
+		progress = None
+		if show_progress:
+			progress = DownloadProgress(stat_remote.st_size, self.progressfiledownload)
+
+		seconds = self._downloader.download(
+			sftp, str(remote_filenode), localfile, stat_remote.st_size, progress, self._metrics,
+			stat_remote.st_mtime,
+			(lambda partfile: self._verify_remote_checksum(remote_filenode, partfile)) if self._verify_checksum else None
+		)
+		stats.add_transfer(stat_remote.st_size, seconds)
+		self._finish_transfer(remote_filenode, localfile, stat_remote)
+		self._count_transfer(stat_remote.st_size, seconds, "sftp")
+
+	def _verify_remote_checksum(self, remote_filenode: Path, localfile: Path):
+		"""Compares the sha256 of localfile with the output of sha256sum on the remote host
+
+		:raises IOError: If the checksums differ or the remote host can't compute one
+		"""
+		command = "sha256sum -- {}".format(quote(str(remote_filenode)))
+		channel = self._connection.get_transport().open_session()
+		try:
+			channel.exec_command(command)
+			output = channel.makefile("rb").read().decode("utf-8", "replace")
+			exitstatus = channel.recv_exit_status()
+		finally:
+			channel.close()
+
+		if exitstatus != 0 or len(output) < 64:
+			raise IOError("'{}' failed with exit status {}".format(command, exitstatus))
+
+		if output[:64].lower() != self._hash_file(localfile):
+			self._metrics.inc("checksum_mismatches_total")
+			raise IOError("The checksum of '{}' doesn't match the remote file".format(remote_filenode))
+
+	def _on_reconnect(self, transport: paramiko.Transport):
+		if self._delta_sync is not None:
+			self._delta_sync.set_transport(transport)
+		self._metrics.inc("reconnects_total")
+
+	def _count_transfer(self, transferred_bytes: int, seconds: float, mode: str):
+		self._metrics.inc("files_total", mode=mode)
+		self._metrics.inc("bytes_total", transferred_bytes, mode=mode)
+		self._metrics.observe("file_seconds", seconds)
+
+	def progressfiledownload(self, current: int, total: int):
+		self.fileinfo(
+			"\t\tDownloaded: %s of %s", bytes_to_unit(current, 1, True, False), bytes_to_unit(total, 1, True, False)
+		)
+
+	def _use_delta_sync(self, entry: BackupEntry, localfile: Path, stat_remote: paramiko.SFTPAttributes) -> bool:
+		"""Delta-syncs pay off for large files that already have an older local copy
+
+		The remote script rolls its checksum in python, at roughly 1MB per second over the changed
+		parts of a file. Above options['delta_sync']['max_size'], 64MB by default, a file that changed
+		a lot would take longer than the download of the whole file
+		"""
+		if self._delta_sync is None or self._repository is not None:
+			return False
+		if not self._delta_min_size <= stat_remote.st_size <= self._delta_max_size:
+			return False
+
 		options = entry.get_options()
-		has_options = not is_empty_dict(options)
+		if not is_empty_dict(options) and "delta_sync" in options and not self._check_option_ignored("delta_sync"):
+			if options["delta_sync"] is not True:
+				return False
+
+		return localfile.exists() and localfile.stat().st_size > 0
+
+	def _report_job_stats(self, entry: BackupEntry):
+		stats = self._job.stats
+
+		if stats.get_files() > 0:
+			self.info("Job-task '{}' transferred {} files, {} in {:.1f}s ({}/s)".format(
+				entry.get_name(),
+				stats.get_files(),
+				bytes_to_unit(stats.get_bytes(), 1, True, False),
+				stats.get_elapsed(),
+				bytes_to_unit(int(stats.get_throughput()), 1, True, False)
+			))
+
+		if stats.get_delta_files() > 0 or stats.get_delta_fallbacks() > 0:
+			self.info("Delta-sync of job-task '{}': {} files, fetched {} of {}, saved {} ({} fell back to a full download)".format(
+				entry.get_name(),
+				stats.get_delta_files(),
+				bytes_to_unit(stats.get_delta_fetched_bytes(), 1, True, False),
+				bytes_to_unit(stats.get_delta_remote_bytes(), 1, True, False),
+				bytes_to_unit(stats.get_delta_remote_bytes() - stats.get_delta_fetched_bytes(), 1, True, False),
+				stats.get_delta_fallbacks()
+			))
+
+	def _finish_transfer(self, remote_filenode: Path, localfile: Path, stat_remote: paramiko.SFTPAttributes):
+		"""Applies the remote stats to a transferred file and records it, must not log either
+
+		With a repository the file is stored there and removed from the staging-folder.
+		"""
+		if self._copystats and self._repository_tree is None:
+			utime(str(localfile), (stat_remote.st_atime, stat_remote.st_mtime))
+
+		if self._manifest is not None:
+			self._manifest.record(
+				str(remote_filenode),
+				stat_remote.st_size,
+				stat_remote.st_mtime,
+				stat_remote.st_mode,
+				self._hash_file(localfile) if self._manifest_hash else None
+			)
+
+		if self._repository_tree is not None:
+			self._repository_tree.add(
+				str(remote_filenode),
+				str(localfile.relative_to(self._get_staging_dir())),
+				stat_remote.st_size,
+				stat_remote.st_mtime,
+				stat_remote.st_mode,
+				self._repository.store_file(localfile)
+			)
+			localfile.unlink()
+
+	def _get_staging_dir(self) -> Path:
+		"""Downloads wait here until they are stored in the repository"""
+		return Path(self._targetdir, ".staging")
+
+	def _get_tree_name(self) -> str:
+		return "{}-{}".format(self._options["name"], self._host.replace(":", "_").replace("/", "_"))
+
+	def _begin_repository_run(self) -> Path:
+		"""Loads the former tree of this unit and host
+
+		:return: The staging-folder the run downloads into
+		"""
+		previous = self._repository.get_latest_tree(self._get_tree_name())
+		self._repository_tree = RepositoryTree(self._repository.load_tree(str(previous)) if previous is not None else None)
+		self._repository.set_metrics(self._metrics)
+		self.info("Storing into repository '{}'{}".format(
+			self._repository.get_root(),
+			", unchanged files are taken from tree '{}'".format(previous) if previous is not None else ""
+		))
+
+		staging = self._get_staging_dir()
+		if not self._dry_run:
+			makedirs(str(staging), exist_ok=True)
+		return staging
+
+	def _finish_repository_run(self):
+		tree = self._repository.write_tree(self._get_tree_name(), self._repository_tree.get_files())
+		metrics = self._metrics
+		self.info("Wrote tree '{}' of {} files, {} unchanged, {} new and {} known blobs, {} written".format(
+			tree,
+			len(self._repository_tree),
+			int(metrics.get_counter("files_unchanged_total")),
+			int(metrics.get_counter("blobs_total", state="new")),
+			int(metrics.get_counter("blobs_total", state="known")),
+			bytes_to_unit(int(metrics.get_counter("repository_written_bytes_total")), 1, True, False)
+		))
+		shutil.rmtree(str(self._get_staging_dir()), ignore_errors=True)
+
+	def restore(self, treepath: str, targetdir: str):
+		"""Recreates the files of a tree of the repository below targetdir"""
+		if self._repository is None:
+			raise Exception("json-config options['repository'] is not set")
+
+		self.info("Restoring tree '{}' to '{}'".format(treepath, targetdir))
+
+		def progress(done: int, total: int):
+			if done == total or done % 1000 == 0:
+				self.info("\tRestored {} of {} files".format(done, total))
+
+		start = monotonic()
+		files, restored = self._repository.restore(treepath, targetdir, progress)
+		self.info("Restored {} files, {} in {:.1f}s".format(
+			files, bytes_to_unit(restored, 1, True, False), monotonic() - start
+		))
+
+	@staticmethod
+	def _hash_file(localfile: Path) -> str:
+		h = sha256()
+		with open(str(localfile), "rb") as f:
+			for block in iter(lambda: f.read(1024 * 1024), b""):
+				h.update(block)
+		return h.hexdigest()
+
+	def _load_manifest(self):
+		self._manifest = Manifest(Path(self._targetdir, ".{}.manifest.sqlite".format(self._options["name"])))
+		self._manifest.load()
+		self.info("Loaded {} records from manifest '{}'".format(len(self._manifest), self._manifest.get_filepath()))
+
+	def _save_manifest(self):
+		deleted = self._manifest.get_deleted()
+		self.info("Manifest: {} new, {} changed, {} unchanged, {} deleted files".format(
+			self._manifest.get_new_count(),
+			self._manifest.get_changed_count(),
+			self._manifest.get_unchanged_count(),
+			len(deleted)
+		))
+		for path in deleted:
+			self.info("\tDeleted on remote: '{}'".format(path))
+		self._manifest.save()
+
+	def _load_dircache(self):
+		self._dircache = DirectoryCache(
+			Path(self._targetdir, ".{}.dircache.sqlite".format(self._options["name"])), self._dircache_max_age
+		)
+		self._dircache.load()
+		self.info("Loaded {} directory-listings from '{}'".format(len(self._dircache), self._dircache.get_filepath()))
+
+	def _save_dircache(self):
+		self.info("Directory-cache: {} of {} directories were taken from the cache".format(
+			self._dircache.get_hits(),
+			int(sum(self._metrics.get_counters("dirs_total").values()))
+		))
+		self._dircache.save()
+
+	def _wait_for_transfers(self, entry: BackupEntry):
+		"""Blocks until the parallel downloads of an entry are done and reports the failed ones
+
+		Raises a JobException for dir-entries like the sequential download does
+		"""
+		pool = self._job.pool
+		if pool is None:
+			return
+
+		errors = pool.wait()
+
+		for remote_filenode, e in errors:
+			self.error("Error:\n{}".format(remote_filenode))
+			self.error(e)
+
+		if len(errors) > 0 and entry.get_type() is BackupEntryType.Dir:
+			raise JobException(errors[0][1], 1)
+
+	def _get_directory_options(self, options: Dict):
+		"""
+		:return: Tuple of the options recurse and path_rootindex
+		"""
 		path_rootindex = None
 		recurse = False
 
-		if has_options:
+		if not is_empty_dict(options):
 			if "recurse" in options and not self._check_option_ignored("recures"):
 				recurse = options["recurse"]
 			if "path_rootindex" in options and not self._check_option_ignored("path_rootindex"):
 				path_rootindex = options["path_rootindex"]
 
+		return recurse, path_rootindex
+
+	@staticmethod
+	def _get_localdir(remote_path: Path, local_targetdir: Path, path_rootindex) -> Path:
 		if len(remote_path.parents) == 0:
-			isroot = True
+			return local_targetdir
 
-		if isroot:
-			localdir = local_targetdir
-		else:
-			if path_rootindex is not None and is_integer(path_rootindex):
-				f = path_from_partindex(remote_path, path_rootindex)
-				localdir = local_targetdir.joinpath(f)
+		if path_rootindex is not None and is_integer(path_rootindex):
+			return local_targetdir.joinpath(path_from_partindex(remote_path, path_rootindex))
+
+		return local_targetdir.joinpath(str(remote_path)[1:])
+
+	def _use_remote_scan(self, entry: BackupEntry) -> bool:
+		options = entry.get_options()
+		if not is_empty_dict(options) and "remote_scan" in options and not self._check_option_ignored("remote_scan"):
+			return options["remote_scan"] is True
+		return self._remote_scan
+
+	def _process_remote_records(
+		self,
+		records: Iterable[RemoteScanRecord],
+		remotedir: Path,
+		local_targetdir: Path,
+		entry: BackupEntry,
+		process_file: Callable
+	):
+		"""Processes the records of a dir-entry that a remote command delivered in pre-order
+
+		Folders are checked with the same options and roots as in _process_directory and
+		created locally, everything below an excluded folder is skipped.
+
+		:param process_file: Called with (level, remote_root, localfile, remote_filenode, record) for every non-folder
+		"""
+		options = entry.get_options()
+		recurse, path_rootindex = self._get_directory_options(options)
+
+		localdir = self._get_localdir(remotedir, local_targetdir, path_rootindex)
+		self._create_localdir(localdir, "\t")
+
+		localdirs = {str(remotedir): localdir}
+		skipped = set()
+
+		for record in records:
+			remote_filenode = Path(record.path)
+
+			if remote_filenode == remotedir:
+				continue
+
+			parent = remote_filenode.parent
+			parentkey = str(parent)
+
+			if parentkey in skipped:
+				if record.is_dir():
+					skipped.add(record.path)
+				continue
+
+			level = len(parent.relative_to(remotedir).parts)
+
+			if record.is_dir():
+				if recurse is not True:
+					continue
+
+				tabs = repeat("\t", level + 1)
+				self.info("\n%sRecursing into sub-directory '%s'", tabs, remote_filenode)
+
+				do_transfer = self._check_folder_with_options(parent, remote_filenode, entry)
+
+				if do_transfer is not None:
+					self.info("%s\tExcluding '%s' due to json-folder-option %s", tabs, remote_filenode, do_transfer)
+					skipped.add(record.path)
+					continue
+
+				localdir = self._get_localdir(remote_filenode, local_targetdir, path_rootindex)
+				self._create_localdir(localdir, tabs + "\t")
+				localdirs[record.path] = localdir
 			else:
-				localdir = local_targetdir.joinpath(str(remote_path)[1:])
+				# Same root as _process_directory passes down while recursing
+				remote_parent_root = remotedir if parent == remotedir else parent.parent
+				localfile = localdirs[parentkey].joinpath(remote_filenode.name)
+				process_file(level, remote_parent_root, localfile, remote_filenode, record)
+
+	def _get_transfer_mode(self, entry: BackupEntry) -> str:
+		options = entry.get_options()
+		if not is_empty_dict(options) and "transfer_mode" in options and not self._check_option_ignored("transfer_mode"):
+			transfer_mode = options["transfer_mode"]
+			if transfer_mode not in ("sftp", "tarstream"):
+				raise JobException("options['transfer_mode'] has to be either 'sftp' or 'tarstream'", 11)
+			return transfer_mode
+		return "sftp"
+
+	def _process_directory_scan(
+		self,
+		sftp: paramiko.SFTPClient,
+		remote_root: Path,
+		remotedir: Path,
+		local_targetdir: Path,
+		entry: BackupEntry
+	) -> bool:
+		"""Processes a dir-entry from the output of a single remote find instead of walking it via sftp
+
+		exclude_folders that match by name or absolute path are already pruned on the remote side.
+
+		:return: False if the remote host can't execute find and the entry has to be walked via sftp
+		"""
+		options = entry.get_options()
+		recurse, path_rootindex = self._get_directory_options(options)
+
+		do_transfer = self._check_folder_with_options(remote_root, remotedir, entry)
+
+		if do_transfer is not None:
+			self.info("\tExcluding '{}' due to json-folder-option {}".format(remotedir, do_transfer))
+			return True
+
+		matcher = entry.get_matcher()
+
+		self.info("\tScanning '{}' with a remote find".format(remotedir))
+
+		scanner = RemoteScanner(self._connection.get_transport())
+
+		def download(level, remote_parent_root, localfile, remote_filenode, record):
+			self._download_file(level, sftp, remote_parent_root, localfile, remote_filenode, entry, record.attributes)
+
+		try:
+			self._process_remote_records(
+				scanner.scan(str(remotedir), recurse is True, matcher.get_prune_names(), matcher.get_prune_paths()),
+				remotedir, local_targetdir, entry, download
+			)
+		except RemoteScanException as e:
+			self.info("\tRemote scan not possible, walking via sftp instead: {}".format(e))
+			return False
+		except JobException as e:
+			raise e
+		except Exception as e:
+			raise JobException(e, 1)
+
+		if scanner.get_exitstatus() != 0:
+			self.info("\tRemote scan finished with exit status {}:\n{}\n".format(
+				scanner.get_exitstatus(), scanner.get_stderr()
+			))
+
+		return True
+
+	def _process_directory_tarstream(
+		self,
+		remote_root: Path,
+		remotedir: Path,
+		local_targetdir: Path,
+		entry: BackupEntry
+	) -> bool:
+		"""Processes a dir-entry by extracting a tar-archive that is streamed from the remote host
+
+		All files of the entry arrive through one pipelined exec-channel instead of an open, read and
+		close per file. Members that don't pass _check_file_with_options are read past, not written.
+
+		:return: False if the remote host can't run tar and the entry has to be walked via sftp
+		"""
+		options = entry.get_options()
+		recurse, path_rootindex = self._get_directory_options(options)
+
+		do_transfer = self._check_folder_with_options(remote_root, remotedir, entry)
+
+		if do_transfer is not None:
+			self.info("\tExcluding '{}' due to json-folder-option {}".format(remotedir, do_transfer))
+			return True
+
+		matcher = entry.get_matcher()
+
+		self.info("\tStreaming '{}' as tar-archive".format(remotedir))
+
+		tarstream = RemoteTarStream(self._connection.get_transport())
+
+		def extract(level, remote_parent_root, localfile, remote_filenode, record):
+			if self._accept_file(level, remote_parent_root, localfile, remote_filenode, entry, record.attributes):
+				start = monotonic()
+				partfile = self._downloader.get_partfile(localfile)
+				try:
+					with open(str(partfile), "wb") as f:
+						tarstream.copy_current(f)
+				except BaseException:
+					if partfile.exists():
+						partfile.unlink()
+					raise
+				replace(str(partfile), str(localfile))
+				seconds = monotonic() - start
+				self._job.stats.add_transfer(record.attributes.st_size, seconds)
+				self._finish_transfer(remote_filenode, localfile, record.attributes)
+				self._count_transfer(record.attributes.st_size, seconds, "tarstream")
+
+		try:
+			self._process_remote_records(
+				tarstream.records(str(remotedir), recurse is True, matcher.get_prune_names(), matcher.get_prune_paths()),
+				remotedir, local_targetdir, entry, extract
+			)
+		except RemoteTarStreamException as e:
+			self.info("\tTar-stream not possible, walking via sftp instead: {}".format(e))
+			return False
+		except JobException as e:
+			raise e
+		except Exception as e:
+			raise JobException(e, 1)
+
+		if tarstream.get_exitstatus() != 0:
+			self.info("\tTar-stream finished with exit status {}:\n{}\n".format(
+				tarstream.get_exitstatus(), tarstream.get_stderr()
+			))
+
+		return True
+
+	def _process_directory(
+		self,
+		level: int,
+		sftp: paramiko.SFTPClient,
+		remote_root: Path,
+		remote_path: Path,
+		local_targetdir: Path,
+		entry: BackupEntry,
+		dir_stat: paramiko.SFTPAttributes=None
+	):
+		"""
+		:param dir_stat: The attributes of remote_path from a fresh listing of its parent, they are
+			fetched with a stat if the directory-cache needs them
+		"""
+		options = entry.get_options()
+		recurse, path_rootindex = self._get_directory_options(options)
+		localdir = self._get_localdir(remote_path, local_targetdir, path_rootindex)
 
 		remote_filenode = None
 		tabs2 = repeat("\t", level + 1)
 
-		do_transfer = self._check_folder_with_options(remote_root, remote_path, options)
+		do_transfer = self._check_folder_with_options(remote_root, remote_path, entry)
 
 		if do_transfer is not None:
-			self.info("{}Excluding '{}' due to json-folder-option {}".format(
-				tabs2,
-				remote_path,
-				do_transfer
-			))
+			self.info("%sExcluding '%s' due to json-folder-option %s", tabs2, remote_path, do_transfer)
 			return
 
-		if not localdir.exists():
-			self.info("{}Creating parent folders '{}'".format(tabs2, localdir))
-			makedirs(str(localdir))
+		self._create_localdir(localdir, tabs2)
 
 		try:
-			filelist = sftp.listdir(str(remote_path))
+			filelist = None
+			if self._dircache is not None:
+				if dir_stat is None:
+					with self._metrics.timer("stat"):
+						dir_stat = sftp.stat(str(remote_path))
+				filelist = self._dircache.get(str(remote_path), dir_stat.st_mtime)
+
+			# The mtimes of the sub-directories in a cached listing are outdated
+			cached = filelist is not None
+
+			if cached:
+				self._metrics.inc("dirs_total", source="cache")
+			else:
+				# listdir_attr delivers the lstat-attributes together with the names,
+				# so no further round-trip per child is needed
+				with self._metrics.timer("list"):
+					filelist = sftp.listdir_attr(str(remote_path))
+				self._metrics.inc("dirs_total", source="list")
+				if self._dircache is not None:
+					self._dircache.put(str(remote_path), dir_stat.st_mtime, filelist)
 
 			if len(filelist) > 0:
-				for filenode in filelist:
+				for remote_stat in filelist:
+					filenode = remote_stat.filename
 					remote_filenode = remote_path.joinpath(filenode)
-					remote_stat = sftp.lstat(str(remote_filenode))
 
 					if stat.S_ISDIR(remote_stat.st_mode):
 						if recurse is True:
-							self.info("\n{}Recursing into sub-directory '{}'".format(
-								tabs2, remote_filenode
-							))
+							self.info("\n%sRecursing into sub-directory '%s'", tabs2, remote_filenode)
 							self._process_directory(
 								level + 1, sftp,
 								remote_path,
 								remote_filenode,
 								local_targetdir,
-								entry
+								entry,
+								None if cached else remote_stat
 							)
 					else:
 						localfile = localdir.joinpath(filenode)
-						self._download_file(level, sftp, remote_root, localfile, remote_filenode, entry)
+						self._download_file(level, sftp, remote_root, localfile, remote_filenode, entry, remote_stat)
 
 		except Exception as e:
 			if isinstance(e, PermissionError):
@@ -384,10 +1410,16 @@ class FileBackupUnit(Unit):
 
 		self.info("\tProcessing folder: '{}'".format(remotedir))
 
+		if self._manifest is not None:
+			self._manifest.add_root(str(remotedir))
+		if self._dircache is not None:
+			self._dircache.add_root(str(remotedir))
+
 		remote_exists = True
 
 		try:
-			stat_remote = sftp.stat(str(remotedir))
+			with self._metrics.timer("stat"):
+				stat_remote = sftp.stat(str(remotedir))
 		except:
 			remote_exists = False
 
@@ -400,7 +1432,16 @@ class FileBackupUnit(Unit):
 				remotedir
 			))
 		else:
-			self._process_directory(0, sftp, remote_root, remotedir, local_targetdir, entry)
+			scanned = False
+			tarstream = self._get_transfer_mode(entry) == "tarstream"
+			if tarstream and self._get_plan() is None:
+				scanned = self._process_directory_tarstream(remote_root, remotedir, local_targetdir, entry)
+			elif self._use_remote_scan(entry) or tarstream:
+				# A tar-stream can't be planned, the remote find lists the same files
+				scanned = self._process_directory_scan(sftp, remote_root, remotedir, local_targetdir, entry)
+			if not scanned:
+				self._process_directory(0, sftp, remote_root, remotedir, local_targetdir, entry, stat_remote)
+			self._wait_for_transfers(entry)
 
 		self.info("Finished\n")
 
@@ -415,20 +1456,299 @@ class FileBackupUnit(Unit):
 		localdir = local_targetdir.joinpath(str(remote_filenode.parents[0])[1:])
 		localfile = localdir.joinpath(remote_filenode.name)
 
-		if not localdir.exists():
-			self.info("Creating folder '{}'".format(localdir))
-			makedirs(str(localdir))
+		self._create_localdir(localdir)
+
+		if self._manifest is not None:
+			self._manifest.add_root(str(remote_filenode))
 
 		try:
 			self._download_file(1, sftp, remote_root, localfile, remote_filenode, entry)
+			self._wait_for_transfers(entry)
 
 		except Exception as e:
 			self.error("Error:\n{}".format(remote_filenode))
 			self.error(e)
 
+	def _run_jobs(
+		self,
+		sftp: paramiko.SFTPClient,
+		local_targetdir: Path,
+		process_dirs: bool,
+		process_files: bool
+	) -> List[TransferStats]:
+		"""Executes the entries one after another or options['max_parallel_jobs'] of them at once
+
+		Parallel jobs open their own SFTP-channel and tag their log-lines with the job-name.
+		Every job runs to its end, a failing job doesn't stop the others.
+		"""
+		if self._max_parallel_jobs < 2 or len(self._entries) < 2:
+			return [
+				self._run_job(entry, sftp, local_targetdir, process_dirs, process_files, False)
+				for entry in self._entries
+			]
+
+		channels = self._max_parallel_jobs * (self._max_workers + 1) + 1
+		self.info("Executing up to {} jobs in parallel with up to {} SFTP-channels{}".format(
+			self._max_parallel_jobs,
+			channels,
+			" (more than the default MaxSessions of OpenSSH)" if channels > 10 else ""
+		))
+
+		with ThreadPoolExecutor(max_workers=self._max_parallel_jobs, thread_name_prefix="job") as executor:
+			futures = [
+				executor.submit(self._run_job, entry, None, local_targetdir, process_dirs, process_files, True)
+				for entry in self._entries
+			]
+			return [future.result() for future in futures]
+
+	def _run_job(
+		self,
+		entry: BackupEntry,
+		sftp: paramiko.SFTPClient,
+		local_targetdir: Path,
+		process_dirs: bool,
+		process_files: bool,
+		tagged: bool
+	) -> TransferStats:
+		"""
+		:param sftp: None to open a separate SFTP-channel for the job
+		:param tagged: Prefix the log-lines of the job with its name
+		:return: The stats of the job, including its errcode
+		"""
+		stats = TransferStats(entry.get_name())
+		errcode = 0
+		own_sftp = None
+		plan = None
+
+		self._job.stats = stats
+		self._job.pool = None
+		self._job.plan = None
+
+		if tagged:
+			self.set_logtag(entry.get_name())
+
+		try:
+			self.info("Executing job-task '{}'".format(entry.get_name()))
+
+			if entry.should_skip():
+				self.info("Skipping entry '{}' because options skip is active".format(
+					entry.get_type()
+				))
+			else:
+				if self._connection.is_dropped():
+					self._connection.reconnect(self._connection.get_generation())
+
+				if sftp is None:
+					own_sftp = sftp = self._connection.open_sftp_client()
+
+				if self._max_workers > 1:
+					self._job.pool = SftpWorkerPool(self._connection, self._max_workers)
+					self._job.pool.start()
+
+				if self._is_planned(entry):
+					plan = self._job.plan = TransferPlan(
+						entry.get_name(), not self._dry_run and not self._is_simulation(entry)
+					)
+
+				if plan is None:
+					self._process_entry(sftp, entry, local_targetdir, process_dirs, process_files)
+				else:
+					with self._metrics.timer("plan"):
+						self._process_entry(sftp, entry, local_targetdir, process_dirs, process_files)
+					self._job.plan = None
+					self._report_plan(plan)
+					self._plans.append(plan)
+					if plan.is_executable():
+						self._execute_plan(sftp, plan, entry)
+
+				self._report_job_stats(entry)
+
+		except JobException as je:
+			self.error(str(format_exc()))
+			errcode = je.get_errcode()
+
+		except paramiko.SSHException:
+			self.error(str(format_exc()))
+			errcode = 113
+
+		finally:
+			self._job.plan = None
+			if self._job.pool is not None:
+				self._job.pool.close()
+				self._job.pool = None
+			if own_sftp is not None:
+				own_sftp.close()
+			stats.finish(errcode)
+			self.set_logtag(None)
+
+		return stats
+
+	def _process_entry(
+		self,
+		sftp: paramiko.SFTPClient,
+		entry: BackupEntry,
+		local_targetdir: Path,
+		process_dirs: bool,
+		process_files: bool
+	):
+		t = entry.get_type()
+		if t is BackupEntryType.File and process_files is True:
+			self.process_file(sftp, entry.get_path(), local_targetdir, entry)
+		elif t is BackupEntryType.Dir and process_dirs is True:
+			self.process_directory(sftp, entry.get_path(), local_targetdir, entry)
+
+	def _is_planned(self, entry: BackupEntry) -> bool:
+		"""Whether the job of the entry scans into a TransferPlan before anything is transferred"""
+		if self._dry_run or self._is_simulation(entry):
+			return True
+		# A tar-stream transfers while it lists, it has nothing to plan
+		return self._plan_transfers and self._get_transfer_mode(entry) != "tarstream"
+
+	def _report_plan(self, plan: TransferPlan):
+		if self._history is not None:
+			plan.set_estimate(self._history.estimate(plan.get_name(), plan.get_files(), plan.get_bytes()))
+
+		estimate = plan.get_estimate()
+		self.info("Planned {} files, {} to transfer, {} to link, {} folders to create, {} excluded, {}".format(
+			plan.get_files(),
+			bytes_to_unit(plan.get_bytes(), 1, True, False),
+			plan.get_links(),
+			len(plan.get_directories()),
+			sum(plan.get_excluded().values()),
+			"estimated {:.1f}s".format(estimate) if estimate is not None else "no history to estimate the duration"
+		))
+
+		if not plan.is_executable():
+			for localdir in plan.get_directories():
+				self.fileinfo("\tWould create folder '%s'", localdir)
+			for transfer in plan.get_transfers():
+				if transfer.link:
+					self.fileinfo("\tWould link '%s'", transfer.localfile)
+				else:
+					self.fileinfo(
+						"\tWould download '%s' (%s)",
+						transfer.remote, bytes_to_unit(transfer.attributes.st_size, 1, True, False)
+					)
+
+	def _execute_plan(self, sftp: paramiko.SFTPClient, plan: TransferPlan, entry: BackupEntry):
+		"""Creates the folders of a plan and transfers or links its files
+
+		The duration is added to the history, to estimate the next plans of the job
+		"""
+		stats = self._job.stats
+		files = stats.get_files()
+		transferred = stats.get_bytes()
+		start = monotonic()
+
+		with self._metrics.timer("execute"):
+			for localdir in plan.get_directories():
+				self.info("\tCreating parent folders '{}'".format(localdir))
+				makedirs(str(localdir), exist_ok=True)
+
+			for transfer in plan.get_transfers():
+				if transfer.link and self._snapshots.link(transfer.localfile):
+					self._metrics.inc("files_linked_total")
+					continue
+
+				try:
+					self._submit_transfer(sftp, transfer.remote, transfer.localfile, transfer.attributes, entry)
+				except (JobException, paramiko.SSHException):
+					raise
+				except Exception as e:
+					if entry.get_type() is BackupEntryType.Dir:
+						raise JobException(e, 1)
+					self.error("Error:\n{}".format(transfer.remote))
+					self.error(e)
+
+			self._wait_for_transfers(entry)
+
+		if self._history is not None:
+			self._history.add(entry.get_name(), stats.get_files() - files, stats.get_bytes() - transferred, monotonic() - start)
+
+	def _report_plans(self):
+		self.info("{}\nTransfer plans\n{}".format(self._div, self._div))
+		for plan in self._plans:
+			estimate = plan.get_estimate()
+			self.info("{:<40} {:>8} files {:>12} {:>8} links {:>8} folders {:>10}{}".format(
+				plan.get_name(),
+				plan.get_files(),
+				bytes_to_unit(plan.get_bytes(), 1, True, False),
+				plan.get_links(),
+				len(plan.get_directories()),
+				"~{:.1f}s".format(estimate) if estimate is not None else "unknown",
+				"" if plan.is_executable() else "  not executed"
+			))
+
+		estimates = [plan.get_estimate() for plan in self._plans if plan.get_estimate() is not None]
+		self.info("Planning took {:.1f}s, executing {:.1f}s{}".format(
+			self._metrics.get_counter("plan_seconds_total"),
+			self._metrics.get_counter("execute_seconds_total"),
+			", {:.1f}s were estimated".format(sum(estimates)) if len(estimates) > 0 else ""
+		))
+
+	def _load_history(self):
+		self._history = TransferHistory(Path(self._targetdir, ".{}.history.json".format(self._options["name"])))
+		self._history.load()
+		self.info("Loaded {} executed plans from '{}'".format(len(self._history), self._history.get_filepath()))
+
+	def _report_metrics(self):
+		"""Logs the rates, the per-file latency and where the time of the run went"""
+		metrics = self._metrics
+		elapsed = metrics.get_elapsed()
+		files = sum(metrics.get_counters("files_total").values())
+		transferred = sum(metrics.get_counters("bytes_total").values())
+		latency = metrics.get_histogram("file_seconds")
+
+		self.info("{}\nMetrics\n{}".format(self._div, self._div))
+		self.info("{} files, {} in {:.1f}s: {:.1f} files/s, {:.2f} MB/s".format(
+			int(files),
+			bytes_to_unit(int(transferred), 1, True, False),
+			elapsed,
+			files / elapsed if elapsed > 0 else 0,
+			transferred / elapsed / 1024 / 1024 if elapsed > 0 else 0
+		))
+		if latency.get_count() > 0:
+			self.info("Per-file latency: p50 {:.3f}s, p95 {:.3f}s, p99 {:.3f}s".format(
+				latency.percentile(50), latency.percentile(95), latency.percentile(99)
+			))
+		# Summed over all threads, so they may exceed the elapsed time
+		self.info("Time in network {:.1f}s, disk {:.1f}s, listing {:.1f}s, stat {:.1f}s, filtering {:.1f}s".format(
+			metrics.get_counter("network_seconds_total"),
+			metrics.get_counter("disk_seconds_total"),
+			metrics.get_counter("list_seconds_total"),
+			metrics.get_counter("stat_seconds_total"),
+			metrics.get_counter("filter_seconds_total")
+		))
+
+	def _report_jobs(self, results: List[TransferStats]):
+		self.info("{}\nJob-task summary\n{}".format(self._div, self._div))
+		for stats in results:
+			self.info("{:<40} {:>8.1f}s {:>8} files {:>12}  exit {}".format(
+				stats.get_name(),
+				stats.get_elapsed(),
+				stats.get_files(),
+				bytes_to_unit(stats.get_bytes(), 1, True, False),
+				stats.get_errcode()
+			))
+
 	def run(self):
+		if self._hosts is not None:
+			return self._run_hosts()
+
 		self.info("Starting unit task")
 
+		# A unit of the daemon runs repeatedly
+		self._entries = []
+		self._manifest = None
+		self._snapshots = None
+		self._repository_tree = None
+		self._dircache = None
+		self._history = None
+		self._plans = []
+		self._localdirs = set()
+
+		self._metrics = Metrics({"unit": self._jsondata["options"]["name"], "host": self._host})
+
 		pathes = self._jsondata["pathes"]
 
 		sftp = None
@@ -464,42 +1784,76 @@ class FileBackupUnit(Unit):
 					entryfilter, entry["path"],
 					entry["options"] if "options" in entry else None
 				)
+				e.set_matcher(EntryMatcher(e.get_options(), self._ignoreoptions, self._group))
 
 				self._entries.append(e)
 
 			if len(self._entries) == 0:
 				raise JobException(Exception("No entrys found in json"), 4)
 
-			self.info("Trying to connect to SSH-Host {}".format(self._host))
-
-			if self._transport is None:
-				self._transport = paramiko.Transport(self._host)
-
-			if not string_is_empty(self._keyfile):
-				key = paramiko.RSAKey.from_private_key_file(self._keyfile)
-				self.info("With Key:".format(key.get_name()))
-				self._transport.connect(username=self._user, pkey=key)
+			if self._connection_pool is not None:
+				attempts, backoff, max_backoff = self._reconnect
+				self._connection = self._connection_pool.acquire(
+					SshConnection(self._host, self._user, self._password, self._keyfile), attempts, backoff, max_backoff
+				)
+				# Other units may share it, their callbacks stay
+				self._connection.add_on_reconnect(self._on_reconnect)
+				if self._connection.is_dropped():
+					# Another unit may still be connecting it
+					transport = self._connection.reconnect(self._connection.get_generation())
+				else:
+					transport = self._connection.get_transport()
+			elif self._connection is None:
+				attempts, backoff, max_backoff = self._reconnect
+				keepalive = self._keepalive if self._keepalive is not None else (30 if self._keep_connection else 0)
+				self._connection = ReconnectingTransport(
+					SshConnection(self._host, self._user, self._password, self._keyfile),
+					attempts, backoff, max_backoff, self.info, self._on_reconnect, keepalive
+				)
+				transport = self._connection.connect()
 			else:
-				self.info("With Username/Password")
-				self._transport.connect(username=self._user, password=self._password)
-
-			if not self._transport.is_authenticated():
-				raise JobException(Exception("could not authenticate"), 5)
+				# Kept from the last run, it may belong to a former copy of this unit
+				self._connection.set_log(self.info)
+				self._connection.set_on_reconnect(self._on_reconnect)
+				if self._connection.is_dropped():
+					transport = self._connection.reconnect(self._connection.get_generation())
+				else:
+					transport = self._connection.get_transport()
+					self.info("Reusing the connection to {}".format(self._connection.get_host()))
 
-			self.info("Successfully connected!")
+			if self._delta_sync is not None:
+				self._delta_sync.set_transport(transport)
 			self.info("Opening SFTP-Channel from transport")
 
-			with paramiko.SFTPClient.from_transport(self._transport) as sftp:
+			with self._connection.open_sftp_client() as sftp:
 
 				self.info("Successfully opened SFTP-Channel!")
 
+				if self._max_workers > 1:
+					self.info("Downloading with {} parallel workers per job".format(self._max_workers))
+
 				local_targetdir = Path(self._targetdir)
 				""":type: Path"""
 
+				if self._repository is not None:
+					local_targetdir = self._begin_repository_run()
+
+				if self._use_snapshots:
+					self._snapshots = Snapshots(local_targetdir)
+					if not self._dry_run:
+						for incomplete in self._snapshots.remove_incomplete():
+							self.info("Removed the snapshot '{}' of a failed run".format(incomplete))
+					local_targetdir = self._snapshots.begin(create=not self._dry_run)
+					previous = self._snapshots.get_previous()
+					self.info("Writing snapshot '{}'{}".format(
+						local_targetdir,
+						", unchanged files are linked from '{}'".format(previous) if previous is not None else ""
+					))
+
 				d = True
 				f = True
 
-				if len(self._processonly_types) > 0:
+				if self._processonly_types is not None and len(self._processonly_types) > 0:
 					if "all" not in self._processonly_types:
 						if "dir" not in self._processonly_types:
 							d = False
@@ -512,48 +1866,70 @@ class FileBackupUnit(Unit):
 						6
 					)
 
-				for entry in self._entries:
-					self.info("Executing job-task '{}'".format(entry.get_name()))
-					t = entry.get_type()
-					if entry.should_skip():
-						self.info("Skipping entry '{}' because options skip is active".format(
-							entry.get_type()
-						))
-					else:
-						if t is BackupEntryType.File and f is True:
-							self.process_file(sftp, entry.get_path(), local_targetdir, entry)
-						elif t is BackupEntryType.Dir and d is True:
-							self.process_directory(sftp, entry.get_path(), local_targetdir, entry)
+				if self._use_manifest:
+					self._load_manifest()
+
+				if self._use_dircache:
+					self._load_dircache()
+
+				if any(self._is_planned(entry) for entry in self._entries):
+					self._load_history()
+
+				results = self._run_jobs(sftp, local_targetdir, d, f)
+				self._results = results
+				self._report_jobs(results)
+				if len(self._plans) > 0:
+					self._report_plans()
+				self._report_metrics()
+				self.write_metrics([self._metrics])
+
+				failed = [stats for stats in results if stats.get_errcode() != 0]
+
+				if len(failed) > 0:
+					return failed[0].get_errcode()
+
+				if self._dry_run:
+					self.info("Dry-run, nothing was transferred or saved")
+					return None
+
+				if self._history is not None:
+					self._history.save()
+
+				if self._manifest is not None:
+					self._save_manifest()
+
+				if self._dircache is not None:
+					self._save_dircache()
+
+				removed = self._downloader.remove_stale_parts(self._localdirs)
+				if removed > 0:
+					self.info("Removed {} abandoned part-files".format(removed))
+
+				if self._repository_tree is not None:
+					self._finish_repository_run()
+
+				if self._snapshots is not None:
+					self.info("Finished snapshot '{}', linked {} unchanged files".format(
+						self._snapshots.finish(), int(self._metrics.get_counter("files_linked_total"))
+					))
 
 		except JobException as je:
-			from traceback import format_exc
 			self.error(str(format_exc()))
 			return je.get_errcode()
 
 		except paramiko.SSHException as se:
-			from traceback import format_exc
 			self.error(str(format_exc()))
 			return 113
 
 		finally:
 			if sftp is not None:
 				sftp.close()
-			if self._transport is not None:
-				self._transport.close()
-
-	# def progressfiledownload(self, current, total):
-	# 	p = False
-	# 	if current == total:
-	# 		p = True
-	# 	elif self._last_dl_bytes > 0:
-	# 		if current - self._last_dl_bytes > self._current_progress_divider:
-	# 			p = True
-	# 			self._last_dl_bytes = current
-	# 	else:
-	#
-	# 		if total > self._current_progress_divider:
-	# 			p = True
-	# 			self._last_dl_bytes = current
-	#
-	# 	if p is True and self._show_copystats is True:
-	# 		self.info("{}Downloaded: {}".format(bytes_to_unit(current, 1, True, False)))
\ No newline at end of file
+			if self._connection is not None and self._connection_pool is not None:
+				self._connection.remove_on_reconnect(self._on_reconnect)
+				self._connection = None
+			elif self._connection is not None and not self._keep_connection:
+				self._connection.close()
+				self._connection = None
+			if self._repository is not None:
+				# The blobs of a failed run are kept, the next run doesn't store them again
+				self._repository.commit()
@@ -1,15 +1,41 @@
 # TODO: Integrate zip function
-from typing import Dict
+from os import SEEK_END
+from pathlib import Path
+from shutil import disk_usage
+from time import perf_counter
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Tuple
 from fileutilslib.classes.Bencher import Bencher
 from fileutilslib.classes.ConsoleColors import ConsoleColors, ConsoleColor
 from fileutilslib.classes.ImageBackup import ImageBackup
-from fileutilslib.misclib.helpertools import is_boolean, string_is_empty, strip, singlecharinput, is_linux
-from fileutilslib.disklib.filetools import sevenzip
+from fileutilslib.misclib.helpertools import is_boolean, string_is_empty, strip, singlecharinput, is_linux, \
+	assert_obj_has_keys
+from fileutilslib.disklib.filetools import sevenzip, bytes_to_unit
+from classes.ChunkStore import ChunkStore
+from classes.DeviceUsage import DeviceUsage
+from classes.DownloadProgress import DownloadProgress
+from classes.ImagePipeline import ImagePipeline
 from classes.LoggerFactory import LoggerFactory
+from classes.Metrics import Metrics
 from modules.Unit import Unit
 
+if TYPE_CHECKING:
+	from classes.RemoteImageStream import RemoteImageStream
+	from classes.SshConnection import SshConnection
+
 
 class ImageBackupUnit(Unit):
+	"""
+	Attributes:
+		_pipeline	Reads the device and compresses it in one pass, if compress['format'] can be streamed.
+					Other formats are compressed by 7z after dd has written the raw image.
+		_sparse		Zeros of the device are skipped, a raw image gets holes instead.
+					If the target has less free space than the device-size, the device is read once
+					beforehand to count the bytes of its non-zero blocks, which the image needs at most.
+		_chunkstore	Instead of an image, the chunks of the device that changed since the last run are stored
+					in targetdir/chunkstore['folder'], with a manifest per run to restore the image from
+		_ssh		If local is false, devicepath is read on this host with dd, through an exec-channel.
+					paramiko is only imported for such a backup, a local one starts without it.
+	"""
 
 	_bencher = None
 	""":type: Bencher"""
@@ -41,11 +67,45 @@ class ImageBackupUnit(Unit):
 	_compress_file = None
 	""":type: str"""
 
+	_pipeline = None
+	""":type: ImagePipeline"""
+
+	_devicepath = None
+	""":type: str"""
+
+	_imagepath = None
+	""":type: str"""
+
+	_sparse = False
+	""":type: bool"""
+
+	_targetdir = None
+	""":type: str"""
+
+	_chunkstore = None
+	""":type: ChunkStore"""
+
+	_ssh = None
+	""":type: SshConnection"""
+
+	_remote_sudo = False
+	""":type: bool"""
+
+	_remote_compress = None
+	""":type: str"""
+
+	_dd_started = 0.0
+	""":type: float"""
+
 	def __init__(
 		self,
 		configfile,
 		logfactory: LoggerFactory=None
 	):
+		# on_config_loaded sets the device of a non-interactive backup
+		self._imagebackup = ImageBackup(True)
+		self._bencher = Bencher()
+
 		super().__init__(
 			self,
 			configfile,
@@ -54,13 +114,11 @@ class ImageBackupUnit(Unit):
 			logfactory
 		)
 
-		self._imagebackup = ImageBackup(True)
-		self._bencher = Bencher()
-
 	def on_config_loaded(self, jsondata: Dict):
 		options = jsondata["options"]
 
 		self._local = options["local"]
+		self._targetdir = options["targetdir"]
 		if "ddbatchsize" in options:
 			self._ddbatchsize = options["ddbatchsize"]
 
@@ -74,38 +132,375 @@ class ImageBackupUnit(Unit):
 		if self._interactive is None:
 			self._interactive = True
 
+		if "sparse" in options:
+			if not is_boolean(options["sparse"]):
+				raise Exception("json-config options['sparse'] has to be a boolean")
+			self._sparse = options["sparse"]
+
 		if "compress" in options:
 			compress = options["compress"]
 			if "format" not in compress:
 				raise Exception("json-config 'compress' dict has to contain a 'format' key")
 			self._compress_format = compress["format"]
 			if self._interactive is False:
-				if "file" in compress:
+				if "file" not in compress:
 					raise Exception("If the image backup isn't interactive and 'compress' is provided, 'compress' has to contain a file-key")
 				self._compress_file = compress["file"]
 
+			if ImagePipeline.is_streamable(self._compress_format):
+				self._pipeline = ImagePipeline(
+					self._compress_format,
+					compress["level"] if "level" in compress else None,
+					compress["chunk_size"] if "chunk_size" in compress else None,
+					compress["workers"] if "workers" in compress else None,
+					self._sparse
+				)
+			elif self._sparse:
+				raise Exception("json-config options['sparse'] needs a compress-format of {}".format(
+					", ".join(ImagePipeline.FORMATS.keys())
+				))
+		elif self._sparse:
+			self._pipeline = ImagePipeline("raw", sparse=True)
+
+		if "chunkstore" in options:
+			chunkstore = options["chunkstore"]
+			if not isinstance(chunkstore, dict):
+				raise Exception("json-config options['chunkstore'] has to be a dict")
+			self._chunkstore = ChunkStore(
+				str(Path(self._targetdir, chunkstore["folder"] if "folder" in chunkstore else "chunkstore")),
+				chunkstore["chunk_size"] if "chunk_size" in chunkstore else None,
+				chunkstore["format"] if "format" in chunkstore else None,
+				chunkstore["level"] if "level" in chunkstore else None,
+				chunkstore["workers"] if "workers" in chunkstore else None
+			)
+
+		if self._local is False:
+			self._load_remote_options(options)
+
 		if self._interactive is False:
 			if "devicepath" not in options:
 				raise Exception("If interactive is on in options, you'll have to provide a devicepath, too!")
-			self._imagebackup.set_device(options["devicepath"])
-			if "imagepath" not in options:
+			if self._local is not False:
+				self._imagebackup.set_device(options["devicepath"])
+			self._devicepath = options["devicepath"]
+			if "imagepath" not in options and self._chunkstore is None:
 				raise Exception("If interactive is on in options, you'll have to provide a imagepath, too!")
+			if "imagepath" in options:
+				self._imagepath = options["imagepath"]
+
+	def _load_remote_options(self, options: Dict):
+		from classes.RemoteImageStream import RemoteImageStream
+		from classes.SshConnection import SshConnection
+
+		assert_obj_has_keys(options, "options", ["host", "user"])
+
+		if self._interactive is True:
+			raise Exception("An image backup of a remote device can't be interactive, set options['interactive'] to false")
+
+		if "password" not in options and "keyfile" not in options:
+			raise Exception("An image backup of a remote device needs options['password'] or options['keyfile']")
+
+		self._ssh = SshConnection(
+			options["host"],
+			options["user"],
+			options["password"] if "password" in options else None,
+			options["keyfile"] if "keyfile" in options else None
+		)
+
+		if "sudo" in options:
+			if not is_boolean(options["sudo"]):
+				raise Exception("json-config options['sudo'] has to be a boolean")
+			self._remote_sudo = options["sudo"]
+
+		if "remote_compress" in options:
+			if self._pipeline is not None or self._chunkstore is not None:
+				raise Exception("json-config options['remote_compress'] can't be combined with compress, sparse or chunkstore")
+			self._remote_compress = options["remote_compress"]
+			if self._remote_compress not in RemoteImageStream.COMPRESS:
+				raise Exception("json-config options['remote_compress'] has to be one of {}".format(
+					", ".join(RemoteImageStream.COMPRESS.keys())
+				))
+
+	def is_interactive(self) -> bool:
+		return self._interactive is True
+
+	def get_worker_demand(self) -> Tuple[int, int]:
+		"""The compressing or hashing threads, and the stream of a remote device"""
+		cpu = 1
+		for stage in (self._pipeline, self._chunkstore):
+			if stage is not None:
+				cpu = max(cpu, stage.get_workers())
+		return cpu, 1 if self._ssh is not None else 0
+
+	def set_worker_grant(self, cpu: int, network: int):
+		for stage in (self._pipeline, self._chunkstore):
+			if stage is not None and stage.get_workers() > cpu:
+				self.info("Limiting the {} workers of the {} to the {} granted cpu-slots".format(
+					stage.get_workers(), type(stage).__name__, cpu
+				))
+				stage.set_workers(max(cpu, 1))
+
+	def get_transferred_bytes(self) -> int:
+		return int(self._metrics.get_counter("read_bytes_total")) if self._metrics is not None else 0
 
 	def _finished(self, retcode: str, imagepath: str):
 		if is_linux():
-			sevenzip(self._interactive, "7z", imagepath, None)
+			self._metrics.inc("dd_seconds_total", perf_counter() - self._dd_started)
+			with self._metrics.timer("compress"):
+				sevenzip(self._interactive, "7z", imagepath, None)
 
 			self._bencher.endbench()
+			self._report_metrics()
 
 			if self._interactive is True:
 				print("Total time: {}".format(self._bencher.get_result()))
 
+	def _progress(self, current: int, total: int):
+		line = "Imaged {} of {} ({:.0f}%)".format(
+			bytes_to_unit(current, 1, True, False),
+			bytes_to_unit(total, 1, True, False),
+			current / total * 100 if total > 0 else 100
+		)
+		if self._interactive is True:
+			print(line)
+		else:
+			self.info(line)
+
+	def _get_pipeline_target(self) -> str:
+		if self._compress_file is not None:
+			return self._compress_file
+		return self._imagepath + self._pipeline.get_extension()
+
+	def _assert_free_space(self, target: str, required: int):
+		required += self._safe_free_targetspace_margin
+		free = disk_usage(str(Path(target).parent)).free
+
+		if free < required:
+			raise Exception("Not enough free space for the image: {} needed, {} free".format(
+				bytes_to_unit(required, 1, True, False), bytes_to_unit(free, 1, True, False)
+			))
+
+	def _assert_free_space_sparse(self):
+		"""Like ImageBackup.assert_free_space, but a device that doesn't fit as a whole is scanned for
+		its non-zero blocks, only those are written
+		"""
+		usage = DeviceUsage(self._devicepath)
+		target = self._get_pipeline_target()
+		size = usage.get_size()
+
+		if disk_usage(str(Path(target).parent)).free >= size + self._safe_free_targetspace_margin:
+			return
+
+		self.info("Less free space than the size of '{}', counting its non-zero blocks".format(self._devicepath))
+		progress = DownloadProgress(size, self._progress, 5.0)
+		required = usage.count_data_bytes(
+			self._pipeline.get_sparse_block_size(), progress=lambda current, _: progress.update(current)
+		)
+		self.info("The image of '{}' needs at most {}".format(self._devicepath, bytes_to_unit(required, 1, True, False)))
+
+		self._assert_free_space(target, required)
+
+	def _run_pipeline(self, source: BinaryIO, total: int):
+		"""Images the device in a single pass into the compressed file, without a raw image in between"""
+		compressed = self._get_pipeline_target()
+
+		self.info("Imaging '{}' into '{}'".format(self._devicepath, compressed))
+
+		progress = DownloadProgress(total, self._progress, 5.0)
+
+		with open(compressed, "wb") as image:
+			self._pipeline.run(source, image, total, lambda current, _: progress.update(current))
+
+		seconds = self._pipeline.get_seconds()
+		self.info("Read {} in {:.1f}s ({}/s), wrote {}, skipped {} of zeros".format(
+			bytes_to_unit(self._pipeline.get_bytes_read(), 1, True, False),
+			seconds,
+			bytes_to_unit(int(self._pipeline.get_bytes_read() / seconds) if seconds > 0 else 0, 1, True, False),
+			bytes_to_unit(self._pipeline.get_bytes_written(), 1, True, False),
+			bytes_to_unit(self._pipeline.get_zero_bytes(), 1, True, False)
+		))
+
+		self._bencher.endbench()
+
+		if self._interactive is True:
+			print("Total time: {}".format(self._bencher.get_result()))
+
+	def _run_chunkstore(self, source: BinaryIO, total: int, name: str):
+		"""Stores the chunks of the device that aren't in the chunkstore yet"""
+		self.info("Storing the changed chunks of '{}' in '{}'".format(self._devicepath, self._chunkstore.get_root()))
+
+		progress = DownloadProgress(total, self._progress, 5.0)
+
+		manifest = self._chunkstore.backup(
+			source,
+			name,
+			self._devicepath if self._ssh is None else "{}:{}".format(self._ssh.get_host(), self._devicepath),
+			total,
+			lambda current, _: progress.update(current)
+		)
+
+		self.info("{} new, {} unchanged and {} empty chunks, wrote {} in {:.1f}s, manifest '{}'".format(
+			self._chunkstore.get_new_chunks(),
+			self._chunkstore.get_known_chunks(),
+			self._chunkstore.get_zero_chunks(),
+			bytes_to_unit(self._chunkstore.get_bytes_written(), 1, True, False),
+			self._chunkstore.get_seconds(),
+			manifest
+		))
+
+		self._bencher.endbench()
+
+		if self._interactive is True:
+			print("Manifest: {}".format(manifest))
+			print("Total time: {}".format(self._bencher.get_result()))
+
+	def _report_metrics(self):
+		"""Logs where the time of the run went and writes the metrics-files"""
+		metrics = self._metrics
+		elapsed = metrics.get_elapsed()
+		read = metrics.get_counter("read_bytes_total")
+
+		self.info("{}\nMetrics\n{}".format(self._div, self._div))
+		if read > 0:
+			self.info("Read {} in {:.1f}s: {:.2f} MB/s".format(
+				bytes_to_unit(int(read), 1, True, False), elapsed, read / elapsed / 1024 / 1024 if elapsed > 0 else 0
+			))
+		# Compressing and hashing run in parallel, their sums may exceed the elapsed time
+		self.info("Time in reading {:.1f}s, compressing {:.1f}s, writing {:.1f}s".format(
+			metrics.get_counter("read_seconds_total"),
+			metrics.get_counter("compress_seconds_total"),
+			metrics.get_counter("write_seconds_total")
+		))
+		for name in ("chunk_compress_seconds", "chunk_hash_seconds", "chunk_store_seconds"):
+			histogram = metrics.get_histogram(name)
+			if histogram.get_count() > 0:
+				self.info("{}: p50 {:.3f}s, p95 {:.3f}s over {} chunks".format(
+					name, histogram.percentile(50), histogram.percentile(95), histogram.get_count()
+				))
+
+		self.write_metrics([metrics])
+
+	def _run_local(self, run: Callable, *args):
+		"""Calls run with the opened device and its size"""
+		with open(self._devicepath, "rb", buffering=0) as device:
+			total = device.seek(0, SEEK_END)
+			device.seek(0)
+			run(device, total, *args)
+
+		self._report_metrics()
+
+	def _copy_remote(self, stream: "RemoteImageStream", total: int):
+		"""Writes the stream of dd as it is, compressed remotely or raw"""
+		target = self._imagepath + stream.get_extension()
+		self.info("Imaging '{}:{}' into '{}'".format(self._ssh.get_host(), self._devicepath, target))
+
+		if self._remote_compress is None:
+			self._assert_free_space(target, total)
+			progress = DownloadProgress(total, self._progress, 5.0)
+			update = progress.update
+		else:
+			# The compressed size isn't known before
+			update = None
+
+		with open(target, "wb") as image:
+			stream.copy(image, update)
+
+		self._metrics.inc("read_bytes_total", total)
+
+	def _run_remote(self):
+		"""Reads the device of the remote host through an exec-channel, into the same targets as a local device"""
+		from classes.RemoteImageStream import RemoteImageStream
+
+		if self._connection_pool is not None:
+			connection = self._connection_pool.acquire(self._ssh)
+			transport = connection.get_transport()
+			if connection.is_dropped():
+				transport = connection.reconnect(connection.get_generation())
+		else:
+			transport = self._ssh.connect(self.info)
+
+		try:
+			stream = RemoteImageStream(transport, self._devicepath, self._remote_sudo, self._remote_compress)
+			total = stream.get_size()
+
+			self.info("Remote device '{}' has {}".format(self._devicepath, bytes_to_unit(total, 1, True, False)))
+
+			if self._pipeline is None and self._chunkstore is None:
+				self._copy_remote(stream, total)
+			else:
+				if self._chunkstore is None:
+					# Scanning a remote device for zeros would read it twice through the network
+					self._assert_free_space(self._get_pipeline_target(), total)
+				stream.open()
+				try:
+					if self._chunkstore is not None:
+						self._run_chunkstore(stream, total, "{}-{}".format(
+							self._ssh.get_host().replace(":", "_"), Path(self._devicepath).name
+						))
+					else:
+						self._run_pipeline(stream, total)
+				except BaseException:
+					stream.abort()
+					raise
+				stream.close()
+
+			seconds = stream.get_seconds()
+			self.info("Received {} from '{}' in {:.1f}s ({}/s)".format(
+				bytes_to_unit(stream.get_bytes_received(), 1, True, False),
+				self._ssh.get_host(),
+				seconds,
+				bytes_to_unit(int(stream.get_bytes_received() / seconds) if seconds > 0 else 0, 1, True, False)
+			))
+			self._metrics.inc("network_bytes_total", stream.get_bytes_received())
+		finally:
+			# A transport of the pool may be shared with other units
+			if self._connection_pool is None:
+				transport.close()
+
+		self._bencher.endbench()
+		self._report_metrics()
+
+	def restore(self, manifestpath: str, targetpath: str):
+		"""Reassembles the image of a manifest of the chunkstore into a file or onto a device"""
+		if self._chunkstore is None:
+			raise Exception("json-config options['chunkstore'] is needed to restore an image")
+
+		self.info("Restoring '{}' to '{}'".format(manifestpath, targetpath))
+
+		size = ChunkStore.load_manifest(manifestpath)["size"]
+		progress = DownloadProgress(size, self._progress, 5.0)
+
+		self._bencher.startbench()
+		self._chunkstore.restore(manifestpath, targetpath, lambda current, _: progress.update(current))
+		self._bencher.endbench()
+
+		self.info("Restored '{}' in {}".format(targetpath, self._bencher.get_result()))
+
 	def run(self):
+		self._metrics = Metrics({
+			"unit": self._jsondata["options"]["name"],
+			"host": self._ssh.get_host() if self._ssh is not None else "local"
+		})
+		for stage in (self._pipeline, self._chunkstore):
+			if stage is not None:
+				stage.set_metrics(self._metrics)
+
+		if self._ssh is not None:
+			self._bencher.startbench()
+			self._run_remote()
+			return
 
 		if self._interactive is True:
 			self._imagebackup.set_device()
 		self._imagebackup.assert_devicepath_is_valid()
 
+		if self._chunkstore is not None:
+			if self._interactive is True:
+				self._devicepath = self._imagebackup.get_devicepath()
+			self._bencher.startbench()
+			self._run_local(self._run_chunkstore, Path(self._devicepath).name)
+			return
+
 		if self._interactive is True:
 			if self._imagebackup.set_image_path() is False:
 				print(ConsoleColor.colorline("Cancelled", ConsoleColors.OKBLUE))
@@ -118,8 +513,21 @@ class ImageBackupUnit(Unit):
 		if self._interactive is True:
 			self._imagebackup.print_pre_dd_info()
 
-		self._imagebackup.assert_free_space(self._safe_free_targetspace_margin)
+			if self._pipeline is not None:
+				self._devicepath = self._imagebackup.get_devicepath()
+				self._imagepath = self._imagebackup.get_imagepath()
+
+		if self._sparse:
+			self._assert_free_space_sparse()
+		else:
+			self._imagebackup.assert_free_space(self._safe_free_targetspace_margin)
+
 		self._bencher.startbench()
-		self._imagebackup.start_dd(True, self._ddbatchsize, self._finished)
+
+		if self._pipeline is not None:
+			self._run_local(self._run_pipeline)
+		else:
+			self._dd_started = perf_counter()
+			self._imagebackup.start_dd(True, self._ddbatchsize, self._finished)
 
 
@@ -1,10 +1,17 @@
 from json import load
-from logging import INFO, ERROR
-from typing import List, Callable
-from classes.LoggerFactory import LoggerHandlerType, LoggerFactory, LoggerHandlerConfig
-from fileutilslib.misclib.helpertools import is_sequence_with_any_elements, assert_obj_has_keys, string_is_empty
+from logging import ERROR
+from threading import local
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+from classes.LoggerFactory import LoggerHandlerType, LoggerFactory, LoggerHandlerConfig, LoggerFileLines, FILES
+from classes.Metrics import Metrics
+from fileutilslib.misclib.helpertools import is_sequence_with_any_elements, assert_obj_has_keys, string_is_empty, \
+	is_integer
 import click
 
+if TYPE_CHECKING:
+	# Imports paramiko, which only the units that connect need
+	from classes.ConnectionPool import ConnectionPool
+
 
 class Unit:
 
@@ -35,6 +42,33 @@ class Unit:
 	_div = "==============="
 	""":type: str"""
 
+	_logtag = None
+	""":type: threading.local"""
+
+	_logprefix = None
+	""":type: str"""
+
+	_metrics = None
+	""":type: Metrics"""
+
+	_metrics_json = None
+	""":type: str"""
+
+	_metrics_prometheus = None
+	""":type: str"""
+
+	_mandatory_option_keys = None
+	""":type: List[str]"""
+
+	_config_loaded_handler = None
+	""":type: Callable"""
+
+	_logfactory = None
+	""":type: LoggerFactory"""
+
+	_connection_pool = None
+	""":type: ConnectionPool"""
+
 	def __init__(
 		self,
 		unit_name: str,
@@ -50,6 +84,10 @@ class Unit:
 		self._config_loaded = False
 		self._group = group
 		self._ignoreoptions = ignoreoptions
+		self._logtag = local()
+		self._mandatory_option_keys = mandatory_option_keys
+		self._config_loaded_handler = config_loaded_handler
+		self._logfactory = logfactory
 
 		if configfile is None:
 			raise Exception("configfile is invalid")
@@ -70,13 +108,113 @@ class Unit:
 					dbg += "{}: {}\n".format(k, str(v))
 		return dbg
 
-	def info(self, msg):
+	def set_logtag(self, tag: str=None):
+		"""Prefixes the log-lines of the calling thread with [tag], so parallel jobs stay readable"""
+		self._logtag.tag = tag
+
+	def set_logprefix(self, prefix: str=None):
+		"""Prefixes all log-lines of this unit with [prefix], before the tag of the thread"""
+		self._logprefix = prefix
+
+	def _tag(self, msg: str, args: tuple=()) -> str:
+		tags = [t for t in (self._logprefix, getattr(self._logtag, "tag", None)) if t is not None]
+		if len(tags) == 0:
+			return msg
+		if len(args) > 0:
+			# msg is %-formatted with args later, a % in a tag must not take part
+			tags = [t.replace("%", "%%") for t in tags]
+		stripped = msg.lstrip("\n")
+		return "{}{} {}".format(
+			msg[:len(msg) - len(stripped)],
+			" ".join("[{}]".format(t) for t in tags),
+			stripped
+		)
+
+	def set_connection_pool(self, pool: "ConnectionPool"):
+		"""Takes the ssh-connections from pool instead of opening its own, pool closes them"""
+		self._connection_pool = pool
+
+	def get_worker_demand(self) -> Tuple[int, int]:
+		"""The cpu- and network-slots of a WorkerBudget that a run keeps busy"""
+		return 1, 0
+
+	def set_worker_grant(self, cpu: int, network: int):
+		"""The slots a WorkerBudget reserved for the next run, its workers are limited to them"""
+		pass
+
+	def get_transferred_bytes(self) -> int:
+		"""The bytes the last run read from its source"""
+		return 0
+
+	def get_metrics(self) -> Metrics:
+		"""The metrics of the last run"""
+		return self._metrics
+
+	def write_metrics(self, metrics: List[Metrics]):
+		"""Writes metrics to the files of options['metrics'], if there are any"""
+		if self._metrics_json is not None:
+			Metrics.write_json(self._metrics_json, metrics)
+		if self._metrics_prometheus is not None:
+			Metrics.write_prometheus(self._metrics_prometheus, metrics)
+
+	def info(self, msg, *args):
+		"""
+		:param args: msg is %-formatted with them only if a handler takes the line
+		"""
 		if self._logger is not None:
-			self._logger.info(msg)
+			self._logger.info(self._tag(msg, args), *args)
+
+	def fileinfo(self, msg, *args):
+		"""Logs a line about a single file with the level FILES, which the loggers may sample or drop"""
+		if self._logger is not None and self._logger.isEnabledFor(FILES):
+			self._logger.log(FILES, self._tag(msg, args), *args)
+
+	def flush_logs(self):
+		"""Writes the lines the loggers still batch, at the end of a run"""
+		if self._logger is not None:
+			LoggerFactory.flush(self._logger)
 
 	def error(self, e):
 		if self._logger is not None:
-			self._logger.error(str(e))
+			self._logger.error(self._tag(str(e)))
+
+	@staticmethod
+	def _load_logger_pipeline(logger: Dict, handlerconfig: LoggerHandlerConfig):
+		"""Applies the optional keys async, batch_size, files and file_sample of a logger in json
+
+		async hands the lines to a separate thread, batch_size defaults to 256 lines for an async
+		file-logger. files is all, sample (every file_sample-th per-file line, 100 by default) or
+		summary (no per-file lines, the job-summaries and errors remain).
+		"""
+		asynchronous = "async" in logger and logger["async"] is True
+		batch_size = logger["batch_size"] if "batch_size" in logger else (256 if asynchronous else 1)
+		if not is_integer(batch_size) or batch_size < 1:
+			raise Exception("logger batch_size in json has to be an integer greater than 0")
+		handlerconfig.set_pipeline(asynchronous, batch_size)
+
+		if "files" in logger:
+			filelines = {
+				"all": LoggerFileLines.All,
+				"sample": LoggerFileLines.Sample,
+				"summary": LoggerFileLines.Summary
+			}.get(logger["files"])
+			if filelines is None:
+				raise Exception("logger files in json has to be 'all', 'sample' or 'summary'")
+
+			sample = logger["file_sample"] if "file_sample" in logger else 100
+			if not is_integer(sample) or sample < 1:
+				raise Exception("logger file_sample in json has to be an integer greater than 0")
+			handlerconfig.set_filelines(filelines, sample)
+
+	def get_name(self) -> str:
+		return self._options["name"] if self._options is not None and "name" in self._options else self._unit_name
+
+	def get_options(self) -> Dict:
+		return self._options
+
+	def reload(self, configfile: click.File):
+		"""Loads the configfile again, with the mandatory keys and the handler of the constructor"""
+		self.reload_jsonconfig(configfile, self._mandatory_option_keys, self._config_loaded_handler, self._logfactory)
 
 	def is_config_loaded(self):
 		return self._config_loaded
@@ -99,6 +237,15 @@ class Unit:
 
 		self._options = options
 
+		# A reload starts without the loggers and metrics-files of the former config
+		append = False
+		if self._logger is not None:
+			logfactory.removelogger(self._logger)
+			self._logger = None
+			append = True
+		self._metrics_json = None
+		self._metrics_prometheus = None
+
 		if "loggers" in options:
 			loggers = options["loggers"]
 			if is_sequence_with_any_elements(loggers):
@@ -129,23 +276,36 @@ class Unit:
 					handlerconfig = None
 					""":type:LoggerHandlerConfig"""
 
+					# all includes the per-file lines
 					if lt == LoggerHandlerType.FileHandler:
 						handlerconfig = LoggerHandlerConfig.create_file_config(
-							ERROR if logger["level"] == "errors" else INFO,
+							ERROR if logger["level"] == "errors" else FILES,
 							logger["folder"]
 						)
 					else:
 						if logger["level"] == "errors":
 							handlerconfig = LoggerHandlerConfig.create_console_err_config(ERROR)
 						else:
-							handlerconfig = LoggerHandlerConfig.create_console_err_config(INFO)
+							handlerconfig = LoggerHandlerConfig.create_console_err_config(FILES)
 
+					self._load_logger_pipeline(logger, handlerconfig)
 					handlerconfigs.append(handlerconfig)
 
 				self._logger = logfactory.addlogger(
 					options["name"],
-					handlerconfigs
+					handlerconfigs,
+					append
 				)
+
+		if "metrics" in options:
+			metrics = options["metrics"]
+			if not isinstance(metrics, dict):
+				raise Exception("json-config options['metrics'] has to be a dict with the keys json and/or prometheus")
+			if "json" in metrics:
+				self._metrics_json = metrics["json"]
+			if "prometheus" in metrics:
+				self._metrics_prometheus = metrics["prometheus"]
+
 		self._config_loaded = True
 
 		if config_loaded_handler is not None:
@@ -0,0 +1,134 @@
+import io
+import subprocess
+from threading import Lock
+from time import sleep
+from typing import Callable
+import paramiko
+
+
+class FakeTransport:
+	"""The part of paramiko.Transport the units use, a dropped connection is an inactive transport"""
+
+	def __init__(self, number: int):
+		self.number = number
+		self.active = True
+		self.keepalive = None
+
+	def set_keepalive(self, interval: int):
+		self.keepalive = interval
+
+	def is_active(self) -> bool:
+		return self.active
+
+	def close(self):
+		self.active = False
+
+
+class FakeSshConnection:
+	"""Connects FakeTransports, the first failures connects raise like an unreachable host"""
+
+	def __init__(self, host: str="host", failures: int=0, delay: float=0.0):
+		self.host = host
+		self.failures = failures
+		self.delay = delay
+		self.transports = []
+		self._lock = Lock()
+
+	def get_host(self) -> str:
+		return self.host
+
+	def get_key(self):
+		return self.host, "user", "password", None
+
+	def connect(self, log: Callable=None, transport: paramiko.Transport=None) -> FakeTransport:
+		sleep(self.delay)
+		with self._lock:
+			if self.failures > 0:
+				self.failures -= 1
+				raise OSError("Connection refused")
+			transport = FakeTransport(len(self.transports) + 1)
+			self.transports.append(transport)
+			return transport
+
+
+class FakeChannel:
+	"""The part of paramiko.Channel the remote commands use, runs the command locally with bash
+
+	The command runs once its output is read, with everything sent before as stdin.
+	"""
+
+	def __init__(self, transport: "FakeExecTransport"):
+		self._transport = transport
+		self._command = None
+		self._stdin = b""
+		self._stdout = None
+		self._stderr = None
+		self._exitstatus = None
+		self.closed = False
+
+	def exec_command(self, command: str):
+		self._transport.commands.append(command)
+		if self._transport.fail:
+			raise paramiko.SSHException("No exec-channel")
+		self._command = command
+
+	def sendall(self, data: bytes):
+		self._stdin += data
+
+	def shutdown_write(self):
+		pass
+
+	def _run(self):
+		if self._exitstatus is None and self._command in self._transport.replies:
+			stdout, stderr, self._exitstatus = self._transport.replies[self._command]
+			self._stdout = io.BytesIO(stdout)
+			self._stderr = io.BytesIO(stderr)
+		elif self._exitstatus is None:
+			result = subprocess.run(
+				["bash", "-c", self._command], input=self._stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+			)
+			self._stdout = io.BytesIO(result.stdout)
+			self._stderr = io.BytesIO(result.stderr)
+			self._exitstatus = result.returncode
+
+	def recv(self, nbytes: int) -> bytes:
+		self._run()
+		return self._stdout.read(nbytes)
+
+	def makefile(self, mode: str="r", bufsize: int=-1) -> io.BytesIO:
+		self._run()
+		return self._stdout
+
+	def recv_stderr_ready(self) -> bool:
+		self._run()
+		return self._stderr.tell() < len(self._stderr.getbuffer())
+
+	def recv_stderr(self, nbytes: int) -> bytes:
+		self._run()
+		return self._stderr.read(nbytes)
+
+	def recv_exit_status(self) -> int:
+		self._run()
+		return self._exitstatus
+
+	def close(self):
+		self.closed = True
+
+
+class FakeExecTransport(FakeTransport):
+	"""A FakeTransport whose exec-channels run the commands locally, fail raises like a host without exec
+
+	replies maps a command to the (stdout, stderr, exit status) it gets instead of running.
+	"""
+
+	def __init__(self, fail: bool=False, replies: dict=None):
+		super().__init__(1)
+		self.fail = fail
+		self.replies = replies or {}
+		self.commands = []
+		self.channels = []
+
+	def open_session(self) -> FakeChannel:
+		channel = FakeChannel(self)
+		self.channels.append(channel)
+		return channel
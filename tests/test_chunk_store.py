@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.ChunkStore import ChunkStore, ChunkStoreException
+
+
+class ChunkStoreTest(unittest.TestCase):
+
+	CHUNK = 4096
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.folder = Path(self._tmpdir.name)
+		self.store = ChunkStore(str(self.folder / "store"), self.CHUNK, "raw", workers=3)
+		self.blocks = [os.urandom(self.CHUNK) for _ in range(4)]
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def backup(self, data: bytes, store: ChunkStore=None) -> Path:
+		return (store or self.store).backup(io.BytesIO(data), "disk", "/dev/sdx", len(data))
+
+	def restore(self, manifest: Path, store: ChunkStore=None) -> bytes:
+		target = self.folder / "restored"
+		(store or self.store).restore(str(manifest), str(target))
+		return target.read_bytes()
+
+	def test_round_trip_with_dedup(self):
+		a, b, c, d = self.blocks
+		data = a + b + a + bytes(self.CHUNK) + c + d[:100]
+
+		manifest = self.backup(data)
+		self.assertEqual((4, 1, 1), (
+			self.store.get_new_chunks(), self.store.get_known_chunks(), self.store.get_zero_chunks()
+		))
+		self.assertEqual(3 * self.CHUNK + 100, self.store.get_bytes_written())
+		self.assertEqual(data, self.restore(manifest))
+
+		content = json.loads(manifest.read_text())
+		self.assertEqual(len(data), content["size"])
+		self.assertEqual("/dev/sdx", content["device"])
+		self.assertIsNone(content["chunks"][3])
+		self.assertEqual(content["chunks"][0], content["chunks"][2])
+
+	def test_second_run_stores_only_changed_chunks(self):
+		a, b, c, d = self.blocks
+		first = self.backup(a + b + c)
+		changed = a + d + c + bytes(10)
+		second = self.backup(changed)
+
+		self.assertNotEqual(first, second)
+		self.assertEqual((1, 2, 1), (
+			self.store.get_new_chunks(), self.store.get_known_chunks(), self.store.get_zero_chunks()
+		))
+		self.assertEqual(a + b + c, self.restore(first))
+		self.assertEqual(changed, self.restore(second))
+		self.assertEqual(2, len(list(self.store.get_manifest_dir().iterdir())))
+
+	def test_compressed_chunks(self):
+		data = self.blocks[0] * 2 + b"x" * (3 * self.CHUNK)
+		for fmt in ("xz", "gz"):
+			with self.subTest(fmt=fmt):
+				store = ChunkStore(str(self.folder / fmt), self.CHUNK, fmt, workers=2)
+				manifest = self.backup(data, store)
+
+				self.assertEqual(2, store.get_new_chunks())
+				self.assertTrue(store.get_chunk_path(ChunkStore.hash(b"x" * self.CHUNK), fmt).exists())
+				self.assertEqual(data, self.restore(manifest, store))
+
+	def test_missing_and_corrupt_chunks(self):
+		a, b = self.blocks[:2]
+		manifest = self.backup(a + b)
+		path = self.store.get_chunk_path(ChunkStore.hash(b), "raw")
+
+		path.write_bytes(a)
+		with self.assertRaises(ChunkStoreException):
+			self.restore(manifest)
+
+		path.unlink()
+		with self.assertRaises(ChunkStoreException):
+			self.restore(manifest)
+
+	def test_invalid_manifest_and_format(self):
+		manifest = self.folder / "manifest.json"
+		manifest.write_text(json.dumps({"size": 0, "chunks": []}))
+
+		with self.assertRaises(ChunkStoreException):
+			ChunkStore.load_manifest(str(manifest))
+		with self.assertRaises(ChunkStoreException):
+			ChunkStore(str(self.folder), fmt="zst")
+
+
+if __name__ == "__main__":
+	unittest.main()
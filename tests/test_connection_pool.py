@@ -0,0 +1,68 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from classes.ConnectionPool import ConnectionPool
+from tests.fakes import FakeSshConnection
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+	@staticmethod
+	def _acquire_with_generation(pool: ConnectionPool, connection: FakeSshConnection):
+		def acquire(_):
+			transport = pool.acquire(connection)
+			return transport, transport.get_generation()
+		return acquire
+
+	def test_units_of_the_same_host_share_one_connect(self):
+		pool = ConnectionPool(keepalive=10)
+		connection = FakeSshConnection(delay=0.05)
+
+		with ThreadPoolExecutor(max_workers=8) as executor:
+			acquired = list(executor.map(self._acquire_with_generation(pool, connection), range(8)))
+		transports = [transport for transport, _ in acquired]
+
+		self.assertEqual(1, len(connection.transports))
+		self.assertEqual(1, len({id(t) for t in transports}))
+		# Nobody got the transport before its connect was done
+		self.assertEqual([1] * 8, [generation for _, generation in acquired])
+		self.assertIs(connection.transports[0], transports[0].get_transport())
+		self.assertEqual(10, connection.transports[0].keepalive)
+		self.assertEqual(1, len(pool))
+		self.assertEqual(8, pool.get_acquired())
+
+		pool.close()
+		self.assertFalse(connection.transports[0].is_active())
+		self.assertEqual(0, len(pool))
+
+	def test_other_hosts_get_their_own_transport(self):
+		pool = ConnectionPool()
+		first = pool.acquire(FakeSshConnection("a"))
+		second = pool.acquire(FakeSshConnection("b"))
+
+		self.assertIsNot(first, second)
+		self.assertEqual(2, len(pool))
+		pool.close()
+
+	def test_failed_connect_is_tried_again_by_the_next_unit(self):
+		pool = ConnectionPool()
+		connection = FakeSshConnection(failures=1, delay=0.05)
+
+		def acquire(_):
+			try:
+				return pool.acquire(connection)
+			except OSError:
+				return None
+
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			transports = list(executor.map(acquire, range(4)))
+
+		connected = [t for t in transports if t is not None]
+		self.assertEqual(1, transports.count(None))
+		self.assertEqual(1, len(connection.transports))
+		self.assertEqual(1, len({id(t) for t in connected}))
+		self.assertEqual(1, len(pool))
+		pool.close()
+
+
+if __name__ == "__main__":
+	unittest.main()
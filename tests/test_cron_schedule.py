@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+from classes.CronSchedule import CronSchedule, CronScheduleException
+
+
+class CronScheduleTest(unittest.TestCase):
+
+	def assertNext(self, expression: str, after: datetime, expected: datetime):
+		self.assertEqual(expected, CronSchedule(expression).next(after), expression)
+
+	def test_steps_and_ranges(self):
+		self.assertNext("*/15 * * * *", datetime(2020, 1, 1, 10, 0, 30), datetime(2020, 1, 1, 10, 15))
+		self.assertNext("*/15 * * * *", datetime(2020, 1, 1, 10, 50), datetime(2020, 1, 1, 11, 0))
+		self.assertNext("0 8-18/2 * * *", datetime(2020, 1, 1, 9, 0), datetime(2020, 1, 1, 10, 0))
+		self.assertNext("0 8-18/2 * * *", datetime(2020, 1, 1, 18, 0), datetime(2020, 1, 2, 8, 0))
+		self.assertNext("5/20 * * * *", datetime(2020, 1, 1, 10, 30), datetime(2020, 1, 1, 10, 45))
+		self.assertNext("1,15,30 * * * *", datetime(2020, 1, 1, 10, 15), datetime(2020, 1, 1, 10, 30))
+
+	def test_next_is_after_the_given_minute(self):
+		self.assertNext("30 10 * * *", datetime(2020, 1, 1, 10, 30), datetime(2020, 1, 2, 10, 30))
+
+	def test_aliases(self):
+		after = datetime(2020, 1, 15, 10, 30)
+		self.assertNext("@hourly", after, datetime(2020, 1, 15, 11, 0))
+		self.assertNext("@daily", after, datetime(2020, 1, 16))
+		self.assertNext("@midnight", after, datetime(2020, 1, 16))
+		# 2020-01-15 is a wednesday
+		self.assertNext("@weekly", after, datetime(2020, 1, 19))
+		self.assertNext("@monthly", after, datetime(2020, 2, 1))
+
+	def test_months_and_leap_days(self):
+		self.assertNext("0 0 29 2 *", datetime(2021, 1, 1), datetime(2024, 2, 29))
+		self.assertNext("0 0 31 * *", datetime(2020, 4, 1), datetime(2020, 5, 31))
+		self.assertNext("0 0 1 1 *", datetime(2020, 12, 31, 23, 59), datetime(2021, 1, 1))
+
+	def test_sunday_is_0_and_7(self):
+		# 2020-01-05 is a sunday
+		self.assertNext("0 0 * * 7", datetime(2020, 1, 1), datetime(2020, 1, 5))
+		self.assertNext("0 0 * * 0", datetime(2020, 1, 1), datetime(2020, 1, 5))
+		self.assertNext("0 0 * * 1-5", datetime(2020, 1, 4), datetime(2020, 1, 6))
+
+	def test_restricted_day_and_weekday_match_either(self):
+		# The 10th or a monday: monday 2020-01-06 comes first
+		self.assertNext("0 0 10 * 1", datetime(2020, 1, 1), datetime(2020, 1, 6))
+		self.assertNext("0 0 10 * 1", datetime(2020, 1, 7), datetime(2020, 1, 10))
+		# Only day of month restricted
+		self.assertNext("0 0 10 * *", datetime(2020, 1, 1), datetime(2020, 1, 10))
+
+	def test_stepped_star_is_unrestricted(self):
+		# A monday on an odd day, not any odd day or any monday
+		self.assertNext("0 0 */2 * 1", datetime(2020, 1, 1), datetime(2020, 1, 13))
+		# The 1st on a sunday or thursday: sunday 2020-03-01
+		self.assertNext("0 0 1 * */4", datetime(2020, 1, 1), datetime(2020, 3, 1))
+
+	def test_invalid_expressions(self):
+		for expression in ("* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "* * * * 8",
+						   "5-1 * * * *", "*/0 * * * *", "a * * * *", "* * * * mon"):
+			with self.subTest(expression=expression):
+				with self.assertRaises(CronScheduleException):
+					CronSchedule(expression)
+
+	def test_schedule_that_never_matches(self):
+		with self.assertRaises(CronScheduleException):
+			CronSchedule("0 0 31 2 *").next(datetime(2020, 1, 1))
+
+	def test_str(self):
+		self.assertEqual("@daily", str(CronSchedule("@daily")))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,139 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Tuple
+from classes.DeltaSync import DeltaSync, DeltaSyncException
+from tests.fakes import FakeExecTransport
+
+
+class LocalRemoteFile:
+	"""The part of paramiko.SFTPFile DeltaSync uses, reads a local file"""
+
+	def __init__(self, sftp: "LocalSftp", path: str):
+		self._sftp = sftp
+		self._file = open(path, "rb")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self._file.close()
+		return False
+
+	def readv(self, chunks: List[Tuple[int, int]]):
+		self._sftp.requests.append(list(chunks))
+		for offset, size in chunks:
+			self._file.seek(offset)
+			yield self._file.read(size)
+
+
+class LocalSftp:
+	"""Opens the remote files locally and records the pieces of each readv"""
+
+	def __init__(self):
+		self.requests = []
+
+	def open(self, path: str, mode: str) -> LocalRemoteFile:
+		return LocalRemoteFile(self, path)
+
+
+class DeltaSyncTest(unittest.TestCase):
+
+	BLOCK = 1024
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.folder = Path(self._tmpdir.name)
+		self.localfile = self.folder / "local"
+		self.remotefile = self.folder / "remote"
+		self.sftp = LocalSftp()
+		# The remote host is this one
+		self.delta = DeltaSync(FakeExecTransport(), sys.executable, self.BLOCK)
+		self.random = random.Random(7)
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def randbytes(self, length: int) -> bytes:
+		return bytes(self.random.getrandbits(8) for _ in range(length))
+
+	def sync(self, old: bytes, new: bytes) -> int:
+		self.localfile.write_bytes(old)
+		self.remotefile.write_bytes(new)
+		fetched = self.delta.sync(self.sftp, str(self.remotefile), self.localfile)
+
+		self.assertEqual(new, self.localfile.read_bytes())
+		self.assertEqual(["local", "remote"], sorted(p.name for p in self.folder.iterdir()))
+		return fetched
+
+	def test_inserted_deleted_and_changed_blocks(self):
+		old = self.randbytes(64 * self.BLOCK + 100)
+		new = (
+			old[:5 * self.BLOCK] + self.randbytes(300) + old[5 * self.BLOCK:20 * self.BLOCK]
+			+ old[24 * self.BLOCK:40 * self.BLOCK] + self.randbytes(self.BLOCK) + old[41 * self.BLOCK:]
+		)
+
+		fetched = self.sync(old, new)
+		# The inserted bytes, the changed block and the bytes up to the next matching block
+		self.assertEqual(300 + self.BLOCK, fetched)
+
+	def test_unchanged_and_unrelated_files(self):
+		old = self.randbytes(10 * self.BLOCK + 10)
+
+		self.assertEqual(0, self.sync(old, old))
+		new = self.randbytes(3 * self.BLOCK)
+		self.assertEqual(len(new), self.sync(old, new))
+		self.assertEqual(0, self.sync(self.randbytes(100), b""))
+		self.assertEqual(5, self.sync(b"", b"12345"))
+
+	def test_moved_tail_block(self):
+		old = self.randbytes(4 * self.BLOCK + 10)
+
+		self.assertEqual(7, self.sync(old, old[:self.BLOCK] + b"inserts" + old[self.BLOCK:]))
+		self.assertEqual(0, self.sync(old, old[:self.BLOCK] + old[2 * self.BLOCK:]))
+
+	def test_literals_are_read_in_bounded_pieces(self):
+		self.delta.CHUNK_SIZE = 1000
+		self.delta.WINDOW = 4000
+		new = self.randbytes(20 * self.BLOCK)
+
+		self.assertEqual(len(new), self.sync(self.randbytes(self.BLOCK), new))
+		self.assertTrue(all(size <= 1000 for request in self.sftp.requests for _, size in request))
+		self.assertTrue(all(sum(size for _, size in request) < 5000 for request in self.sftp.requests))
+		self.assertEqual(len(new), sum(size for request in self.sftp.requests for _, size in request))
+
+	def test_split_ranges(self):
+		self.assertEqual(
+			[(0, 4), (4, 4), (8, 2), (20, 3)],
+			DeltaSync.split_ranges([(0, 10), (20, 3)], 4)
+		)
+
+	def test_failed_script_raises(self):
+		self.localfile.write_bytes(b"old")
+		delta = DeltaSync(FakeExecTransport(), sys.executable, self.BLOCK)
+
+		with self.assertRaises(DeltaSyncException):
+			delta.sync(self.sftp, str(self.folder / "missing"), self.localfile)
+		with self.assertRaises(DeltaSyncException):
+			DeltaSync(FakeExecTransport(fail=True)).sync(self.sftp, str(self.remotefile), self.localfile)
+		self.assertEqual(b"old", self.localfile.read_bytes())
+
+	def test_remote_file_changed_during_the_sync(self):
+		old = self.randbytes(8 * self.BLOCK)
+		self.localfile.write_bytes(old)
+		self.remotefile.write_bytes(self.randbytes(100) + old)
+		ops = self.delta.compute_delta(str(self.remotefile), self.localfile, self.BLOCK)
+		self.delta.compute_delta = lambda *args: ops
+		self.remotefile.write_bytes(os.urandom(50))
+
+		with self.assertRaises(DeltaSyncException):
+			self.delta.sync(self.sftp, str(self.remotefile), self.localfile)
+		self.assertEqual(old, self.localfile.read_bytes())
+		self.assertFalse(self.localfile.with_name("local.delta").exists())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.DeviceUsage import DeviceUsage
+
+
+class DeviceUsageTest(unittest.TestCase):
+
+	BLOCK = 4096
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.device = Path(self._tmpdir.name, "device")
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def test_counts_the_blocks_that_arent_zeros(self):
+		zeros = bytes(self.BLOCK)
+		# A block with a single byte counts whole, the short last block counts by its length
+		self.device.write_bytes(
+			os.urandom(self.BLOCK) + zeros * 3 + b"\x01" + zeros[1:] + zeros + os.urandom(10)
+		)
+		progress = []
+		usage = DeviceUsage(str(self.device))
+
+		# Reads of 3 blocks are rounded to whole blocks
+		data_bytes = usage.count_data_bytes(self.BLOCK, 3 * self.BLOCK + 100, lambda done, total: progress.append(done))
+
+		self.assertEqual(2 * self.BLOCK + 10, data_bytes)
+		self.assertEqual(6 * self.BLOCK + 10, usage.get_size())
+		self.assertEqual([3 * self.BLOCK, 6 * self.BLOCK, 6 * self.BLOCK + 10], progress)
+
+	def test_empty_and_zero_devices(self):
+		self.device.write_bytes(b"")
+		self.assertEqual(0, DeviceUsage(str(self.device)).count_data_bytes(self.BLOCK))
+
+		self.device.write_bytes(bytes(5 * self.BLOCK))
+		self.assertEqual(0, DeviceUsage(str(self.device)).count_data_bytes(self.BLOCK, self.BLOCK))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,111 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from time import sleep, time
+import paramiko
+from classes.DirectoryCache import DirectoryCache
+
+
+def attributes(filename: str, size: int, mtime: int) -> paramiko.SFTPAttributes:
+	a = paramiko.SFTPAttributes()
+	a.filename = filename
+	a.st_size = size
+	a.st_uid = 1000
+	a.st_gid = 1000
+	a.st_mode = 0o100644
+	a.st_atime = mtime
+	a.st_mtime = mtime
+	return a
+
+
+class DirectoryCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.filepath = Path(self._tmpdir.name, "state", "dircache.sqlite")
+		self.mtime = int(time()) - 3600
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def reload(self, max_age: float=None) -> DirectoryCache:
+		# None trusts the listings for as long as the mtime of their directory is unchanged
+		cache = DirectoryCache(self.filepath, max_age)
+		cache.load()
+		return cache
+
+	def save_listing(self, remotepath: str, mtime: int, listing):
+		cache = self.reload()
+		cache.add_root("/data")
+		cache.put(remotepath, mtime, listing)
+		cache.save()
+
+	def test_listing_survives_save_and_load(self):
+		self.save_listing("/data", self.mtime, [attributes("a", 10, 1500000000), attributes("b", 0, 1500000001)])
+
+		cache = self.reload()
+		listing = cache.get("/data", self.mtime)
+
+		self.assertEqual(
+			[("a", 10, 1500000000), ("b", 0, 1500000001)],
+			[(a.filename, a.st_size, a.st_mtime) for a in listing]
+		)
+		self.assertEqual(0o100644, listing[0].st_mode)
+		self.assertEqual(1, cache.get_hits())
+
+	def test_changed_directory_is_listed_again(self):
+		self.save_listing("/data", self.mtime, [attributes("a", 10, 1500000000)])
+
+		cache = self.reload()
+		self.assertIsNone(cache.get("/data", self.mtime + 1))
+		self.assertIsNone(cache.get("/data/unknown", self.mtime))
+		self.assertEqual(0, cache.get_hits())
+
+	def test_recently_changed_directory_is_not_cached(self):
+		# Another entry could still be added within the same second as the mtime
+		self.save_listing("/data", int(time()), [attributes("a", 10, 1500000000)])
+
+		self.assertEqual(0, len(self.reload()))
+
+	def test_expired_listing_is_validated_again(self):
+		self.save_listing("/data", self.mtime, [attributes("a", 10, 1500000000)])
+		sleep(0.01)
+
+		self.assertIsNone(self.reload(max_age=0.001).get("/data", self.mtime))
+		self.assertIsNotNone(self.reload(max_age=3600).get("/data", self.mtime))
+
+	def test_file_changed_in_place_is_picked_up_by_default(self):
+		# Writing into a file changes its size and mtime, not the mtime of its directory
+		self.save_listing("/data", self.mtime, [attributes("a", 10, 1500000000)])
+		self.assertEqual(10, self.reload(max_age=DirectoryCache.MAX_AGE).get("/data", self.mtime)[0].st_size)
+
+		with sqlite3.connect(str(self.filepath)) as con:
+			con.execute("UPDATE dirs SET validated = ?", (time() - DirectoryCache.MAX_AGE - 1,))
+		con.close()
+
+		cache = DirectoryCache(self.filepath)
+		cache.load()
+		self.assertIsNone(cache.get("/data", self.mtime))
+
+	def test_unused_listings_below_processed_roots_are_dropped(self):
+		cache = self.reload()
+		cache.add_root("/data")
+		cache.add_root("/other")
+		for path in ("/data", "/data/gone", "/other"):
+			cache.put(path, self.mtime, [])
+		cache.save()
+
+		cache = self.reload()
+		cache.add_root("/data/")
+		cache.get("/data", self.mtime)
+		cache.save()
+
+		cache = self.reload()
+		self.assertIsNotNone(cache.get("/data", self.mtime))
+		self.assertIsNone(cache.get("/data/gone", self.mtime))
+		self.assertIsNotNone(cache.get("/other", self.mtime))
+
+
+if __name__ == "__main__":
+	unittest.main()
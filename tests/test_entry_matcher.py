@@ -0,0 +1,78 @@
+import unittest
+from benchmarks.filter_benchmark import OPTIONS, ROOT, run_compiled, run_legacy, synthetic_paths
+from classes.EntryMatcher import EntryMatcher
+from classes.JobException import JobException
+
+
+class EntryMatcherTest(unittest.TestCase):
+
+	def test_decides_like_the_fnmatch_checks(self):
+		samples = list(synthetic_paths(2000))
+		decisions = run_compiled(samples)
+
+		self.assertEqual(run_legacy(samples), decisions)
+		self.assertEqual(
+			{None, "EXCLUDE_FOLDERS", "EXCLUDE_FILTER", "INCLUDE_FILTERS"},
+			set(decisions)
+		)
+
+	def test_folders(self):
+		matcher = EntryMatcher(OPTIONS)
+
+		self.assertEqual("EXCLUDE_FOLDERS", matcher.check_folder(ROOT, ROOT + "/a/project.git"))
+		self.assertEqual("EXCLUDE_FOLDERS", matcher.check_folder(ROOT, ROOT + "/cache1"))
+		self.assertEqual("EXCLUDE_FOLDERS", matcher.check_folder(None, "tmp"))
+		self.assertIsNone(matcher.check_folder(ROOT, ROOT + "/a/tmp2"))
+		self.assertIsNone(matcher.check_folder("/other", "/other/cache1"))
+		# A relative pattern never matches the root of the entry itself
+		self.assertIsNone(matcher.check_folder("/srv/tmp", "/srv/tmp"))
+		self.assertEqual(["golang", "xpad", "*.git", "tmp"], matcher.get_prune_names())
+		self.assertEqual(["/opt/retropie/supplementary/cache*"], matcher.get_prune_paths())
+
+	def test_files(self):
+		matcher = EntryMatcher(OPTIONS)
+		root = ROOT + "/emulationstation"
+
+		self.assertIsNone(matcher.check_file(root, root + "/es_settings.cfg"))
+		self.assertEqual("EXCLUDE_FILTER", matcher.check_file(root, root + "/es_settings.cfg.bak"))
+		self.assertEqual("INCLUDE_FILTERS", matcher.check_file(root, root + "/image.png"))
+		self.assertEqual("EXCLUDE_FILES", matcher.check_file(root, root + "/es_log.txt"))
+		self.assertIsNone(matcher.check_file(root, root + "/sub/es_log.txt"))
+		self.assertEqual("EXCLUDE_FILES", matcher.check_file(ROOT, ROOT + "/a/b.bin"))
+		self.assertEqual("EXCLUDE_FILES", matcher.check_file(ROOT + "/", ROOT + "/es_log.txt"))
+
+	def test_ignored_options(self):
+		matcher = EntryMatcher(OPTIONS, ["exclude_folders", "include_filters", "exclude_files"])
+
+		self.assertIsNone(matcher.check_folder(ROOT, ROOT + "/tmp"))
+		self.assertIsNone(matcher.check_file(ROOT, ROOT + "/image.png"))
+		self.assertIsNone(matcher.check_file(ROOT, ROOT + "/es_log.txt"))
+		self.assertEqual("EXCLUDE_FILTER", matcher.check_file(ROOT, ROOT + "/a.bak"))
+
+	def test_group(self):
+		options = {"group": "daily"}
+
+		self.assertEqual("GROUP", EntryMatcher(options, group="weekly").check_folder(None, "/data"))
+		self.assertIsNone(EntryMatcher(options, group="daily").check_folder(None, "/data"))
+		self.assertIsNone(EntryMatcher(options).check_folder(None, "/data"))
+		self.assertIsNone(EntryMatcher(options, ["group"], "weekly").check_folder(None, "/data"))
+
+	def test_single_include_filter(self):
+		matcher = EntryMatcher({"include_filters": "*.cfg"})
+
+		self.assertIsNone(matcher.check_file("/data", "/data/a.cfg"))
+		self.assertEqual("INCLUDE_FILTERS", matcher.check_file("/data", "/data/a.txt"))
+
+	def test_without_options(self):
+		matcher = EntryMatcher({})
+
+		self.assertIsNone(matcher.check_folder("/data", "/data/tmp"))
+		self.assertIsNone(matcher.check_file("/data", "/data/a"))
+
+	def test_invalid_exclude_folders(self):
+		with self.assertRaises(JobException):
+			EntryMatcher({"exclude_folders": []})
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,98 @@
+import gzip
+import io
+import lzma
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.ImagePipeline import ImagePipeline
+
+
+class SlowSource(io.BytesIO):
+	"""Returns at most 1000 bytes per read like a channel"""
+
+	def read(self, size: int=-1) -> bytes:
+		return super().read(min(size, 1000) if size >= 0 else 1000)
+
+
+class ImagePipelineTest(unittest.TestCase):
+
+	CHUNK = 16 * 1024
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.image = Path(self._tmpdir.name, "image")
+		# Compressible, but every chunk differs
+		self.data = b"".join(os.urandom(64) * 100 for _ in range(20)) + b"tail"
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def run_pipeline(self, pipeline: ImagePipeline, data: bytes) -> bytes:
+		progress = []
+		with open(str(self.image), "wb") as target:
+			pipeline.run(io.BytesIO(data), target, len(data), lambda done, total: progress.append((done, total)))
+
+		self.assertEqual(len(data), pipeline.get_bytes_read())
+		self.assertEqual((len(data), len(data)), progress[-1])
+		return self.image.read_bytes()
+
+	def test_compressed_chunks_form_one_file(self):
+		for fmt, decompress in (("xz", lzma.decompress), ("gz", gzip.decompress)):
+			with self.subTest(fmt=fmt):
+				pipeline = ImagePipeline(fmt, chunk_size=self.CHUNK, workers=3)
+				image = self.run_pipeline(pipeline, self.data)
+
+				self.assertEqual(self.data, decompress(image))
+				self.assertEqual(len(image), pipeline.get_bytes_written())
+				self.assertLess(len(image), len(self.data))
+				self.assertEqual("." + fmt, pipeline.get_extension())
+
+	def test_raw_image(self):
+		pipeline = ImagePipeline("raw", chunk_size=self.CHUNK, workers=2)
+
+		self.assertEqual(self.data, self.run_pipeline(pipeline, self.data))
+		self.assertEqual("", pipeline.get_extension())
+
+	def test_empty_source(self):
+		pipeline = ImagePipeline("gz", chunk_size=self.CHUNK, workers=2)
+
+		with open(str(self.image), "wb") as target:
+			pipeline.run(io.BytesIO(b""), target)
+		self.assertEqual(b"", self.image.read_bytes())
+
+	def test_sparse_raw_image_seeks_over_zero_blocks(self):
+		block = ImagePipeline.SPARSE_BLOCK_SIZE
+		zeros = bytes(block)
+		data = os.urandom(block) + zeros * 3 + os.urandom(100) + zeros[100:] + os.urandom(block) + zeros * 2
+		pipeline = ImagePipeline("raw", chunk_size=2 * block, workers=2, sparse=True)
+
+		self.assertEqual(data, self.run_pipeline(pipeline, data))
+		self.assertEqual(5 * block, pipeline.get_zero_bytes())
+		self.assertEqual(2 * block + block, pipeline.get_bytes_written())
+		self.assertEqual(block, pipeline.get_sparse_block_size())
+
+	def test_sparse_compression_reuses_the_compressed_zero_chunk(self):
+		data = bytes(self.CHUNK) + self.data[:self.CHUNK] + bytes(self.CHUNK) + bytes(100)
+		pipeline = ImagePipeline("gz", chunk_size=self.CHUNK, workers=2, sparse=True)
+		image = self.run_pipeline(pipeline, data)
+
+		self.assertEqual(data, gzip.decompress(image))
+		self.assertEqual(2 * self.CHUNK + 100, pipeline.get_zero_bytes())
+		self.assertEqual(2, len(pipeline._compressed_zeros))
+		self.assertEqual(self.CHUNK, pipeline.get_sparse_block_size())
+
+	def test_read_chunk_fills_short_reads(self):
+		source = SlowSource(self.data)
+
+		self.assertEqual(self.data[:self.CHUNK], ImagePipeline.read_chunk(source, self.CHUNK))
+		self.assertEqual(self.data[self.CHUNK:2 * self.CHUNK], ImagePipeline.read_chunk(source, self.CHUNK))
+
+	def test_unknown_format(self):
+		self.assertFalse(ImagePipeline.is_streamable("7z"))
+		with self.assertRaises(Exception):
+			ImagePipeline("7z")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,149 @@
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from time import sleep
+from classes.LoggerFactory import BatchedFileHandler, FileLinesFilter, LoggerFactory, LoggerFileLines, \
+	LoggerHandlerConfig, FILES
+
+
+class FileLinesFilterTest(unittest.TestCase):
+
+	@staticmethod
+	def passed(filelines: LoggerFileLines, sample: int=1, level: int=FILES) -> list:
+		lines_filter = FileLinesFilter(filelines, sample)
+		return [
+			lines_filter.filter(logging.LogRecord("test", level, __file__, 1, "line", None, None))
+			for _ in range(7)
+		]
+
+	def test_filelines(self):
+		self.assertEqual([True] * 7, self.passed(LoggerFileLines.All))
+		self.assertEqual([False] * 7, self.passed(LoggerFileLines.Summary))
+		self.assertEqual([True, False, False, True, False, False, True], self.passed(LoggerFileLines.Sample, 3))
+
+	def test_other_levels_always_pass(self):
+		self.assertEqual([True] * 7, self.passed(LoggerFileLines.Summary, level=logging.INFO))
+		self.assertEqual([True] * 7, self.passed(LoggerFileLines.Sample, 3, logging.ERROR))
+
+
+class BatchedFileHandlerTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.logfile = Path(self._tmpdir.name, "test.log")
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def create_logger(self, handler: logging.Handler) -> logging.Logger:
+		logger = logging.Logger("batched")
+		logger.addHandler(handler)
+		return logger
+
+	def test_lines_are_flushed_per_batch_and_on_errors(self):
+		handler = BatchedFileHandler(str(self.logfile), batch_size=3, flush_interval=60)
+		logger = self.create_logger(handler)
+
+		logger.warning("1")
+		logger.warning("2")
+		self.assertEqual("", self.logfile.read_text())
+		logger.warning("3")
+		self.assertEqual("1\n2\n3\n", self.logfile.read_text())
+
+		logger.warning("4")
+		logger.error("5")
+		self.assertEqual("1\n2\n3\n4\n5\n", self.logfile.read_text())
+		handler.close()
+
+	def test_lines_are_flushed_on_the_timer(self):
+		handler = BatchedFileHandler(str(self.logfile), batch_size=100, flush_interval=0.05)
+		logger = self.create_logger(handler)
+
+		logger.warning("last line of a run")
+		self.assertEqual("", self.logfile.read_text())
+		# No further line is needed
+		for _ in range(100):
+			sleep(0.01)
+			if self.logfile.read_text() != "":
+				break
+		self.assertEqual("last line of a run\n", self.logfile.read_text())
+		handler.close()
+		handler._flusher.join(1)
+		self.assertFalse(handler._flusher.is_alive())
+
+	def test_close_flushes(self):
+		handler = BatchedFileHandler(str(self.logfile), batch_size=100, flush_interval=60)
+		self.create_logger(handler).warning("line")
+		handler.close()
+
+		self.assertEqual("line\n", self.logfile.read_text())
+
+
+class LoggerFactoryTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.factory = LoggerFactory("factory-test")
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def config(self, filelines: LoggerFileLines=LoggerFileLines.All) -> LoggerHandlerConfig:
+		config = LoggerHandlerConfig.create_file_config(FILES, self._tmpdir.name)
+		config.set_pipeline(True, 100)
+		config.set_filelines(filelines)
+		return config
+
+	def create_logger(self, name: str, filelines: LoggerFileLines=LoggerFileLines.All) -> logging.Logger:
+		return self.factory.addlogger(name, [self.config(filelines)])
+
+	def read(self, name: str) -> str:
+		return Path(self._tmpdir.name, "factory-test.{}.log".format(name)).read_text()
+
+	def test_flush_writes_the_queued_lines(self):
+		logger = self.create_logger("flush")
+		logger.info("line %d of %s", 1, "flush")
+		logger.log(FILES, "file")
+
+		LoggerFactory.flush(logger)
+		self.assertEqual("line 1 of flush\nfile\n", self.read("flush"))
+		self.factory.removelogger(logger)
+
+	def test_summary_raises_the_level_of_the_logger(self):
+		logger = self.create_logger("summary", LoggerFileLines.Summary)
+		self.assertFalse(logger.isEnabledFor(FILES))
+		self.assertTrue(logger.isEnabledFor(logging.INFO))
+		self.factory.removelogger(logger)
+
+	def test_removelogger_writes_the_pending_lines(self):
+		logger = self.create_logger("remove")
+		logger.info("pending")
+		self.factory.removelogger(logger)
+
+		self.assertEqual("pending\n", self.read("remove"))
+		self.assertNotIn(logger.name, LoggerFactory._logger_listeners)
+		self.assertEqual([], logger.handlers)
+
+		# addlogger gives it new handlers, which continue the logfile
+		self.assertEqual(1, len(self.factory.addlogger("remove", [self.config()], True).handlers))
+		logger.info("appended")
+		self.factory.removelogger(logger)
+		self.assertEqual("pending\nappended\n", self.read("remove"))
+
+	def test_shutdown_writes_the_pending_lines(self):
+		logger = self.create_logger("shutdown")
+		for i in range(10):
+			logger.info("line %d", i)
+		LoggerFactory.shutdown()
+
+		self.assertEqual("".join("line {}\n".format(i) for i in range(10)), self.read("shutdown"))
+		self.assertEqual([], LoggerFactory._listeners)
+		# Lines after the shutdown don't block a flush
+		logger.info("late")
+		LoggerFactory.flush(logger)
+		self.factory.removelogger(logger)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,131 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.BackupEntry import BackupEntry, BackupEntryType
+from classes.EntryMatcher import EntryMatcher
+from classes.LoggerFactory import LoggerFactory
+from classes.Manifest import Manifest, ManifestRecord
+from modules.FileBackupUnit import FileBackupUnit
+
+
+class ManifestTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.filepath = Path(self._tmpdir.name, "state", "manifest.sqlite")
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def reload(self) -> Manifest:
+		manifest = Manifest(self.filepath)
+		manifest.load()
+		return manifest
+
+	def test_load_without_file(self):
+		manifest = self.reload()
+
+		self.assertEqual(0, len(manifest))
+		self.assertIsNone(manifest.get("/data/a"))
+
+	def test_records_survive_save_and_load(self):
+		manifest = self.reload()
+		manifest.add_root("/data/")
+		manifest.record("/data/a", 10, 1500000000.5, 0o100644, "abc")
+		manifest.record("/data/sub/b", 0, 1500000001, 0o100600)
+		manifest.save()
+
+		manifest = self.reload()
+		self.assertEqual(2, len(manifest))
+		self.assertEqual(ManifestRecord(10, 1500000000.5, 0o100644, "abc"), manifest.get("/data/a"))
+		self.assertEqual(ManifestRecord(0, 1500000001, 0o100600, None), manifest.get("/data/sub/b"))
+		self.assertFalse(self.filepath.with_name(self.filepath.name + ".tmp").exists())
+
+	def test_counts_and_deleted_files(self):
+		manifest = self.reload()
+		manifest.add_root("/data")
+		for path in ("/data/unchanged", "/data/changed", "/data/deleted"):
+			manifest.record(path, 1, 1, 0o100644)
+		manifest.save()
+
+		manifest = self.reload()
+		manifest.add_root("/data")
+		manifest.confirm("/data/unchanged")
+		manifest.record("/data/changed", 2, 2, 0o100644)
+		manifest.record("/data/new", 3, 3, 0o100644)
+		# Confirming an unknown file doesn't create a record
+		manifest.confirm("/data/unknown")
+
+		self.assertEqual(1, manifest.get_new_count())
+		self.assertEqual(1, manifest.get_changed_count())
+		self.assertEqual(1, manifest.get_unchanged_count())
+		self.assertEqual(["/data/deleted"], manifest.get_deleted())
+
+		manifest.save()
+		manifest = self.reload()
+		self.assertIsNone(manifest.get("/data/deleted"))
+		self.assertIsNone(manifest.get("/data/unknown"))
+		self.assertEqual(ManifestRecord(2, 2, 0o100644, None), manifest.get("/data/changed"))
+		self.assertEqual(3, len(manifest))
+
+	def test_records_of_unprocessed_roots_are_kept(self):
+		manifest = self.reload()
+		manifest.add_root("/data")
+		manifest.add_root("/other")
+		manifest.record("/data/a", 1, 1, 0o100644)
+		manifest.record("/other/b", 1, 1, 0o100644)
+		manifest.save()
+
+		manifest = self.reload()
+		manifest.add_root("/data")
+		# A sibling with the root as prefix isn't below it
+		self.assertEqual(["/data/a"], manifest.get_deleted())
+		manifest.save()
+
+		manifest = self.reload()
+		self.assertIsNone(manifest.get("/data/a"))
+		self.assertEqual(ManifestRecord(1, 1, 0o100644, None), manifest.get("/other/b"))
+
+
+class ManifestCheckTest(unittest.TestCase):
+	"""Checks the remote files against the manifest of the last run, as a job of a unit does"""
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.localfile = Path(self._tmpdir.name, "a")
+		self.localfile.write_bytes(b"local")
+		self.remote_stat = os.lstat(str(self.localfile))
+
+		config = {
+			"options": {"name": "manifest", "host": "host", "user": "user", "password": "p", "targetdir": self._tmpdir.name},
+			"pathes": [{"name": "unused", "type": "dir", "path": "/unused"}]
+		}
+		self.unit = FileBackupUnit(io.StringIO(json.dumps(config)), False, LoggerFactory("manifest-test"), None, [])
+		self.unit._manifest = Manifest(Path(self._tmpdir.name, "manifest.sqlite"))
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def check(self, options: dict, recorded_size: int):
+		self.unit._manifest.record("/data/a", recorded_size, self.remote_stat.st_mtime, 0o100644)
+		self.unit._manifest.save()
+		self.unit._manifest.load()
+		entry = BackupEntry(BackupEntryType.Dir, "data", "", "/data", options)
+		entry.set_matcher(EntryMatcher(None, [], None))
+		return self.unit._check_file_with_options(entry, Path("/data"), self.localfile, Path("/data/a"), self.remote_stat)
+
+	def test_unchanged_file_is_skipped(self):
+		self.assertEqual("OVERWRITE_NEWER", self.check({"overwrite_newer": True}, 5))
+
+	def test_damaged_copy_is_transferred_again(self):
+		self.assertIsNone(self.check({"overwrite_newer": True}, 6))
+
+	def test_damaged_copy_is_kept_without_overwrite_existing(self):
+		self.assertEqual("OVERWRITE_EXISTING", self.check({"overwrite_existing": False}, 6))
+
+
+if __name__ == "__main__":
+	unittest.main()
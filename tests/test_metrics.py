@@ -0,0 +1,109 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from classes.Metrics import Histogram, Metrics
+
+
+class HistogramTest(unittest.TestCase):
+
+	def test_percentiles(self):
+		histogram = Histogram()
+		for value in reversed(range(1, 101)):
+			histogram.observe(value)
+
+		self.assertEqual(100, histogram.get_count())
+		self.assertEqual(5050, histogram.get_sum())
+		self.assertEqual(1, histogram.percentile(0))
+		self.assertEqual(51, histogram.percentile(50))
+		self.assertEqual(95, histogram.percentile(95))
+		self.assertEqual(99, histogram.percentile(99))
+		self.assertEqual(100, histogram.percentile(100))
+		self.assertEqual(0.0, Histogram().percentile(50))
+
+	def test_reservoir_stays_bounded_and_even(self):
+		histogram = Histogram(max_samples=200)
+		for value in range(10000):
+			histogram.observe(value)
+
+		self.assertEqual(10000, histogram.get_count())
+		self.assertEqual(200, len(histogram._samples))
+		# An even sample of 0 to 9999 has its median near the middle
+		self.assertAlmostEqual(5000, histogram.percentile(50), delta=1000)
+
+
+class MetricsTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.folder = Path(self._tmpdir.name)
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def create_metrics(self, unit: str) -> Metrics:
+		metrics = Metrics({"unit": unit})
+		metrics.inc("files_total", mode="sftp")
+		metrics.inc("files_total", 2, mode="sftp")
+		metrics.inc("files_total", mode="delta")
+		metrics.inc("bytes_total", 1024)
+		for value in (0.1, 0.2, 0.3):
+			metrics.observe("file_seconds", value)
+		return metrics
+
+	def test_counters_and_timer(self):
+		metrics = self.create_metrics("a")
+		with metrics.timer("listing", host="b"):
+			pass
+
+		self.assertEqual(3, metrics.get_counter("files_total", mode="sftp"))
+		self.assertEqual(0, metrics.get_counter("files_total", mode="tarstream"))
+		self.assertEqual({(("mode", "delta"),): 1, (("mode", "sftp"),): 3}, metrics.get_counters("files_total"))
+		self.assertEqual(1, len(metrics.get_counters("listing_seconds_total")))
+		self.assertEqual(3, metrics.get_histogram("file_seconds").get_count())
+		self.assertEqual(0, metrics.get_histogram("missing").get_count())
+
+	def test_prometheus_textfile(self):
+		path = self.folder / "backup.prom"
+		second = self.create_metrics('b"\\')
+		Metrics.write_prometheus(str(path), [self.create_metrics("a"), second])
+
+		lines = path.read_text().splitlines()
+		# One TYPE-line per family, the samples of both units below it
+		self.assertEqual(1, lines.count("# TYPE backthefooup_files_total counter"))
+		index = lines.index("# TYPE backthefooup_files_total counter")
+		self.assertEqual([
+			'backthefooup_files_total{mode="delta",unit="a"} 1',
+			'backthefooup_files_total{mode="sftp",unit="a"} 3',
+			'backthefooup_files_total{mode="delta",unit="b\\"\\\\"} 1',
+			'backthefooup_files_total{mode="sftp",unit="b\\"\\\\"} 3'
+		], lines[index + 1:index + 5])
+
+		index = lines.index("# TYPE backthefooup_file_seconds summary")
+		self.assertEqual([
+			'backthefooup_file_seconds{quantile="0.5",unit="a"} 0.2',
+			'backthefooup_file_seconds{quantile="0.95",unit="a"} 0.3',
+			'backthefooup_file_seconds{quantile="0.99",unit="a"} 0.3',
+			'backthefooup_file_seconds_sum{unit="a"} 0.6000000000000001',
+			'backthefooup_file_seconds_count{unit="a"} 3'
+		], lines[index + 1:index + 6])
+
+		self.assertIn("# TYPE backthefooup_run_seconds gauge", lines)
+		self.assertIn('backthefooup_bytes_total{unit="a"} 1024', lines)
+		self.assertFalse(path.with_name("backup.prom.tmp").exists())
+
+	def test_json(self):
+		path = self.folder / "metrics.json"
+		Metrics.write_json(str(path), [self.create_metrics("a")])
+
+		content = json.loads(path.read_text())
+		self.assertEqual(1, len(content))
+		self.assertEqual({"unit": "a"}, content[0]["labels"])
+		self.assertIn({"name": "files_total", "labels": {"mode": "sftp"}, "value": 3}, content[0]["counters"])
+		histogram = content[0]["histograms"][0]
+		self.assertEqual(("file_seconds", 3), (histogram["name"], histogram["count"]))
+		self.assertEqual({"0.5": 0.2, "0.95": 0.3, "0.99": 0.3}, histogram["quantiles"])
+
+
+if __name__ == "__main__":
+	unittest.main()
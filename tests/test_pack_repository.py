@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.Manifest import ManifestRecord
+from classes.PackRepository import PackRepository, PackRepositoryException, RepositoryTree
+
+
+class PackRepositoryTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.folder = Path(self._tmpdir.name)
+		self.root = str(self.folder / "repository")
+		self.source = self.folder / "source"
+		self.source.mkdir()
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def write_source(self, name: str, data: bytes, mode: int, mtime: int) -> Path:
+		path = self.source / name
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_bytes(data)
+		os.chmod(str(path), mode)
+		os.utime(str(path), (mtime, mtime))
+		return path
+
+	def backup(self, repository: PackRepository, tree: RepositoryTree, files) -> Path:
+		for name, path in files:
+			st = path.stat()
+			tree.add("/remote/" + name, name, st.st_size, int(st.st_mtime), st.st_mode, repository.store_file(path))
+		return repository.write_tree("entry", tree.get_files())
+
+	def test_restore_recreates_the_files(self):
+		for fmt in ("raw", "gz", "xz"):
+			with self.subTest(fmt=fmt):
+				repeated = os.urandom(1000)
+				files = [
+					("a.bin", self.write_source("a.bin", repeated * 3 + b"tail", 0o640, 1500000000)),
+					("sub/b.bin", self.write_source("sub/b.bin", repeated, 0o600, 1500000001)),
+					("empty", self.write_source("empty", b"", 0o644, 1500000002))
+				]
+				repository = PackRepository(self.root + fmt, chunk_size=1000, fmt=fmt)
+				treepath = self.backup(repository, RepositoryTree(), files)
+				repository.close()
+
+				self.assertEqual(2, repository.get_new_blobs())
+				self.assertEqual(3, repository.get_known_blobs())
+
+				target = self.folder / ("restored-" + fmt)
+				restored = PackRepository(self.root + fmt)
+				self.assertEqual((3, 3004 + 1000), restored.restore(str(treepath), str(target)))
+				restored.close()
+
+				for name, path in files:
+					with self.subTest(name=name):
+						self.assertEqual(path.read_bytes(), (target / name).read_bytes())
+						self.assertEqual(path.stat().st_mode, (target / name).stat().st_mode)
+						self.assertEqual(path.stat().st_mtime, (target / name).stat().st_mtime)
+
+	def test_unchanged_files_are_kept_from_the_former_tree(self):
+		files = [("a.bin", self.write_source("a.bin", os.urandom(3000), 0o644, 1500000000))]
+		repository = PackRepository(self.root, chunk_size=1000)
+		first = self.backup(repository, RepositoryTree(), files)
+
+		tree = RepositoryTree(PackRepository.load_tree(str(first)))
+		record = tree.get("/remote/a.bin")
+		self.assertEqual(ManifestRecord(3000, 1500000000, files[0][1].stat().st_mode, None), record)
+		self.assertEqual(3, len(tree.get_chunks("/remote/a.bin")))
+		self.assertTrue(repository.has_blobs(tree.get_chunks("/remote/a.bin")))
+		self.assertEqual([], tree.get_chunks("/remote/unknown"))
+		self.assertFalse(tree.keep("/remote/unknown"))
+		self.assertTrue(tree.keep("/remote/a.bin"))
+
+		second = repository.write_tree("entry", tree.get_files())
+		repository.close()
+		self.assertEqual(PackRepository.load_tree(str(first))["files"], PackRepository.load_tree(str(second))["files"])
+		self.assertEqual(second, repository.get_latest_tree("entry"))
+
+	def test_blobs_are_known_before_and_after_the_pack_is_sealed(self):
+		repository = PackRepository(self.root)
+		digest = repository.store(b"data")
+
+		self.assertTrue(repository.has_blobs([digest]))
+		self.assertFalse(repository.has_blobs([digest, PackRepository.hash(b"other")]))
+		self.assertEqual(digest, repository.store(b"data"))
+		self.assertEqual(1, repository.get_new_blobs())
+
+		repository.close()
+		self.assertTrue(PackRepository(self.root).has_blobs([digest]))
+
+	def test_uncommitted_blobs_are_not_in_the_index(self):
+		repository = PackRepository(self.root)
+		digest = repository.store(b"data")
+
+		other = PackRepository(self.root)
+		self.assertFalse(other.has_blobs([digest]))
+		repository.commit()
+		self.assertTrue(other.has_blobs([digest]))
+		other.close()
+		repository.close()
+
+	def test_repositories_share_a_root(self):
+		first = PackRepository(self.root, pack_size=100)
+		second = PackRepository(self.root, pack_size=100)
+		first_digests = [first.store(os.urandom(60)) for _ in range(3)]
+		second_digests = [second.store(os.urandom(60)) for _ in range(3)]
+		shared = [first.store(b"shared" * 10), second.store(b"shared" * 10)]
+		first.close()
+		second.close()
+
+		reader = PackRepository(self.root)
+		for digest in first_digests + second_digests + shared:
+			self.assertEqual(digest, PackRepository.hash(reader.read_blob(digest)))
+		reader.close()
+
+	def test_corrupt_blob_is_detected(self):
+		repository = PackRepository(self.root)
+		digest = repository.store(b"data" * 100)
+		repository.close()
+
+		pack = next(Path(self.root, "packs").glob("*/*.pack"))
+		data = bytearray(pack.read_bytes())
+		data[0] ^= 0xff
+		pack.write_bytes(bytes(data))
+
+		with self.assertRaises(PackRepositoryException):
+			PackRepository(self.root).read_blob(digest)
+		with self.assertRaises(PackRepositoryException):
+			PackRepository(self.root).read_blob(PackRepository.hash(b"unknown"))
+
+	def test_failed_restore_leaves_no_part(self):
+		files = [("a.bin", self.write_source("a.bin", b"data", 0o644, 1500000000))]
+		repository = PackRepository(self.root)
+		tree = RepositoryTree()
+		treepath = self.backup(repository, tree, files)
+		repository.close()
+		os.unlink(str(next(Path(self.root, "packs").glob("*/*.pack"))))
+
+		target = self.folder / "restored"
+		with self.assertRaises(OSError):
+			PackRepository(self.root).restore(str(treepath), str(target))
+		self.assertEqual([], list(target.iterdir()))
+
+	def test_unknown_format(self):
+		with self.assertRaises(PackRepositoryException):
+			PackRepository(self.root, fmt="zip")
+
+
+if __name__ == "__main__":
+	unittest.main()
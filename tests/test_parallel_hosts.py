@@ -0,0 +1,131 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Lock
+from time import sleep
+from classes.LoggerFactory import LoggerFactory
+from classes.TransferStats import TransferStats
+from modules.FileBackupUnit import FileBackupUnit
+
+
+class HostConnection:
+	"""The part of ReconnectingTransport a unit keeps between runs"""
+
+	def __init__(self, host: str):
+		self.host = host
+		self.closed = False
+
+	def get_host(self) -> str:
+		return self.host
+
+	def close(self):
+		self.closed = True
+
+
+class HostRecorder:
+	"""Shared by the copies of a HostUnit, collects them and the connections they were handed"""
+
+	def __init__(self):
+		self.lock = Lock()
+		self.running = 0
+		self.most_running = 0
+		self.copies = {}
+		self.handed = {}
+
+
+class HostUnit(FileBackupUnit):
+	"""Runs the copies per host without connecting, the host named fails raises and unreachable returns 113"""
+
+	recorder = None
+	""":type: HostRecorder"""
+
+	def run(self):
+		if self._hosts is not None:
+			return super().run()
+
+		with self.recorder.lock:
+			self.recorder.running += 1
+			self.recorder.most_running = max(self.recorder.most_running, self.recorder.running)
+			self.recorder.copies[self._host] = self
+			self.recorder.handed[self._host] = self._connection
+		sleep(0.05)
+		with self.recorder.lock:
+			self.recorder.running -= 1
+
+		if self._host == "fails":
+			raise Exception("Failed")
+		if self._host == "unreachable":
+			return 113
+
+		if self._connection is None:
+			self._connection = HostConnection(self._host)
+		stats = TransferStats(self._host)
+		stats.finish(0)
+		self._results = [stats]
+		return None
+
+
+class ParallelHostsTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.recorder = HostRecorder()
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def create_unit(self, hosts: list, parallel: int) -> HostUnit:
+		config = {
+			"options": {
+				"name": "hosts", "targetdir": self._tmpdir.name, "max_parallel_hosts": parallel,
+				"hosts": [
+					{"name": "name-" + host, "host": host, "user": "user-" + host, "password": "p"} for host in hosts
+				]
+			},
+			"pathes": [{"name": "etc", "type": "dir", "path": "/etc"}]
+		}
+		unit = HostUnit(io.StringIO(json.dumps(config)), False, LoggerFactory("hosts-test"), None, [])
+		unit.recorder = self.recorder
+		return unit
+
+	def test_hosts_run_in_parallel_into_their_folders(self):
+		unit = self.create_unit(["a", "b", "c", "d"], 2)
+
+		self.assertIsNone(unit.run())
+		self.assertEqual(2, self.recorder.most_running)
+		self.assertEqual(["a", "b", "c", "d"], [stats.get_name() for stats in unit.get_results()])
+
+		copy = self.recorder.copies["c"]
+		self.assertIsNot(unit, copy)
+		self.assertEqual("user-c", copy._user)
+		self.assertEqual(str(Path(self._tmpdir.name, "name-c")), copy._targetdir)
+
+	def test_failed_hosts_dont_stop_the_others(self):
+		unit = self.create_unit(["a", "fails", "unreachable", "b"], 4)
+
+		# The errcode of the first failed host
+		self.assertEqual(1, unit.run())
+		self.assertEqual(4, len(self.recorder.copies))
+		self.assertEqual(["a", "b"], [stats.get_name() for stats in unit.get_results()])
+
+	def test_connections_are_kept_per_host(self):
+		unit = self.create_unit(["a", "b"], 2)
+		unit.set_keep_connection(True)
+		unit.run()
+
+		connections = dict(unit._connections)
+		self.assertEqual({"name-a": "a", "name-b": "b"}, {name: c.get_host() for name, c in connections.items()})
+
+		self.assertEqual({"a": None, "b": None}, self.recorder.handed)
+
+		# The next run hands them to the copies again
+		unit.run()
+		self.assertIs(connections["name-a"], self.recorder.handed["a"])
+		self.assertIs(connections["name-b"], unit._connections["name-b"])
+		self.assertFalse(connections["name-a"].closed)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,108 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Lock
+from time import sleep
+import paramiko
+from classes.BackupEntry import BackupEntry, BackupEntryType
+from classes.EntryMatcher import EntryMatcher
+from classes.JobException import JobException
+from classes.LoggerFactory import LoggerFactory
+from classes.ReconnectingTransport import ReconnectingTransport
+from modules.FileBackupUnit import FileBackupUnit
+from tests.fakes import FakeSshConnection
+
+
+class ParallelJobsTest(unittest.TestCase):
+	"""Runs the jobs of a unit with a fake _process_entry, which fails some of them"""
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.connection = FakeSshConnection()
+		self.running = 0
+		self.most_running = 0
+		self.processed = {}
+		self.pools = []
+		self._lock = Lock()
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def create_unit(self, names: list, jobs: int, workers: int=1) -> FileBackupUnit:
+		config = {
+			"options": {
+				"name": "jobs", "host": "host", "user": "user", "password": "p", "targetdir": self._tmpdir.name,
+				"max_parallel_jobs": jobs, "max_workers": workers
+			},
+			"pathes": [{"name": "unused", "type": "dir", "path": "/unused"}]
+		}
+		unit = FileBackupUnit(io.StringIO(json.dumps(config)), False, LoggerFactory("jobs-test"), None, [])
+		unit._connection = ReconnectingTransport(self.connection, backoff=0.0)
+		unit._connection.connect()
+		unit._entries = []
+		for name in names:
+			entry = BackupEntry(BackupEntryType.Dir, name, "", "/" + name, None)
+			entry.set_matcher(EntryMatcher(None, [], None))
+			unit._entries.append(entry)
+		unit._process_entry = self.fake_process_entry(unit)
+		return unit
+
+	def fake_process_entry(self, unit: FileBackupUnit):
+		def process_entry(sftp, entry: BackupEntry, local_targetdir: Path, process_dirs: bool, process_files: bool):
+			with self._lock:
+				self.running += 1
+				self.most_running = max(self.most_running, self.running)
+				self.processed[entry.get_name()] = sftp
+				self.pools.append(unit._job.pool)
+			sleep(0.05)
+			with self._lock:
+				self.running -= 1
+
+			if unit._job.pool is not None:
+				unit._job.pool.submit("fails", self.fail_task)
+			if entry.get_name() == "jobexception":
+				raise JobException(Exception("Failed"), 7)
+			if entry.get_name() == "dropped":
+				unit._connection.get_transport().close()
+				raise paramiko.SSHException("Connection lost")
+		return process_entry
+
+	@staticmethod
+	def fail_task(sftp):
+		raise IOError("Task failed")
+
+	def test_jobs_run_in_parallel_and_failures_dont_stop_the_others(self):
+		unit = self.create_unit(["dropped", "a", "jobexception", "b"], 2)
+		results = unit._run_jobs(None, Path(self._tmpdir.name), True, True)
+
+		self.assertEqual(["dropped", "a", "jobexception", "b"], [stats.get_name() for stats in results])
+		self.assertEqual([113, 0, 7, 0], [stats.get_errcode() for stats in results])
+		self.assertEqual(2, self.most_running)
+		# Every job opened its own sftp-channel
+		self.assertEqual(4, len({id(sftp) for sftp in self.processed.values()}))
+		# A job that started after the drop reconnected, once
+		self.assertEqual(2, len(self.connection.transports))
+
+	def test_sequential_jobs_share_the_sftp_channel(self):
+		unit = self.create_unit(["a", "jobexception", "b"], 1)
+		sftp = unit._connection.open_sftp_client()
+		results = unit._run_jobs(sftp, Path(self._tmpdir.name), True, True)
+
+		self.assertEqual([0, 7, 0], [stats.get_errcode() for stats in results])
+		self.assertEqual(1, self.most_running)
+		self.assertEqual({id(sftp)}, {id(s) for s in self.processed.values()})
+
+	def test_worker_pools_are_closed_after_failed_jobs(self):
+		unit = self.create_unit(["jobexception", "a"], 2, workers=2)
+		results = unit._run_jobs(None, Path(self._tmpdir.name), True, True)
+
+		self.assertEqual([7, 0], [stats.get_errcode() for stats in results])
+		self.assertEqual(2, len(self.pools))
+		for pool in self.pools:
+			self.assertEqual([], pool._workers)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import paramiko
+from classes.JobException import JobException
+from classes.ReconnectingTransport import ReconnectingTransport
+from tests.fakes import FakeSshConnection, FakeTransport
+
+
+class FakeSftpClient:
+	"""The part of paramiko.SFTPClient the tests call, fails like a channel of a dropped transport"""
+
+	def __init__(self, transport: FakeTransport):
+		self.transport = transport
+		self.closed = False
+
+	def stat(self, path: str) -> str:
+		if not self.transport.is_active():
+			raise EOFError()
+		if path == "/missing":
+			raise FileNotFoundError(path)
+		return "{} via {}".format(path, self.transport.number)
+
+	def close(self):
+		self.closed = True
+
+
+class ReconnectingTransportTest(unittest.TestCase):
+
+	def create_transport(self, connection: FakeSshConnection, **kwargs) -> ReconnectingTransport:
+		self.logged = []
+		return ReconnectingTransport(connection, backoff=0.0, log=self.logged.append, keepalive=30, **kwargs)
+
+	def test_reconnect_after_a_drop(self):
+		reconnected = []
+		connection = FakeSshConnection()
+		transport = self.create_transport(connection, on_reconnect=reconnected.append)
+		first = transport.connect()
+		self.assertEqual(1, transport.get_generation())
+
+		first.close()
+		self.assertTrue(transport.is_dropped())
+		second = transport.reconnect(1)
+
+		self.assertIsNot(first, second)
+		self.assertIs(second, transport.get_transport())
+		self.assertEqual(2, transport.get_generation())
+		self.assertEqual(30, second.keepalive)
+		self.assertEqual([second], reconnected)
+		self.assertEqual(1, len(self.logged))
+
+	def test_threads_noticing_the_same_drop_connect_once(self):
+		connection = FakeSshConnection(delay=0.02)
+		transport = self.create_transport(connection)
+		transport.connect().close()
+
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			transports = list(executor.map(lambda _: transport.reconnect(1), range(4)))
+
+		self.assertEqual(2, len(connection.transports))
+		self.assertEqual(1, len({id(t) for t in transports}))
+		self.assertEqual(2, transport.get_generation())
+
+	def test_failed_attempts_back_off_and_give_up(self):
+		connection = FakeSshConnection(failures=2)
+		transport = self.create_transport(connection, attempts=3)
+		transport._transport = FakeTransport(0)
+		transport.get_transport().close()
+
+		self.assertEqual(1, transport.reconnect(0).number)
+		self.assertEqual(3, len(self.logged))
+
+		connection.failures = 3
+		transport.get_transport().close()
+		with self.assertRaises(JobException) as context:
+			transport.reconnect(1)
+		self.assertEqual(113, context.exception.get_errcode())
+
+
+@mock.patch.object(paramiko.SFTPClient, "from_transport", FakeSftpClient)
+class ReconnectingSftpTest(unittest.TestCase):
+
+	def setUp(self):
+		self.connection = FakeSshConnection()
+		self.transport = ReconnectingTransport(self.connection, backoff=0.0)
+		self.transport.connect()
+
+	def test_call_is_repeated_on_the_reconnected_transport(self):
+		sftp = self.transport.open_sftp_client()
+		self.assertEqual("/a via 1", sftp.stat("/a"))
+		client = sftp._client
+
+		self.transport.get_transport().close()
+		self.assertEqual("/a via 2", sftp.stat("/a"))
+		self.assertTrue(client.closed)
+		self.assertEqual(2, len(self.connection.transports))
+
+	def test_client_follows_a_reconnect_of_another_thread(self):
+		sftp = self.transport.open_sftp_client()
+		sftp.stat("/a")
+		self.transport.get_transport().close()
+		self.transport.reconnect(1)
+
+		self.assertEqual("/a via 2", sftp.stat("/a"))
+		self.assertEqual(2, len(self.connection.transports))
+
+	def test_errors_of_an_active_transport_are_raised(self):
+		with self.transport.open_sftp_client() as sftp:
+			with self.assertRaises(FileNotFoundError):
+				sftp.stat("/missing")
+			with self.assertRaises(AttributeError):
+				sftp.no_such_method()
+
+		self.assertEqual(1, len(self.connection.transports))
+
+
+if __name__ == "__main__":
+	unittest.main()
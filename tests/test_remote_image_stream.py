@@ -0,0 +1,89 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.RemoteImageStream import RemoteImageStream, RemoteImageException
+from tests.fakes import FakeExecTransport
+
+
+class RemoteImageStreamTest(unittest.TestCase):
+
+	SIZE_COMMAND = "cat /sys/class/block/$(basename $(readlink -f /dev/sdx))/size"
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		# dd reads a file like a device
+		self.device = Path(self._tmpdir.name, "device")
+		self.data = os.urandom(100000) + bytes(50000)
+		self.device.write_bytes(self.data)
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def test_command(self):
+		self.assertEqual("dd if=/dev/sdx bs=4M status=none", RemoteImageStream(None, "/dev/sdx").build_command())
+		self.assertEqual(
+			"sudo -n dd if='/dev/disk/by-id/my disk' bs=4M status=none | xz -T0 -1 -c",
+			RemoteImageStream(None, "/dev/disk/by-id/my disk", True, "xz").build_command()
+		)
+		self.assertEqual(".zst", RemoteImageStream(None, "/dev/sdx", compress="zst").get_extension())
+		with self.assertRaises(RemoteImageException):
+			RemoteImageStream(None, "/dev/sdx", compress="7z")
+
+	def test_size_in_sectors(self):
+		transport = FakeExecTransport(replies={self.SIZE_COMMAND: (b"7814037168\n", b"", 0)})
+
+		self.assertEqual(7814037168 * 512, RemoteImageStream(transport, "/dev/sdx").get_size())
+		self.assertTrue(transport.channels[0].closed)
+
+	def test_size_of_no_block_device(self):
+		for reply in ((b"", b"cat: /sys/class/block/sdx/size: No such file or directory", 1), (b"abc", b"", 0)):
+			with self.subTest(reply=reply):
+				transport = FakeExecTransport(replies={self.SIZE_COMMAND: reply})
+				with self.assertRaises(RemoteImageException):
+					RemoteImageStream(transport, "/dev/sdx").get_size()
+
+	def test_copy(self):
+		progress = []
+		target = io.BytesIO()
+		stream = RemoteImageStream(FakeExecTransport(), str(self.device), bufsize=65536)
+		stream.copy(target, progress.append)
+
+		self.assertEqual(self.data, target.getvalue())
+		self.assertEqual(len(self.data), stream.get_bytes_received())
+		self.assertEqual(len(self.data), progress[-1])
+
+	def test_copy_compressed_remotely(self):
+		target = io.BytesIO()
+		stream = RemoteImageStream(FakeExecTransport(), str(self.device), compress="gz")
+		stream.copy(target)
+
+		self.assertEqual(self.data, gzip.decompress(target.getvalue()))
+		self.assertLess(stream.get_bytes_received(), len(self.data))
+
+	def test_failed_dd_raises_at_close(self):
+		target = io.BytesIO()
+		with self.assertRaises(RemoteImageException) as context:
+			RemoteImageStream(FakeExecTransport(), str(self.device.with_name("missing"))).copy(target)
+
+		self.assertIn("No such file or directory", str(context.exception))
+
+	def test_abort_closes_without_waiting(self):
+		transport = FakeExecTransport()
+		stream = RemoteImageStream(transport, str(self.device), bufsize=1000).open()
+		stream.read(1000)
+		stream.abort()
+
+		self.assertTrue(transport.channels[0].closed)
+		# Nothing is left to wait for
+		stream.close()
+
+	def test_no_exec_channel(self):
+		with self.assertRaises(RemoteImageException):
+			RemoteImageStream(FakeExecTransport(fail=True), str(self.device)).open()
+
+
+if __name__ == "__main__":
+	unittest.main()
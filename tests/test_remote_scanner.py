@@ -0,0 +1,162 @@
+import io
+import json
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from classes.BackupEntry import BackupEntry, BackupEntryType
+from classes.EntryMatcher import EntryMatcher
+from classes.LoggerFactory import LoggerFactory
+from classes.RemoteScanner import RemoteScanner, RemoteScanException
+from modules.FileBackupUnit import FileBackupUnit
+from tests.fakes import FakeExecTransport
+
+
+class RemoteScannerTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.root = Path(self._tmpdir.name, "root")
+		(self.root / "sub" / "cache").mkdir(parents=True)
+		(self.root / "skip").mkdir()
+		(self.root / "a").write_bytes(b"a")
+		(self.root / "new\nline").write_bytes(b"nl")
+		(self.root / "tab\tname").write_bytes(b"tab")
+		(self.root / "sub" / "cache" / "c").write_bytes(b"c")
+		(self.root / "skip" / "d").write_bytes(b"d")
+		os.symlink("a", str(self.root / "link"))
+		os.utime(str(self.root / "a"), (1500000000.75, 1500000000.75))
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def scan(self, recurse: bool, prune_names: list, prune_paths: list, bufsize: int=65536) -> dict:
+		scanner = RemoteScanner(FakeExecTransport(), bufsize)
+		records = {record.path: record for record in scanner.scan(str(self.root), recurse, prune_names, prune_paths)}
+		self.assertEqual(0, scanner.get_exitstatus())
+		return records
+
+	def test_command(self):
+		printf = "-printf '%y %s %T@ %m %p\\0'"
+		self.assertEqual("find /data " + printf, RemoteScanner.build_command("/data", True, [], []))
+		self.assertEqual(
+			"find '/my data' -maxdepth 1 \\( -type d \\( -name cache -o -name '*.tmp' -o -path '/my data/skip' \\) \\)"
+			" -prune " + printf + " -o " + printf,
+			RemoteScanner.build_command("/my data", False, ["cache", "*.tmp"], ["/my data/skip"])
+		)
+
+	def test_parse_record(self):
+		record = RemoteScanner.parse_record(b"f 12 1500000000.7500000000 644 /data/new\nline\tand tab")
+		self.assertEqual("/data/new\nline\tand tab", record.path)
+		self.assertEqual("new\nline\tand tab", record.attributes.filename)
+		self.assertEqual(12, record.attributes.st_size)
+		self.assertEqual(1500000000, record.attributes.st_mtime)
+		self.assertEqual(stat.S_IFREG | 0o644, record.attributes.st_mode)
+		self.assertFalse(record.is_dir())
+
+		self.assertEqual(stat.S_IFLNK | 0o777, RemoteScanner.parse_record(b"l 1 1.0 777 /data/link").attributes.st_mode)
+		self.assertTrue(RemoteScanner.parse_record(b"d 4096 1.0 755 /data/with space").is_dir())
+		# Names that aren't utf-8 survive the round trip
+		self.assertEqual(b"/data/\xff", os.fsencode(RemoteScanner.parse_record(b"f 0 1.0 644 /data/\xff").path))
+
+	def test_scan_recursive_with_pruning(self):
+		root = str(self.root)
+		# A small buffer splits the records across reads
+		records = self.scan(True, ["cache"], [root + "/sk*"], bufsize=7)
+
+		self.assertEqual(
+			sorted(root + p for p in ["", "/a", "/new\nline", "/tab\tname", "/link", "/sub", "/sub/cache", "/skip"]),
+			sorted(records)
+		)
+		self.assertEqual(1500000000, records[root + "/a"].attributes.st_mtime)
+		self.assertEqual(3, records[root + "/tab\tname"].attributes.st_size)
+		self.assertTrue(stat.S_ISLNK(records[root + "/link"].attributes.st_mode))
+		# Pruned folders are printed, but not descended into
+		self.assertTrue(records[root + "/sub/cache"].is_dir())
+
+	def test_scan_without_recurse(self):
+		root = str(self.root)
+		records = self.scan(False, [], [])
+
+		self.assertIn(root + "/sub", records)
+		self.assertNotIn(root + "/sub/cache", records)
+
+	def test_scan_failures(self):
+		with self.assertRaises(RemoteScanException):
+			list(RemoteScanner(FakeExecTransport(fail=True)).scan(str(self.root), True, [], []))
+
+		scanner = RemoteScanner(FakeExecTransport())
+		with self.assertRaises(RemoteScanException):
+			list(scanner.scan(str(self.root / "missing"), True, [], []))
+		self.assertIn("No such file or directory", scanner.get_stderr())
+
+
+class FakeConnection:
+	"""The part of SshConnection the scan uses"""
+
+	def __init__(self, transport: FakeExecTransport):
+		self._transport = transport
+
+	def get_transport(self) -> FakeExecTransport:
+		return self._transport
+
+	def close(self):
+		pass
+
+
+class FileBackupUnitScanTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.remote = Path(self._tmpdir.name, "remote")
+		self.target = Path(self._tmpdir.name, "target")
+		(self.remote / "sub" / "cache").mkdir(parents=True)
+		(self.remote / "a").write_bytes(b"a")
+		(self.remote / "sub" / "b").write_bytes(b"b")
+		(self.remote / "sub" / "cache" / "c").write_bytes(b"c")
+
+		config = {
+			"options": {"name": "scan", "host": "host", "user": "user", "password": "p", "targetdir": str(self.target)},
+			"pathes": [{"name": "tree", "type": "dir", "path": str(self.remote)}]
+		}
+		self.unit = FileBackupUnit(io.StringIO(json.dumps(config)), False, LoggerFactory("scan-test"), None, [])
+		self.unit._localdirs = set()
+		self.downloaded = []
+		self.unit._download_file = lambda level, sftp, root, localfile, remotefile, entry, attrs: \
+			self.downloaded.append((str(remotefile), str(localfile)))
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def entry(self, options: dict) -> BackupEntry:
+		entry = BackupEntry(BackupEntryType.Dir, "tree", "", str(self.remote), options)
+		entry.set_matcher(EntryMatcher(options, [], None))
+		return entry
+
+	def process(self, transport: FakeExecTransport, options: dict) -> bool:
+		self.unit._connection = FakeConnection(transport)
+		return self.unit._process_directory_scan(None, self.remote, self.remote, self.target, self.entry(options))
+
+	def test_records_are_downloaded_below_their_local_folders(self):
+		self.assertTrue(self.process(FakeExecTransport(), {"recurse": True, "exclude_folders": ["cache"]}))
+
+		local = self.target.joinpath(str(self.remote)[1:])
+		self.assertEqual(
+			sorted([(str(self.remote / "a"), str(local / "a")), (str(self.remote / "sub" / "b"), str(local / "sub" / "b"))]),
+			sorted(self.downloaded)
+		)
+		self.assertTrue((local / "sub").is_dir())
+		self.assertFalse((local / "sub" / "cache").exists())
+
+	def test_falls_back_to_sftp_without_exec(self):
+		self.assertFalse(self.process(FakeExecTransport(fail=True), {"recurse": True}))
+		self.assertEqual([], self.downloaded)
+
+	def test_falls_back_to_sftp_if_find_fails(self):
+		self.remote = self.remote / "missing"
+		self.assertFalse(self.process(FakeExecTransport(), {"recurse": True}))
+
+
+if __name__ == "__main__":
+	unittest.main()
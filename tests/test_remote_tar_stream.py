@@ -0,0 +1,99 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from classes.RemoteTarStream import RemoteTarStream, RemoteTarStreamException
+from tests.fakes import FakeExecTransport
+
+
+class RemoteTarStreamTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.root = Path(self._tmpdir.name, "root")
+		(self.root / "sub" / "cache").mkdir(parents=True)
+		(self.root / "skip").mkdir()
+		(self.root / "a").write_bytes(b"a")
+		(self.root / "sub" / "b").write_bytes(b"bb")
+		(self.root / "sub" / "cache" / "c").write_bytes(b"c")
+		(self.root / "skip" / "d").write_bytes(b"d")
+		# A file named like a pruned folder is kept
+		(self.root / "cache").write_bytes(b"file")
+		os.link(str(self.root / "a"), str(self.root / "sub" / "hardlink"))
+		os.symlink("a", str(self.root / "link"))
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def read(self, tarstream: RemoteTarStream, *args) -> dict:
+		contents = {}
+		for record in tarstream.records(*args):
+			data = io.BytesIO()
+			tarstream.copy_current(data)
+			contents[record.path] = (record.attributes, data.getvalue())
+		return contents
+
+	def test_command(self):
+		self.assertEqual(
+			"find -H /data -mindepth 1 \\( -type d \\( -name cache -o -path '/data/my dir' \\) \\) -prune -o -print0"
+			" | tar --hard-dereference --absolute-names -cf - --null --no-recursion -T -",
+			RemoteTarStream.build_command("/data", True, ["cache"], ["/data/my dir"])
+		)
+		self.assertEqual(
+			"find -H /data -mindepth 1 -maxdepth 1 ! -type d -print0"
+			" | tar --hard-dereference --absolute-names -cf - --null --no-recursion -T -",
+			RemoteTarStream.build_command("/data", False, ["cache"], ["/data/skip"])
+		)
+
+	def test_records_and_data(self):
+		root = str(self.root)
+		tarstream = RemoteTarStream(FakeExecTransport())
+		contents = self.read(tarstream, root, True, ["cache"], [root + "/sk*"])
+
+		self.assertEqual(
+			sorted(root + p for p in ["/a", "/cache", "/link", "/sub", "/sub/b", "/sub/hardlink"]),
+			sorted(contents)
+		)
+		attributes, data = contents[root + "/sub/b"]
+		self.assertEqual(b"bb", data)
+		self.assertEqual("b", attributes.filename)
+		self.assertEqual(2, attributes.st_size)
+		self.assertEqual(int((self.root / "sub" / "b").stat().st_mtime), attributes.st_mtime)
+		self.assertTrue(contents[root + "/sub"][0].st_mode & 0o040000)
+		self.assertEqual(b"file", contents[root + "/cache"][1])
+		# Hardlinks carry their own data
+		self.assertEqual(b"a", contents[root + "/sub/hardlink"][1])
+		self.assertEqual(0o120000, contents[root + "/link"][0].st_mode & 0o170000)
+		self.assertEqual(0, tarstream.get_exitstatus())
+
+	def test_folders_are_left_out_without_recurse(self):
+		root = str(self.root)
+		contents = self.read(RemoteTarStream(FakeExecTransport()), root, False, [], [])
+
+		self.assertEqual(sorted(root + p for p in ["/a", "/cache", "/link"]), sorted(contents))
+
+	def test_records_can_be_skipped(self):
+		root = str(self.root)
+		tarstream = RemoteTarStream(FakeExecTransport(), bufsize=512)
+		paths = [record.path for record in tarstream.records(root, True, [], [])]
+
+		self.assertIn(root + "/skip/d", paths)
+		self.assertEqual(0, tarstream.get_exitstatus())
+
+	def test_missing_root(self):
+		tarstream = RemoteTarStream(FakeExecTransport())
+
+		# find fails, tar writes an empty archive
+		self.assertEqual({}, self.read(tarstream, str(self.root / "missing"), True, [], []))
+		self.assertIn("No such file or directory", tarstream.get_stderr())
+
+	def test_transport_without_exec(self):
+		transport = FakeExecTransport(fail=True)
+
+		with self.assertRaises(RemoteTarStreamException):
+			list(RemoteTarStream(transport).records(str(self.root), True, [], []))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,202 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from time import time
+import paramiko
+from classes.SftpDownloader import SftpDownloader, SftpFileChangedException
+
+
+class FakeRemoteFile:
+	"""The part of paramiko.SFTPFile the downloader uses, served from memory"""
+
+	def __init__(self, sftp: "FakeSftp", remotefile: str):
+		self._sftp = sftp
+		self._data = sftp.files[remotefile][0]
+		self._mtime = sftp.files[remotefile][1]
+		self._position = 0
+		self.MAX_REQUEST_SIZE = 32768
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+	def seek(self, offset: int):
+		self._sftp.seeks.append(offset)
+		self._position = offset
+
+	def prefetch(self, size: int, max_requests: int=None):
+		pass
+
+	def read(self, size: int) -> bytes:
+		if self._sftp.fail_after is not None and self._position >= self._sftp.fail_after:
+			raise IOError("Connection lost")
+		data = self._data[self._position:self._position + size]
+		self._position += len(data)
+		return data
+
+	def stat(self) -> paramiko.SFTPAttributes:
+		attributes = paramiko.SFTPAttributes()
+		attributes.st_size = len(self._data) + self._sftp.grown
+		attributes.st_mtime = self._mtime
+		return attributes
+
+
+class FakeSftp:
+	"""Remote files as (data, mtime) by path, fails reads beyond fail_after and lets stat report grown more bytes"""
+
+	def __init__(self, files: dict):
+		self.files = files
+		self.seeks = []
+		self.fail_after = None
+		self.grown = 0
+
+	def open(self, remotefile: str, mode: str) -> FakeRemoteFile:
+		return FakeRemoteFile(self, remotefile)
+
+
+class SftpDownloaderTest(unittest.TestCase):
+
+	MTIME = 1500000000
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.folder = Path(self._tmpdir.name)
+		self.localfile = self.folder / "file.bin"
+		self.data = os.urandom(100000)
+		self.sftp = FakeSftp({"/remote/file.bin": (self.data, self.MTIME)})
+		self.downloader = SftpDownloader(block_size=4096, checkpoint_interval=16384)
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def download(self, **kwargs):
+		return self.downloader.download(self.sftp, "/remote/file.bin", self.localfile, len(self.data), **kwargs)
+
+	def test_download_replaces_localfile(self):
+		self.localfile.write_bytes(b"old")
+		self.download(mtime=self.MTIME)
+
+		self.assertEqual(self.data, self.localfile.read_bytes())
+		self.assertFalse(SftpDownloader.get_partfile(self.localfile).exists())
+		self.assertFalse(SftpDownloader.get_checkpointfile(self.localfile).exists())
+
+	def test_resume_continues_at_checkpoint(self):
+		self.sftp.fail_after = 50000
+		with self.assertRaises(IOError):
+			self.download(mtime=self.MTIME)
+
+		self.assertFalse(self.localfile.exists())
+		with open(str(SftpDownloader.get_checkpointfile(self.localfile))) as f:
+			checkpoint = json.load(f)
+		self.assertEqual({"size": len(self.data), "mtime": self.MTIME}, {k: checkpoint[k] for k in ("size", "mtime")})
+		offset = self.downloader.get_resume_offset(self.localfile, len(self.data), self.MTIME)
+		self.assertEqual(checkpoint["offset"], offset)
+		self.assertTrue(16384 <= offset <= 50000)
+
+		self.sftp.fail_after = None
+		self.sftp.seeks = []
+		self.download(mtime=self.MTIME)
+
+		self.assertEqual([offset], self.sftp.seeks)
+		self.assertEqual(self.data, self.localfile.read_bytes())
+		self.assertFalse(SftpDownloader.get_checkpointfile(self.localfile).exists())
+
+	def test_checkpoint_of_changed_file_is_ignored(self):
+		self.sftp.fail_after = 50000
+		with self.assertRaises(IOError):
+			self.download(mtime=self.MTIME)
+
+		self.assertEqual(0, self.downloader.get_resume_offset(self.localfile, len(self.data), self.MTIME + 1))
+		self.assertEqual(0, self.downloader.get_resume_offset(self.localfile, len(self.data) + 1, self.MTIME))
+
+	def test_unreadable_checkpoint_is_ignored(self):
+		SftpDownloader.get_partfile(self.localfile).write_bytes(self.data[:20000])
+		SftpDownloader.get_checkpointfile(self.localfile).write_text("{")
+
+		self.assertEqual(0, self.downloader.get_resume_offset(self.localfile, len(self.data), self.MTIME))
+
+	def test_failure_without_mtime_discards_part(self):
+		self.sftp.fail_after = 50000
+		with self.assertRaises(IOError):
+			self.download()
+
+		self.assertFalse(SftpDownloader.get_partfile(self.localfile).exists())
+		self.assertFalse(SftpDownloader.get_checkpointfile(self.localfile).exists())
+
+	def test_grown_file_is_not_complete(self):
+		self.localfile.write_bytes(b"old")
+		self.sftp.grown = 10
+
+		with self.assertRaises(SftpFileChangedException) as context:
+			self.download(mtime=self.MTIME)
+
+		self.assertEqual(len(self.data) + 10, context.exception.get_attributes().st_size)
+		self.assertEqual(b"old", self.localfile.read_bytes())
+		self.assertFalse(SftpDownloader.get_partfile(self.localfile).exists())
+		self.assertFalse(SftpDownloader.get_checkpointfile(self.localfile).exists())
+
+	def test_shrunk_file_is_not_complete(self):
+		with self.assertRaises(SftpFileChangedException):
+			self.downloader.download(self.sftp, "/remote/file.bin", self.localfile, len(self.data) + 10, mtime=self.MTIME)
+
+		self.assertFalse(self.localfile.exists())
+
+	def test_failed_verify_discards_part(self):
+		def verify(partfile: Path):
+			raise IOError("Hash of '{}' doesn't match".format(partfile))
+
+		with self.assertRaises(IOError):
+			self.download(mtime=self.MTIME, verify=verify)
+
+		self.assertFalse(self.localfile.exists())
+		self.assertFalse(SftpDownloader.get_partfile(self.localfile).exists())
+
+	def test_remove_stale_parts(self):
+		subfolder = self.folder / "sub"
+		subfolder.mkdir()
+		old = time() - 8 * 86400
+		stale = [
+			SftpDownloader.get_partfile(subfolder / "a"),
+			SftpDownloader.get_checkpointfile(subfolder / "a"),
+			Path(str(SftpDownloader.get_checkpointfile(self.folder / "b")) + ".tmp")
+		]
+		kept = [SftpDownloader.get_partfile(subfolder / "c"), self.folder / "d.bin"]
+
+		for path in stale + kept:
+			path.write_bytes(b"x")
+		for path in stale + [self.folder / "d.bin"]:
+			os.utime(str(path), (old, old))
+
+		downloader = SftpDownloader(part_max_age=7 * 86400)
+		self.assertEqual(3, downloader.remove_stale_parts([self.folder, subfolder, self.folder / "missing"]))
+		self.assertEqual([], [path for path in stale if path.exists()])
+		self.assertEqual(kept, [path for path in kept if path.exists()])
+
+	def test_backed_up_files_named_like_parts_are_kept(self):
+		old = time() - 8 * 86400
+		files = [self.folder / "video.part", self.folder / "x.part.json", self.folder / "y.part.json.tmp"]
+		for path in files:
+			path.write_bytes(b"x")
+			os.utime(str(path), (old, old))
+
+		self.assertEqual(0, SftpDownloader(part_max_age=7 * 86400).remove_stale_parts([self.folder]))
+		self.assertEqual(files, [path for path in files if path.exists()])
+
+	def test_only_the_given_folders_are_swept(self):
+		subfolder = self.folder / "sub"
+		subfolder.mkdir()
+		part = SftpDownloader.get_partfile(subfolder / "a")
+		part.write_bytes(b"x")
+		old = time() - 8 * 86400
+		os.utime(str(part), (old, old))
+
+		self.assertEqual(0, SftpDownloader(part_max_age=7 * 86400).remove_stale_parts([self.folder]))
+		self.assertTrue(part.exists())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from threading import Event, Lock, current_thread
+from time import sleep
+from classes.SftpWorkerPool import SftpWorkerPool
+
+
+class FakeSftpTransport:
+	"""Opens a client per call of open_sftp_client, the first failures opens raise"""
+
+	def __init__(self, failures: int=0):
+		self.failures = failures
+		self.clients = []
+		self._lock = Lock()
+
+	def open_sftp_client(self) -> "FakeSftpTransport.Client":
+		with self._lock:
+			if self.failures > 0:
+				self.failures -= 1
+				raise OSError("Channel refused")
+			client = FakeSftpTransport.Client()
+			self.clients.append(client)
+			return client
+
+	class Client:
+		closed = False
+
+		def close(self):
+			self.closed = True
+
+
+class SftpWorkerPoolTest(unittest.TestCase):
+
+	def test_tasks_run_on_a_client_per_worker(self):
+		transport = FakeSftpTransport()
+		done = []
+		lock = Lock()
+
+		def task(sftp, number: int):
+			sleep(0.01)
+			with lock:
+				done.append((number, sftp, current_thread().name))
+
+		with SftpWorkerPool(transport, 3) as pool:
+			for number in range(12):
+				pool.submit(str(number), task, number)
+			self.assertEqual([], pool.wait())
+
+		self.assertEqual(list(range(12)), sorted(number for number, _, _ in done))
+		self.assertEqual(3, len({name for _, _, name in done}))
+		self.assertEqual(3, len(transport.clients))
+		# Every worker sticks to its client and closes it at the end
+		self.assertEqual(3, len({(id(sftp), name) for _, sftp, name in done}))
+		self.assertTrue(all(client.closed for client in transport.clients))
+
+	def test_failed_tasks_are_collected_and_the_others_run(self):
+		def task(sftp, number: int):
+			if number % 2 == 1:
+				raise IOError("Failed {}".format(number))
+
+		with SftpWorkerPool(FakeSftpTransport(failures=1), 2) as pool:
+			for number in range(6):
+				pool.submit("task {}".format(number), task, number)
+			errors = pool.wait()
+
+			# The task whose channel couldn't be opened failed, the next one opens it again
+			self.assertEqual(4, len(errors))
+			self.assertEqual(3, len([e for _, e in errors if str(e).startswith("Failed")]))
+			self.assertEqual([], pool.wait())
+
+			pool.submit("after", task, 0)
+			self.assertEqual([], pool.wait())
+
+	def test_close_stops_the_workers_while_tasks_block(self):
+		release = Event()
+		pool = SftpWorkerPool(FakeSftpTransport(), 2, queue_factor=1)
+		pool.start()
+		workers = list(pool._workers)
+
+		for number in range(4):
+			pool.submit(str(number), lambda sftp: release.wait(5))
+		self.assertTrue(pool._queue.full())
+
+		release.set()
+		pool.close()
+		self.assertFalse(any(worker.is_alive() for worker in workers))
+		with self.assertRaises(Exception):
+			pool.submit("closed", lambda sftp: None)
+
+	def test_invalid_pools(self):
+		with self.assertRaises(Exception):
+			SftpWorkerPool(None, 1)
+		with self.assertRaises(Exception):
+			SftpWorkerPool(FakeSftpTransport(), 0)
+		with self.assertRaises(Exception):
+			SftpWorkerPool(FakeSftpTransport(), 1).submit("not started", lambda sftp: None)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from classes.Snapshots import SnapshotException, Snapshots
+
+
+class SnapshotsTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tmpdir = tempfile.TemporaryDirectory()
+		self.root = Path(self._tmpdir.name, "target")
+
+	def tearDown(self):
+		self._tmpdir.cleanup()
+
+	def test_first_snapshot(self):
+		snapshots = Snapshots(self.root)
+		current = snapshots.begin(datetime(2020, 1, 2, 3, 4, 5))
+
+		self.assertEqual(self.root / "2020-01-02_030405.incomplete", current)
+		self.assertTrue(current.is_dir())
+		self.assertIsNone(snapshots.get_previous())
+		self.assertEqual([], snapshots.list())
+		self.assertFalse(snapshots.link(current / "a"))
+
+		finished = snapshots.finish()
+		self.assertEqual(self.root / "2020-01-02_030405", finished)
+		self.assertFalse(current.exists())
+		self.assertEqual("2020-01-02_030405", os.readlink(str(self.root / Snapshots.LATEST)))
+		self.assertEqual([finished], snapshots.list())
+
+	def test_unchanged_files_are_linked_to_the_previous_snapshot(self):
+		first = Snapshots(self.root)
+		(first.begin(datetime(2020, 1, 1)) / "sub").mkdir()
+		(first.get_current() / "sub" / "a").write_bytes(b"a")
+		previous = first.finish()
+
+		second = Snapshots(self.root)
+		current = second.begin(datetime(2020, 1, 2))
+		(current / "sub").mkdir()
+		localfile = current / "sub" / "a"
+		localfile.write_bytes(b"stale")
+
+		self.assertEqual(previous, second.get_previous())
+		self.assertEqual(previous / "sub" / "a", second.get_previous_file(localfile))
+		self.assertTrue(second.link(localfile))
+		self.assertEqual(os.stat(str(previous / "sub" / "a")).st_ino, localfile.stat().st_ino)
+		self.assertFalse(second.link(current / "sub" / "missing"))
+
+		second.finish()
+		self.assertEqual("2020-01-02_000000", os.readlink(str(self.root / Snapshots.LATEST)))
+		self.assertEqual(b"a", (self.root / Snapshots.LATEST / "sub" / "a").read_bytes())
+
+	def test_incomplete_snapshot_is_no_predecessor(self):
+		first = Snapshots(self.root)
+		first.begin(datetime(2020, 1, 1))
+		finished = first.finish()
+		Snapshots(self.root).begin(datetime(2020, 1, 2))
+
+		third = Snapshots(self.root)
+		third.begin(datetime(2020, 1, 3))
+		self.assertEqual(finished, third.get_previous())
+
+	def test_incomplete_snapshots_of_failed_runs_are_removed(self):
+		first = Snapshots(self.root)
+		(first.begin(datetime(2020, 1, 1)) / "a").write_bytes(b"a")
+		finished = first.finish()
+
+		failed = Snapshots(self.root)
+		current = failed.begin(datetime(2020, 1, 2))
+		self.assertTrue(failed.link(current / "a"))
+		# Not a snapshot, kept
+		(self.root / "other.incomplete").mkdir()
+
+		third = Snapshots(self.root)
+		self.assertEqual([current], third.list_incomplete())
+		self.assertEqual([current], third.remove_incomplete())
+		self.assertFalse(current.exists())
+		self.assertTrue((self.root / "other.incomplete").exists())
+		self.assertEqual(b"a", (finished / "a").read_bytes())
+
+		own = third.begin(datetime(2020, 1, 3))
+		self.assertEqual([], third.remove_incomplete())
+		self.assertTrue(own.exists())
+
+	def test_same_stamp_gets_a_suffix(self):
+		now = datetime(2020, 1, 1)
+		first = Snapshots(self.root)
+		first.begin(now)
+		first.finish()
+
+		second = Snapshots(self.root)
+		self.assertEqual(self.root / "2020-01-01_000000-1.incomplete", second.begin(now))
+		second.finish()
+
+		self.assertEqual(
+			["2020-01-01_000000", "2020-01-01_000000-1"],
+			[p.name for p in Snapshots(self.root).list()]
+		)
+
+	def test_begin_without_creating(self):
+		snapshots = Snapshots(self.root)
+		current = snapshots.begin(datetime(2020, 1, 1), create=False)
+
+		self.assertFalse(current.exists())
+
+	def test_finish_without_begin(self):
+		with self.assertRaises(SnapshotException):
+			Snapshots(self.root).finish()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+from pathlib import Path
+from classes.TransferHistory import TransferHistory
+
+
+class TransferHistoryTest(unittest.TestCase):
+
+	def test_fit_recovers_both_rates(self):
+		per_file, per_byte = 0.01, 1e-7
+		runs = [[f, b, f * per_file + b * per_byte] for f, b in ((100, 10 ** 6), (10, 10 ** 8), (1000, 10 ** 7))]
+
+		fitted = TransferHistory.fit(runs)
+		self.assertAlmostEqual(per_file, fitted[0])
+		self.assertAlmostEqual(per_byte, fitted[1])
+
+	def test_fit_of_runs_with_the_same_bytes_per_file(self):
+		# Files and bytes can't be told apart, the bytes explain the seconds
+		per_file, per_byte = TransferHistory.fit([[10, 1000, 2.0], [20, 2000, 4.0]])
+		self.assertEqual(0.0, per_file)
+		self.assertAlmostEqual(0.002, per_byte)
+
+	def test_fit_without_bytes(self):
+		per_file, per_byte = TransferHistory.fit([[10, 0, 1.0], [20, 0, 2.0]])
+		self.assertAlmostEqual(0.1, per_file)
+		self.assertEqual(0.0, per_byte)
+
+	def test_fit_never_returns_negative_rates(self):
+		# More bytes took less time, only the files explain it
+		per_file, per_byte = TransferHistory.fit([[10, 10 ** 6, 10.0], [20, 10, 20.0], [5, 10 ** 7, 1.0]])
+		self.assertGreaterEqual(per_file, 0)
+		self.assertEqual(0.0, per_byte)
+
+	def test_fit_without_runs(self):
+		self.assertIsNone(TransferHistory.fit([]))
+
+	def test_estimate_falls_back_to_all_jobs(self):
+		history = TransferHistory(Path("unused"))
+		self.assertIsNone(history.estimate("a", 10, 1000))
+
+		history.add("a", 10, 0, 1.0)
+		history.add("b", 0, 10 ** 6, 100.0)
+
+		self.assertAlmostEqual(2.0, history.estimate("a", 20, 0))
+		self.assertAlmostEqual(2.0, history.estimate("new", 20, 0))
+		self.assertEqual(1, len(history))
+
+	def test_only_the_last_runs_are_kept(self):
+		history = TransferHistory(Path("unused"))
+		for seconds in range(TransferHistory.MAX_RUNS + 5):
+			history.add("a", 1, 0, float(seconds))
+
+		self.assertEqual(TransferHistory.MAX_RUNS, len(history))
+		self.assertAlmostEqual(sum(range(5, TransferHistory.MAX_RUNS + 5)) / TransferHistory.MAX_RUNS, history.estimate("a", 1, 0))
+
+	def test_history_survives_save_and_load(self):
+		with tempfile.TemporaryDirectory() as tmpdir:
+			filepath = Path(tmpdir, "state", "history.json")
+			history = TransferHistory(filepath)
+			history.load()
+			history.add("a", 10, 1000, 1.5)
+			history.save()
+
+			loaded = TransferHistory(filepath)
+			loaded.load()
+			self.assertEqual(1, len(loaded))
+			self.assertEqual(history.estimate("a", 5, 500), loaded.estimate("a", 5, 500))
+
+
+if __name__ == "__main__":
+	unittest.main()
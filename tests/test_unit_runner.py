@@ -0,0 +1,133 @@
+import io
+import json
+import logging
+import unittest
+from threading import Lock
+from time import sleep
+from classes.ConnectionPool import ConnectionPool
+from classes.LoggerFactory import LoggerFactory
+from classes.UnitRunner import UnitRunner
+from classes.WorkerBudget import WorkerBudget
+from modules.FileBackupUnit import FileBackupUnit
+
+
+class FakeUnit:
+	"""The part of a Unit that UnitRunner uses, records its grant and how many units ran at once"""
+
+	running = 0
+	most_running = 0
+	lock = Lock()
+
+	def __init__(self, name: str, demand, errcode: int=None, fail: bool=False):
+		self.name = name
+		self.demand = demand
+		self.errcode = errcode
+		self.fail = fail
+		self.grant = None
+		self.flushed = False
+
+	def set_connection_pool(self, pool: ConnectionPool):
+		pass
+
+	def get_name(self) -> str:
+		return self.name
+
+	def get_worker_demand(self):
+		return self.demand
+
+	def set_worker_grant(self, cpu: int, network: int):
+		self.grant = (cpu, network)
+
+	def get_transferred_bytes(self) -> int:
+		return 0
+
+	def flush_logs(self):
+		self.flushed = True
+
+	def run(self):
+		with FakeUnit.lock:
+			FakeUnit.running += 1
+			FakeUnit.most_running = max(FakeUnit.most_running, FakeUnit.running)
+		sleep(0.02)
+		with FakeUnit.lock:
+			FakeUnit.running -= 1
+		if self.fail:
+			raise Exception("Failed")
+		return self.errcode
+
+
+class UnitRunnerTest(unittest.TestCase):
+
+	def setUp(self):
+		FakeUnit.running = 0
+		FakeUnit.most_running = 0
+
+	def run_units(self, units, cpu: int, network: int):
+		log = logging.getLogger("unit-runner-test")
+		log.addHandler(logging.NullHandler())
+		log.propagate = False
+		return UnitRunner(units, WorkerBudget(cpu, network), ConnectionPool(), log)
+
+	def test_units_get_their_clamped_grant(self):
+		units = [FakeUnit("small", (1, 2)), FakeUnit("large", (8, 16))]
+		runner = self.run_units(units, 2, 4)
+
+		self.assertIsNone(runner.run())
+		self.assertEqual((1, 2), units[0].grant)
+		self.assertEqual((2, 4), units[1].grant)
+		# The large one needs the whole budget
+		self.assertEqual(1, FakeUnit.most_running)
+		self.assertTrue(all(unit.flushed for unit in units))
+
+	def test_units_that_fit_run_at_once(self):
+		units = [FakeUnit(str(i), (1, 1)) for i in range(3)]
+		self.run_units(units, 3, 3).run()
+
+		self.assertEqual(3, FakeUnit.most_running)
+
+	def test_failed_units_dont_stop_the_others(self):
+		units = [FakeUnit("fails", (1, 1), fail=True), FakeUnit("errcode", (1, 1), 7), FakeUnit("ok", (1, 1))]
+		runner = self.run_units(units, 1, 1)
+
+		self.assertEqual(1, runner.run())
+		self.assertEqual([1, 7, 0], [result.errcode for result in runner.get_results()])
+		self.assertEqual(["fails", "errcode", "ok"], [result.name for result in runner.get_results()])
+
+
+class FileBackupUnitGrantTest(unittest.TestCase):
+
+	@staticmethod
+	def create_unit(options: dict, pathes: int) -> FileBackupUnit:
+		config = {
+			"options": dict({"name": "grant", "host": "host", "user": "user", "password": "p", "targetdir": "/tmp/grant"}, **options),
+			"pathes": [{"name": str(i), "type": "dir", "path": "/data/{}".format(i)} for i in range(pathes)]
+		}
+		return FileBackupUnit(io.StringIO(json.dumps(config)), False, LoggerFactory("grant-test"), None, [])
+
+	def test_grant_limits_the_workers(self):
+		unit = self.create_unit({"max_workers": 8, "max_parallel_jobs": 2}, 3)
+		self.assertEqual((1, 16), unit.get_worker_demand())
+
+		unit.set_worker_grant(1, 5)
+		self.assertEqual((1, 4), unit.get_worker_demand())
+
+		unit.set_worker_grant(1, 1)
+		self.assertEqual((1, 1), unit.get_worker_demand())
+
+	def test_sufficient_grant_changes_nothing(self):
+		unit = self.create_unit({"max_workers": 4}, 1)
+		unit.set_worker_grant(1, 8)
+
+		self.assertEqual((1, 4), unit.get_worker_demand())
+
+	def test_grant_is_spread_over_the_hosts_first(self):
+		hosts = [{"name": str(i), "host": "host{}".format(i), "user": "user", "password": "p"} for i in range(4)]
+		unit = self.create_unit({"hosts": hosts, "max_parallel_hosts": 4, "max_workers": 4}, 1)
+		self.assertEqual((1, 16), unit.get_worker_demand())
+
+		unit.set_worker_grant(1, 2)
+		self.assertEqual((1, 2), unit.get_worker_demand())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,70 @@
+import threading
+import unittest
+from time import sleep
+from classes.WorkerBudget import WorkerBudget
+
+
+class WorkerBudgetTest(unittest.TestCase):
+
+	def test_reservations_are_granted_in_the_order_of_the_tickets(self):
+		budget = WorkerBudget(1, 1)
+		tickets = [budget.enqueue() for _ in range(5)]
+		order = []
+
+		def run(index: int):
+			with budget.reserve(1, 1, tickets[index]):
+				order.append(index)
+				sleep(0.01)
+
+		# The threads start in the reverse order of the tickets
+		threads = [threading.Thread(target=run, args=(index,)) for index in reversed(range(5))]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual([0, 1, 2, 3, 4], order)
+
+	def test_small_reservation_waits_for_an_earlier_large_one(self):
+		budget = WorkerBudget(4, 4)
+		first = budget.acquire(3, 3)
+		large = budget.enqueue()
+		small = budget.enqueue()
+		granted = []
+
+		def run(name: str, ticket: object, slots: int):
+			with budget.reserve(slots, slots, ticket):
+				granted.append(name)
+
+		threads = [
+			threading.Thread(target=run, args=("small", small, 1)),
+			threading.Thread(target=run, args=("large", large, 4))
+		]
+		for thread in threads:
+			thread.start()
+		sleep(0.05)
+		# One slot would be free for the small one, but the large one is first
+		self.assertEqual([], granted)
+
+		budget.release(*first)
+		for thread in threads:
+			thread.join()
+		self.assertEqual(["large", "small"], granted)
+
+	def test_demand_beyond_the_budget_is_clamped(self):
+		budget = WorkerBudget(2, 3)
+
+		self.assertEqual((2, 3), budget.clamp(8, 16))
+		self.assertEqual((0, 1), budget.clamp(-1, 1))
+		with budget.reserve(8, 16) as reserved:
+			self.assertEqual((2, 3), reserved)
+		# Everything was released again
+		self.assertEqual((2, 3), budget.acquire(2, 3))
+
+	def test_budget_needs_slots(self):
+		with self.assertRaises(Exception):
+			WorkerBudget(0, 1)
+
+
+if __name__ == "__main__":
+	unittest.main()